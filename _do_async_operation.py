@@ -0,0 +1,439 @@
+import asyncio
+import functools
+from time import perf_counter
+
+from _do_operation import (
+    all_method,
+    api_request,
+    Contentd,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_PAGE_SIZE,
+    Libcdn,
+    multicall_method,
+    MULTICALL_METHOD,
+    Onevsh,
+    page_rows,
+    response_status,
+    RestClient,
+    revalidation_headers,
+    RPC_READ_METHODS,
+    RpcBatch,
+    RpcClient,
+    RpcRequest,
+    setup_logging,
+    traced,
+)
+from macro_dag import (
+    DEFAULT_MACRO_WORKERS,
+    MacroRun,
+)
+from metrics import (
+    AUTHORIZED,
+    ERROR,
+)
+from payload_codec import LazyPayload
+from response_cache import request_key
+from retry import async_call_with_retry
+
+# emulated network round trip of the async mock, in seconds
+MOCK_LATENCY = 0
+
+
+async def async_all_method(method, auth, data, name, url):
+    """emulate a non blocking rest or rpc request on url"""
+    await asyncio.sleep(MOCK_LATENCY)
+    return all_method(method, auth, data, name, url)
+
+
+def async_rest_wrapper(method):
+    async def wrapped(auth, data, name, url, headers=None):
+        return await async_all_method(method, auth, data, name, url)
+    return wrapped
+
+
+def async_rpc_wrapper(method, name, url):
+    async def wrapped(auth, data, headers=None):
+        return await async_all_method(method, auth, data, name, url)
+    return wrapped
+
+
+def async_multicall_wrapper(name, url):
+    async def wrapped(auth, calls, headers=None):
+        await asyncio.sleep(MOCK_LATENCY)
+        return multicall_method(auth, calls, name, url)
+    return wrapped
+
+
+async def gather(*calls, return_exceptions=False):
+    """
+    run backend calls concurrently and return their results in call order
+    the total latency is the max() and not the sum() of the calls latencies
+    use:
+        prefix, nodes = await gather(
+            libcdn.get_cdn_prefix(cdn_prefix_id=5),
+            libcdn.listall_node_names(2),
+        )
+    """
+    return list(await asyncio.gather(*calls, return_exceptions=return_exceptions))
+
+
+class AsyncRestRequest():
+    """
+    this is our mock of an asyncio http library (aiohttp like)
+    use:
+        response = await AsyncRestRequest.<method>(auth, data, name, url)
+        <method> in ('get', 'post', 'put', 'delete')
+    same class methods as RestRequest, but coroutines
+    """
+    def __new__(cls, *methods):
+        for method in methods:
+            setattr(
+                cls,
+                method,
+                staticmethod(async_rest_wrapper(method))
+            )
+        return cls
+
+    get = staticmethod(async_rest_wrapper('get'))
+    post = staticmethod(async_rest_wrapper('post'))
+    put = staticmethod(async_rest_wrapper('put'))
+    delete = staticmethod(async_rest_wrapper('delete'))
+
+
+class AsyncRestClient(RestClient):
+    """
+    RestClient on the non blocking AsyncRestRequest transport
+    _do_operation is a coroutine, so every @api_request endpoint must be awaited:
+        response = await client.get_cdn_prefix(cdn_prefix_id=5)
+    gets are served from an optional ResponseCache, and the concurrent
+    identical ones coalesced by an optional AsyncSingleFlight
+    """
+    rest_transport = AsyncRestRequest
+    call_with_retry = staticmethod(async_call_with_retry)
+
+    async def _do_operation(self, method_name, api_path, **kwargs):
+        start = perf_counter() if self.metrics is not None else None
+        span = self._start_span(method_name, api_path) if self.tracer is not None else None
+        try:
+            auth, data, endpoint = self._prepare_operation(api_path, **kwargs)
+            if span is not None:
+                span.set_attribute('http.url', endpoint)
+            # _send returns the transport coroutine
+            if self.cache is None and self.single_flight is None:
+                response = await self._send(method_name, auth, data, endpoint)
+            elif method_name == 'get':
+                response = await self._read(api_path, auth, data, endpoint)
+            else:
+                response = await self._send(method_name, auth, data, endpoint)
+                if self.cache is not None and response_status(response) == AUTHORIZED:
+                    self.cache.invalidate((self.client_name, endpoint))
+        except Exception as e:
+            if start is not None:
+                self._observe_operation(method_name, api_path, ERROR, start)
+            if span is not None:
+                span.end(e)
+            raise
+        if start is not None:
+            self._observe_operation(method_name, api_path, response_status(response), start)
+        if span is not None:
+            span.set_attribute('status', response_status(response))
+            span.end()
+        self._log_operation(method_name, api_path, kwargs, response)
+        if self.decode_responses:
+            return LazyPayload(response, self.codec)
+        return response
+
+    async def _read(self, api_path, auth, data, endpoint):
+        """
+        same as RestClient._read but a coroutine
+        """
+        key = request_key(self.client_name, endpoint, auth, data)
+        entry = generation = None
+        if self.cache is not None:
+            generation = self.cache.generation()
+            entry, fresh = self.cache.lookup(key)
+            if fresh:
+                return entry.value
+        if self.single_flight is None:
+            return await self._fetch(key, entry, generation, api_path, auth, data, endpoint)
+        return await self.single_flight.do(
+            (key, generation), self._fetch, key, entry, generation, api_path, auth, data, endpoint
+        )
+
+    async def _fetch(self, key, entry, generation, api_path, auth, data, endpoint):
+        """
+        same as RestClient._fetch but a coroutine
+        """
+        response = await self._send('get', auth, data, endpoint, revalidation_headers(entry))
+        return self._keep(key, entry, generation, api_path, endpoint, response)
+
+
+class AsyncRpcRequest(RpcRequest):
+    """
+    this is our mock of an asyncio xmlrpc library
+    use:
+        onev = AsyncRpcRequest(name, url)
+        await onev.<method>(auth, data)
+        await onev.multicall(auth, [(<method>, data), ...])
+    """
+    def build_methods(self):
+        for method in self.methods:
+            setattr(
+                self,
+                method,
+                async_rpc_wrapper(method, self.name, self.url)
+            )
+        self.multicall = async_multicall_wrapper(self.name, self.url)
+
+
+class AsyncRpcClient(RpcClient):
+    """
+    RpcClient on the non blocking AsyncRpcRequest transport
+    the xmlrpc methods built from RPC_ENDPOINTS return coroutines:
+        result = await client.ListAll(data=data)
+    RPC_READ_METHODS calls are served from an optional ResponseCache, and the
+    concurrent identical ones coalesced by an optional AsyncSingleFlight
+    """
+    rpc_transport = AsyncRpcRequest
+    call_with_retry = staticmethod(async_call_with_retry)
+
+    async def _do_rpc_operation(self, item, *args, **kwargs):
+        """
+        same as RpcClient._do_rpc_operation but a coroutine
+        """
+        auth = kwargs.pop("auth") if "auth" in kwargs else self._default_auth()
+        if self.rpc_schemas is not None:
+            args = self.rpc_schemas.encode_call(item, args, kwargs)
+        api_name, method = self._rpc_method(item)
+        start = perf_counter() if self.metrics is not None else None
+        span = self._start_rpc_span(api_name, item) if self.tracer is not None else None
+        try:
+            # _call_rpc returns the transport coroutine
+            if self.cache is None and self.single_flight is None:
+                result = await self._call_rpc(api_name, item in RPC_READ_METHODS, method, auth, args, kwargs)
+            elif item in RPC_READ_METHODS:
+                result = await self._rpc_read(api_name, item, method, auth, args, kwargs)
+            else:
+                result = await self._call_rpc(api_name, False, method, auth, args, kwargs)
+                if self.cache is not None and response_status(result) == AUTHORIZED:
+                    self.cache.invalidate(api_name)
+        except Exception as e:
+            if start is not None:
+                self.metrics.observe(api_name, item, ERROR, perf_counter() - start)
+            if span is not None:
+                span.end(e)
+            raise
+        if start is not None:
+            self.metrics.observe(api_name, item, response_status(result), perf_counter() - start)
+        if span is not None:
+            span.set_attribute('status', response_status(result))
+            span.end()
+        self._log_rpc_operation(api_name, item, auth, kwargs, result)
+        return result
+
+    async def _rpc_read(self, api_name, item, method, auth, args, kwargs):
+        """
+        same as RpcClient._rpc_read but a coroutine
+        """
+        key = request_key(api_name, item, auth, args, kwargs)
+        generation = None
+        if self.cache is not None:
+            generation = self.cache.generation()
+            entry, fresh = self.cache.lookup(key)
+            if fresh:
+                return entry.value
+
+        async def fetch():
+            result = await self._call_rpc(api_name, True, method, auth, args, kwargs)
+            if self.cache is not None:
+                self.cache.store(key, result, item, api_name, generation=generation)
+            return result
+
+        if self.single_flight is None:
+            return await fetch()
+        return await self.single_flight.do((key, generation), fetch)
+
+    async def _do_rpc_multicall(self, api_name, calls, **kwargs):
+        """
+        same as RpcClient._do_rpc_multicall but a coroutine
+        """
+        auth = kwargs["auth"] if "auth" in kwargs else self._default_auth()
+        reads_only = all(method in RPC_READ_METHODS for method, _ in calls)
+        start = perf_counter() if self.metrics is not None else None
+        span = self._start_rpc_span(api_name, MULTICALL_METHOD) if self.tracer is not None else None
+        try:
+            results = await self._call_rpc(api_name, reads_only, getattr(self, api_name).multicall, auth, (calls,), {})
+        except Exception as e:
+            if start is not None:
+                self.metrics.observe(api_name, MULTICALL_METHOD, ERROR, perf_counter() - start)
+            if span is not None:
+                span.end(e)
+            raise
+        if start is not None:
+            self.metrics.observe(api_name, MULTICALL_METHOD, response_status(results), perf_counter() - start)
+        if span is not None:
+            span.set_attribute('rpc.calls', len(calls))
+            span.set_attribute('status', response_status(results))
+            span.end()
+        if self.cache is not None and not reads_only and response_status(results) == AUTHORIZED:
+            self.cache.invalidate(api_name)
+        self._log_rpc_operation(api_name, MULTICALL_METHOD, auth, {'calls': calls}, results)
+        return results
+
+    def batch(self, max_batch_size=DEFAULT_BATCH_SIZE, auth=None):
+        """
+        :param auth: auth of all the multicalls, default the _do_rpc_multicall one
+        :return: AsyncRpcBatch queuing this client xmlrpc calls
+        """
+        return AsyncRpcBatch(self, max_batch_size, auth)
+
+    async def iter_rpc(self, item, data, page_size=DEFAULT_PAGE_SIZE, prefetch=True):
+        """
+        RpcClient.iter_rpc as an async generator:
+            async for row in client.iter_rpc('ListAll', data):
+        :param prefetch: fetch the next page in a task while the current one is consumed
+        """
+        fetch = self._page_fetcher(item, data, page_size)
+        next_page = None
+        try:
+            position = {'offset': 0}
+            page = await fetch(position)
+            while True:
+                rows, position = page_rows(page, position, page_size)
+                page = None
+                if position is not None and prefetch:
+                    next_page = asyncio.ensure_future(fetch(position))
+                for row in rows:
+                    yield row
+                rows = None
+                if position is None:
+                    return
+                if next_page is not None:
+                    page, next_page = await next_page, None
+                else:
+                    page = await fetch(position)
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+
+class AsyncRpcBatch(RpcBatch):
+    """
+    RpcBatch of an AsyncRpcClient
+    use:
+        async with client.batch(max_batch_size=100) as batch:
+            future = batch.ListAll(data=data)
+            ...
+        future.result()
+    the queues are sent on exit or by await flush(), as multicall requests of
+    at most max_batch_size calls, all sent concurrently
+    """
+    flush_when_full = False
+
+    async def flush(self, *api_names):
+        requests = []
+        for api_name in api_names or list(self.queues):
+            queue = self.queues[api_name]
+            self.queues[api_name] = []
+            for first in range(0, len(queue), self.max_batch_size):
+                requests.append(self._send(api_name, queue[first:first + self.max_batch_size]))
+        self.request_count += len(requests)
+        for outcome in await asyncio.gather(*requests, return_exceptions=True):
+            if isinstance(outcome, BaseException):
+                raise outcome
+
+    async def _send(self, api_name, queue):
+        try:
+            results = await self.client._do_rpc_multicall(
+                api_name, [(method, data) for method, data, _ in queue], **self.multicall_kwargs
+            )
+        except Exception as e:
+            for *_, future in queue:
+                future.set_exception(e)
+            raise
+        for (*_, future), result in zip(queue, results):
+            future.set_result(result)
+
+    async def results(self):
+        await self.flush()
+        return [future.result() for future in self.futures]
+
+    def __enter__(self):
+        raise TypeError(f"{type(self).__name__} is an async context manager, use async with")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                await self.flush()
+        finally:
+            self.cancel()
+
+
+def async_api_request(method_name, api_path):
+    """
+    @api_request for endpoints declared on an AsyncRestClient daughter class:
+    the endpoint function itself is a coroutine function
+    """
+    def outer_wrapper(func):
+        sync_wrapper = api_request(method_name, api_path)(func)
+
+        @functools.wraps(func)
+        async def method_wrapper(self, *args, **kwargs):
+            return await sync_wrapper(self, *args, **kwargs)
+
+        return method_wrapper
+
+    return outer_wrapper
+
+
+class AsyncContentd(Contentd, AsyncRestClient):
+    """
+    Contentd endpoints on the async transport
+    MRO: AsyncContentd -> Contentd -> AsyncRestClient -> RestClient
+    so the Contentd @api_request endpoints call AsyncRestClient._do_operation
+    """
+
+
+class AsyncOnevsh(Onevsh, AsyncRpcClient):
+    """
+    Onevsh custom functions on the async transport
+    listall_node_names returns the AsyncRpcClient coroutine: await it
+    iter_node_names returns an async generator: async for row in ...
+    """
+
+
+class AsyncLibcdn(Libcdn, AsyncRestClient, AsyncRpcClient):
+    """
+    Libcdn on both async transports
+    MRO: AsyncLibcdn -> Libcdn -> Contentd -> AsyncRestClient -> RestClient
+         -> Onevsh -> AsyncRpcClient -> RpcClient
+    so the Libcdn credentials provider still gives the auth of the async calls
+    """
+    async def run_macro(self, macro, inputs=None, max_workers=DEFAULT_MACRO_WORKERS):
+        """
+        Libcdn.run_macro with the steps run as asyncio tasks
+        :param max_workers: steps of this run running at once
+        """
+        return await MacroRun(self, macro, inputs).async_execute(max_workers)
+
+    @traced
+    async def macro1(self):
+        prefix, nodes = await gather(
+            self.get_cdn_prefix(cdn_prefix_id=5),
+            self.listall_node_names(2),
+        )
+        return (
+            f"***********************************************************\n"
+            f"macro1 with results:\n"
+            f"contentd: {prefix}\n"
+            f"onevsh:   {nodes}"
+        )
+
+
+if __name__ == '__main__':
+    setup_logging()
+    l = AsyncLibcdn('contentd', 'amc_url', 'onev_url', 'cob_url', 'plc_url')
+    print(asyncio.run(l.macro1()))
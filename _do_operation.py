@@ -1,17 +1,56 @@
+import contextvars
 import functools
 from logging import (
     getLogger,
     INFO,
     StreamHandler,
 )
-import json
-import os
-import requests
+from string import Formatter
+from time import perf_counter
 
+from bulk import (
+    BulkRun,
+    DEFAULT_BULK_WORKERS,
+)
+from credentials import (
+    CachedCredentialProvider,
+    context_identity,
+    current_auth,
+)
+from macro_dag import (
+    client_executor,
+    DEFAULT_CLIENT_WORKERS,
+    DEFAULT_MACRO_WORKERS,
+    MacroRun,
+)
+from metrics import (
+    AUTHORIZED,
+    ERROR,
+    UNAUTHORIZED,
+)
+from payload_codec import (
+    JsonCodec,
+    LazyPayload,
+    RAW_PAYLOAD_TYPES,
+)
+from request_logging import RequestLogger
+from response_cache import request_key
+from retry import call_with_retry
+from rpc_schema import RpcSchemas
+from tracing import (
+    CLIENT,
+    inject,
+    INTERNAL,
+)
+
+# importing this module has no side effect: scripts call setup_logging()
+# the heavy imports (requests, hashlib, concurrent.futures) are deferred to their first use
 logger = getLogger()
-logger.setLevel(INFO)
-ch = StreamHandler()
-logger.addHandler(ch)
+log_handler = None
+default_request_logger = RequestLogger(logger)
+# code object flags of the parameters and coroutine functions, see inspect.CO_*
+CO_VARKEYWORDS = 0x08
+CO_COROUTINE = 0x80
 
 AUTHORIZATION_CODE = 911
 RPC_ENDPOINTS = {
@@ -32,28 +71,109 @@ RPC_ENDPOINTS = {
         'DeletePerson': ['person_id_or_email'],
     }
 }
+# argument types of the RPC_ENDPOINTS arguments, checked by the rpc_schemas before dispatch
+RPC_ARGUMENT_TYPES = {
+    'object_type': str,
+    'object_id': int,
+    '1st_object_type': str,
+    '1st_object_id': int,
+    '2nd_object_type': str,
+    '2nd_object_id': int,
+    'filter_attrs': dict,
+    'return_attrs': (list, tuple),
+    'data_attrs': dict,
+    'person_filter': dict,
+    'return_fields': (list, tuple),
+    'person_fields': dict,
+    'person_id_or_email': (int, str),
+}
+# arguments a call may leave out, the filters and projections of the reads, all others are required
+RPC_OPTIONAL_ARGUMENTS = {
+    'ListAll': ('filter_attrs', 'return_attrs'),
+    'GetSlices': ('data_attrs', 'return_attrs'),
+    'GetPersons': ('person_filter', 'return_fields'),
+}
 methods_to_api = {method:api for api in RPC_ENDPOINTS for method in RPC_ENDPOINTS[api] }
+MULTICALL_METHOD = 'system.multicall'
+DEFAULT_BATCH_SIZE = 100
+# idempotent xmlrpc methods, any other method is a write on its api
+RPC_READ_METHODS = {'ListAll', 'GetSlices', 'GetPersons'}
+# rest methods retried by default by a RetryPolicy, and sent again by HttpSession
+# when a reused keep-alive connection fails after the request was written
+IDEMPOTENT_REST_METHODS = {'get', 'put', 'delete'}
+# filter argument of the read methods, where iter_rpc puts the pagination
+RPC_PAGE_FILTERS = {'ListAll': 'filter_attrs', 'GetPersons': 'person_filter', 'GetSlices': 'data_attrs'}
+DEFAULT_PAGE_SIZE = 500
+NOT_MODIFIED = '304 Not Modified'
+UNAUTHORIZED_RESPONSE = '!! UNAUTHORIZED !!'
+
+def setup_logging(level=INFO):
+    """
+    log the requests of the clients to stderr, the handler is added once per process
+    the root logger is left untouched at import, for the library users
+    """
+    global log_handler
+    if log_handler is None:
+        log_handler = StreamHandler()
+        logger.addHandler(log_handler)
+    logger.setLevel(level)
 
 def all_method(method, auth, data, name, url):
     """emulate a rest or rpc request on url"""
     if auth == AUTHORIZATION_CODE:
         return f"authorized {method} request of {data} on {name} {url}"
     else:
+        # only this branch needs requests: it is imported here and not at startup
+        import requests
         requests.get()
-        return f"!! UNAUTHORIZED !!, auth = {auth} on {name} {url}"
+        return f"{UNAUTHORIZED_RESPONSE}, auth = {auth} on {name} {url}"
+
+def multicall_method(auth, calls, name, url):
+    """
+    emulate a system.multicall xmlrpc request on url
+    one round trip carrying all the (method, data) calls, one result per call
+    """
+    if auth == AUTHORIZATION_CODE:
+        return [all_method(method, auth, data, name, url) for method, data in calls]
+    else:
+        return all_method(MULTICALL_METHOD, auth, calls, name, url)
+
+def response_etag(response):
+    """emulate the ETag header of a rest response"""
+    import hashlib
+    return hashlib.md5(str(response).encode()).hexdigest()
+
+def revalidation_headers(entry):
+    """:return: If-None-Match headers of a stale cache entry with an ETag, else None"""
+    return {'If-None-Match': entry.etag} if entry is not None and entry.etag else None
+
+def response_status(response):
+    """emulate the authorized or unauthorized status of a rest or rpc response"""
+    if isinstance(response, str) and response.startswith(UNAUTHORIZED_RESPONSE):
+        return UNAUTHORIZED
+    return AUTHORIZED
 
 def rest_wrapper(method):
-    def wrapped(auth, data, name, url):
-        return all_method(method, auth, data, name, url)
+    def wrapped(auth, data, name, url, headers=None):
+        response = all_method(method, auth, data, name, url)
+        if headers and headers.get('If-None-Match') == response_etag(response):
+            return NOT_MODIFIED
+        return response
     return wrapped
 
 
 def rpc_wrapper(method, name, url):
-    def wrapped(auth, data):
+    def wrapped(auth, data, headers=None):
         return all_method(method, auth, data, name, url)
     return wrapped
 
 
+def multicall_wrapper(name, url):
+    def wrapped(auth, calls, headers=None):
+        return multicall_method(auth, calls, name, url)
+    return wrapped
+
+
 class RestRequest():
     """
     this is our mock of python requests library
@@ -61,6 +181,11 @@ class RestRequest():
         RestRequest.<method>(auth, data, name, url)
         <method> in ('get', 'post', 'put', 'delete')
     RestRequest work with class methods only
+    conditional request:
+        RestRequest.get(auth, data, name, url, headers={'If-None-Match': etag})
+        returns NOT_MODIFIED if response_etag(response) == etag
+    the four methods are declared in the class body, RestRequest(*methods)
+    still adds other ones
     """
     def __new__(cls, *methods):
         for method in methods:
@@ -70,7 +195,11 @@ class RestRequest():
                 staticmethod(rest_wrapper(method))
             )
         return cls
-r = RestRequest('get', 'post', 'put', 'delete')
+
+    get = staticmethod(rest_wrapper('get'))
+    post = staticmethod(rest_wrapper('post'))
+    put = staticmethod(rest_wrapper('put'))
+    delete = staticmethod(rest_wrapper('delete'))
 
 
 class RpcRequest():
@@ -79,8 +208,11 @@ class RpcRequest():
     use:
         onev = RpcRequest(name, url)
         onev.<method>(auth, data)
+        onev.<method>(auth, data, headers={'traceparent': ...})
         <method> in RPC_ENDPOINTS
         unlike RestRequest, RpcRequest works with a class instance and regular methods
+    batch of calls in a single request:
+        onev.multicall(auth, [(<method>, data), ...])
     """
     def __init__(self, name, url):
         """"""
@@ -96,47 +228,415 @@ class RpcRequest():
                 method,
                 rpc_wrapper(method, self.name, self.url)
             )
+        self.multicall = multicall_wrapper(self.name, self.url)
+
+    def __reduce__(self):
+        # the built methods are closures: rebuild them when unpickled
+        return type(self), (self.name, self.url)
+
+
+# rpc_transport instances shared by the clients, per (rpc_transport, api name, url)
+shared_rpc_apis = {}
+
+
+class RpcApi():
+    """
+    onev, cob and plc attributes of RpcClient
+    the rpc_transport instance of the api is built on first access only, then
+    stored in the client __dict__, which shadows this descriptor: the next
+    accesses are plain attribute reads
+    with RpcClient.share_rpc_apis, the clients of the same url share one
+    instance and its methods, built once per process
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, client, owner=None):
+        if client is None:
+            return self
+        url = client.rpc_urls[self.name]
+        if client.share_rpc_apis:
+            key = (client.rpc_transport, self.name, url)
+            api = shared_rpc_apis.get(key)
+            if api is None:
+                api = shared_rpc_apis.setdefault(key, client.rpc_transport(self.name, url))
+        else:
+            api = client.rpc_transport(self.name, url)
+        client.__dict__[self.name] = api
+        return api
 
 
 class RpcClient():
+    # RpcRequest-like class instantiated per api with (name, url)
+    rpc_transport = RpcRequest
+    # share the rpc_transport instances between the clients, False for per client
+    # instances, e.g. to patch their methods
+    share_rpc_apis = True
+    onev = RpcApi('onev')
+    cob = RpcApi('cob')
+    plc = RpcApi('plc')
+    # optional ResponseCache of the RPC_READ_METHODS results
+    cache = None
+    # optional SingleFlight coalescing the concurrent identical RPC_READ_METHODS calls
+    single_flight = None
+    request_logger = default_request_logger
+    # optional credentials provider of the default auth, instead of self.auth
+    credentials = None
+    # optional MetricsRegistry of the calls count and latency per api, method and status
+    metrics = None
+    # optional Tracer of a span per call, its traceparent is sent in the request headers
+    tracer = None
+    # optional RetryPolicy of the idempotent calls, CircuitBreakers and RateLimiters per api
+    retry_policy = None
+    circuit_breakers = None
+    rate_limiters = None
+    # runs the xmlrpc requests under retry_policy, circuit_breakers and rate_limiters
+    call_with_retry = staticmethod(call_with_retry)
+    # RpcSchemas checking and encoding the call data before dispatch,
+    # rpc_schemas.as_trusted() to only encode, None to send the data as is
+    rpc_schemas = RpcSchemas(RPC_ENDPOINTS, RPC_ARGUMENT_TYPES, RPC_OPTIONAL_ARGUMENTS)
+
     def __init__(self, onev_url, cob_url, plc_url, auth=None):
-        self.onev = RpcRequest('onev', onev_url)
-        self.cob = RpcRequest('cob', cob_url)
-        self.plc = RpcRequest('plc', plc_url)
+        # the onev, cob and plc RpcApi are built on first use
+        self.rpc_urls = {'onev': onev_url, 'cob': cob_url, 'plc': plc_url}
         self.auth = auth
 
-    def __getattribute__(self, item):
-        if item in methods_to_api:
-            return self._do_rpc_operation(item)
-        else:
-            return super().__getattribute__(item)
+    def _default_auth(self):
+        """
+        :return: AuthContext auth, else credentials provider auth, else self.auth
+        """
+        auth = current_auth.get()
+        if auth is not None:
+            return auth
+        return self.auth if self.credentials is None else self.credentials.auth()
 
-    def _do_rpc_operation(self, item, **wrapper_kwargs):
+    def _rpc_method(self, item):
         """
-        xmlrpc call with decoration and authentification
         :param item: str xmlrpc method name
-        :param kwargs: pass specific auth headers with 'auth' key
-        :return: xmlrpc method with auth headers already filled in (<=> partial call)
+        :return: (api name, rpc method of the onev, cob or plc instance)
         """
         api_name = methods_to_api[item]
-        api = getattr(self, api_name)
-        method = getattr(api, item)
-        description = f"{api_name}.{item}"
-        def do_rpc_method(*args, **kwargs):
-            logger.info(f'_do_rpc_method args={args}, kwargs={kwargs}')
-            auth = wrapper_kwargs.get("auth", self.auth)
-            result = method(auth, **kwargs)
-            logger.info(
-                f"\n================================================================\n"
-                f"RpcClient._do_rpc_operation\n"
-                f"calling:            {description}\n"
-                f"on wrapper kwargs:  {wrapper_kwargs}\n"
-                f"on kwargs:          {kwargs}\n"
-                f"with result:        {result}\n"
-                f"===================================================================="
+        return api_name, getattr(getattr(self, api_name), item)
+
+    def _call_rpc(self, api_name, idempotent, method, auth, args, kwargs):
+        """
+        xmlrpc request, with the current span traceparent header when traced,
+        retried, guarded by the api circuit breaker and rate limited when configured
+        """
+        if self.tracer is not None:
+            headers = inject()
+            if headers:
+                kwargs = {**kwargs, 'headers': headers}
+        if self.retry_policy is None and self.circuit_breakers is None and self.rate_limiters is None:
+            return method(auth, *args, **kwargs)
+        return self.call_with_retry(
+            method,
+            (auth, *args),
+            kwargs,
+            self.retry_policy,
+            self.circuit_breakers.get(api_name) if self.circuit_breakers is not None else None,
+            idempotent,
+            self.rate_limiters.get(api_name) if self.rate_limiters is not None else None,
+        )
+
+    def _start_rpc_span(self, api_name, item):
+        return self.tracer.start_span(
+            f"{api_name}.{item}",
+            CLIENT,
+            {'backend': api_name, 'rpc.system': 'xmlrpc', 'rpc.service': api_name, 'rpc.method': item},
+        )
+
+    def _log_rpc_operation(self, api_name, item, auth, kwargs, result):
+        if self.request_logger.enabled(item):
+            self.request_logger.log(
+                'RpcClient._do_rpc_operation',
+                item,
+                calling=f"{api_name}.{item}",
+                auth=auth,
+                kwargs=kwargs,
+                result=result,
             )
+
+    def _do_rpc_operation(self, item, *args, **kwargs):
+        """
+        xmlrpc call with decoration and authentification
+        called by the RpcClient.<item> methods built from RPC_ENDPOINTS
+        :param item: str xmlrpc method name
+        :param kwargs: pass specific auth headers with 'auth' key,
+            default to the credentials provider auth, else self.auth
+        :return: xmlrpc method result
+        the data is checked and encoded by self.rpc_schemas before any round trip
+        """
+        auth = kwargs.pop("auth") if "auth" in kwargs else self._default_auth()
+        if self.rpc_schemas is not None:
+            args = self.rpc_schemas.encode_call(item, args, kwargs)
+        api_name, method = self._rpc_method(item)
+        start = perf_counter() if self.metrics is not None else None
+        span = self._start_rpc_span(api_name, item) if self.tracer is not None else None
+        try:
+            if self.cache is None and self.single_flight is None:
+                result = self._call_rpc(api_name, item in RPC_READ_METHODS, method, auth, args, kwargs)
+            elif item in RPC_READ_METHODS:
+                result = self._rpc_read(api_name, item, method, auth, args, kwargs)
+            else:
+                result = self._call_rpc(api_name, False, method, auth, args, kwargs)
+                if self.cache is not None and response_status(result) == AUTHORIZED:
+                    self.cache.invalidate(api_name)
+        except Exception as e:
+            if start is not None:
+                self.metrics.observe(api_name, item, ERROR, perf_counter() - start)
+            if span is not None:
+                span.end(e)
+            raise
+        if start is not None:
+            self.metrics.observe(api_name, item, response_status(result), perf_counter() - start)
+        if span is not None:
+            span.set_attribute('status', response_status(result))
+            span.end()
+        self._log_rpc_operation(api_name, item, auth, kwargs, result)
+        return result
+
+    def _rpc_read(self, api_name, item, method, auth, args, kwargs):
+        """
+        serve an RPC_READ_METHODS call from self.cache, coalesced by self.single_flight
+        """
+        key = request_key(api_name, item, auth, args, kwargs)
+        generation = None
+        if self.cache is not None:
+            generation = self.cache.generation()
+            entry, fresh = self.cache.lookup(key)
+            if fresh:
+                return entry.value
+
+        def fetch():
+            result = self._call_rpc(api_name, True, method, auth, args, kwargs)
+            if self.cache is not None:
+                self.cache.store(key, result, item, api_name, generation=generation)
             return result
-        return do_rpc_method
+
+        if self.single_flight is None:
+            return fetch()
+        # a read issued after a write does not join a flight started before it
+        return self.single_flight.do((key, generation), fetch)
+
+    def _do_rpc_multicall(self, api_name, calls, **kwargs):
+        """
+        send queued xmlrpc calls of one api as a single multicall request
+        :param api_name: str onev, cob or plc
+        :param calls: list of (method name, data)
+        :param kwargs: pass specific auth headers with 'auth' key
+        :return: list of results, in calls order
+        """
+        auth = kwargs["auth"] if "auth" in kwargs else self._default_auth()
+        reads_only = all(method in RPC_READ_METHODS for method, _ in calls)
+        start = perf_counter() if self.metrics is not None else None
+        span = self._start_rpc_span(api_name, MULTICALL_METHOD) if self.tracer is not None else None
+        try:
+            results = self._call_rpc(api_name, reads_only, getattr(self, api_name).multicall, auth, (calls,), {})
+        except Exception as e:
+            if start is not None:
+                self.metrics.observe(api_name, MULTICALL_METHOD, ERROR, perf_counter() - start)
+            if span is not None:
+                span.end(e)
+            raise
+        if start is not None:
+            self.metrics.observe(api_name, MULTICALL_METHOD, response_status(results), perf_counter() - start)
+        if span is not None:
+            span.set_attribute('rpc.calls', len(calls))
+            span.set_attribute('status', response_status(results))
+            span.end()
+        if self.cache is not None and not reads_only and response_status(results) == AUTHORIZED:
+            self.cache.invalidate(api_name)
+        self._log_rpc_operation(api_name, MULTICALL_METHOD, auth, {'calls': calls}, results)
+        return results
+
+    def batch(self, max_batch_size=DEFAULT_BATCH_SIZE, auth=None):
+        """
+        :param auth: auth of all the multicalls, default the _do_rpc_multicall one
+        :return: RpcBatch queuing this client xmlrpc calls
+        """
+        return RpcBatch(self, max_batch_size, auth)
+
+    def iter_rpc(self, item, data, page_size=DEFAULT_PAGE_SIZE, prefetch=True):
+        """
+        lazily page through the results of a RPC_PAGE_FILTERS method
+        :param data: method data, its RPC_PAGE_FILTERS argument gets the pagination
+            {'offset': n, 'limit': page_size}, or {'cursor': c, 'limit': page_size}
+            once the backend answers pages as {'results': [...], 'cursor': next cursor}
+        :param prefetch: fetch the next page in a background thread while the
+            current one is consumed, at most 2 pages are held in memory, in a
+            copy of the caller context: its pages are traced under the caller span
+        :return: generator of the result rows
+        a list page shorter than page_size or a None cursor ends the iteration,
+        any other result is yielded as a single row
+        """
+        fetch = self._page_fetcher(item, data, page_size)
+        if prefetch:
+            from concurrent.futures import ThreadPoolExecutor
+        pool = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            position = {'offset': 0}
+            page = fetch(position)
+            while True:
+                rows, position = page_rows(page, position, page_size)
+                page = None
+                if position is not None and pool is not None:
+                    page = pool.submit(contextvars.copy_context().run, fetch, position)
+                yield from rows
+                rows = None
+                if position is None:
+                    return
+                page = page.result() if page is not None else fetch(position)
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    def _page_fetcher(self, item, data, page_size):
+        """
+        :return: function(position) calling item with the page position in its
+            RPC_PAGE_FILTERS argument
+        """
+        if item not in RPC_PAGE_FILTERS:
+            raise ValueError(f"{item} is not a paginated method, use one of {', '.join(RPC_PAGE_FILTERS)}")
+        filter_name = RPC_PAGE_FILTERS[item]
+        rpc_method = getattr(self, item)
+
+        def fetch(position):
+            page_data = dict(data)
+            page_data[filter_name] = {**(data.get(filter_name) or {}), **position, 'limit': page_size}
+            return rpc_method(data=page_data)
+        return fetch
+
+
+def page_rows(page, position, page_size):
+    """
+    :param position: position of page, {'offset': n} or {'cursor': c}
+    :return: (rows of page, position of the next page or None after the last one)
+    """
+    if isinstance(page, dict) and 'results' in page:
+        cursor = page.get('cursor')
+        return page['results'], None if cursor is None else {'cursor': cursor}
+    if isinstance(page, list):
+        offset = position.get('offset', 0) + len(page)
+        return page, {'offset': offset} if len(page) >= page_size else None
+    return [page], None
+
+
+def rpc_method(item):
+    """
+    build the RpcClient method of xmlrpc item, once per RPC_ENDPOINTS method
+    client.<item>(data=data) delegates to client._do_rpc_operation(item, data=data)
+    so that daughter classes can redefine _do_rpc_operation
+    """
+    def do_rpc_method(self, *args, **kwargs):
+        return self._do_rpc_operation(item, *args, **kwargs)
+    do_rpc_method.__name__ = item
+    do_rpc_method.__qualname__ = f"{RpcClient.__name__}.{item}"
+    do_rpc_method.__doc__ = f"{methods_to_api[item]}.{item} xmlrpc call"
+    do_rpc_method.is_read = item in RPC_READ_METHODS
+    return do_rpc_method
+
+for item in methods_to_api:
+    setattr(RpcClient, item, rpc_method(item))
+
+
+def call_data(item, args, kwargs):
+    """
+    :return: data of a queued item(data) or item(data=data) call, None without data
+    """
+    if 'auth' in kwargs:
+        raise TypeError(f"{item}: the calls of a multicall share its auth, give it to batch(auth=...)")
+    if len(args) + len(kwargs) > 1 or set(kwargs) - {'data'}:
+        raise TypeError(f"{item}() takes a single data argument, got {args!r} and {sorted(kwargs)}")
+    return args[0] if args else kwargs.get('data')
+
+
+class RpcBatch():
+    """
+    queue xmlrpc calls per api (onev, cob, plc) and send them as multicall requests
+    use:
+        with client.batch(max_batch_size=100) as batch:
+            future = batch.ListAll(data=data)   # or batch.ListAll(data)
+            ...
+        future.result()
+    a multicall has a single auth: the one given to batch(), not per call
+    a queue is sent as soon as it holds max_batch_size calls, the rest on exit
+    or on flush(). results() flushes and returns all results in calls order
+    the futures still queued when the block raises are cancelled, their
+    result() raises CancelledError
+    """
+    # the async batch sends its full queues in flush, concurrently
+    flush_when_full = True
+
+    def __init__(self, client, max_batch_size=DEFAULT_BATCH_SIZE, auth=None):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be >= 1, got {max_batch_size}")
+        from concurrent.futures import Future
+        self.future_class = Future
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.multicall_kwargs = {} if auth is None else {'auth': auth}
+        self.queues = {api_name: [] for api_name in RPC_ENDPOINTS}
+        self.futures = []
+        self.request_count = 0
+
+    def __getattr__(self, item):
+        if item not in methods_to_api:
+            raise AttributeError(f"{type(self).__name__} has no rpc method {item}")
+        api_name = methods_to_api[item]
+        def queue_rpc_method(*args, **kwargs):
+            data = call_data(item, args, kwargs)
+            if self.client.rpc_schemas is not None:
+                # an invalid call raises here, not in the multicall of the whole queue
+                data = self.client.rpc_schemas.encode(item, {} if data is None else data)
+            future = self.future_class()
+            queue = self.queues[api_name]
+            queue.append((item, data, future))
+            self.futures.append(future)
+            if self.flush_when_full and len(queue) >= self.max_batch_size:
+                self.flush(api_name)
+            return future
+        return queue_rpc_method
+
+    def flush(self, *api_names):
+        for api_name in api_names or list(self.queues):
+            queue = self.queues[api_name]
+            if not queue:
+                continue
+            self.queues[api_name] = []
+            self.request_count += 1
+            try:
+                results = self.client._do_rpc_multicall(
+                    api_name, [(method, data) for method, data, _ in queue], **self.multicall_kwargs
+                )
+            except Exception as e:
+                for *_, future in queue:
+                    future.set_exception(e)
+                raise
+            for (*_, future), result in zip(queue, results):
+                future.set_result(result)
+
+    def results(self):
+        self.flush()
+        return [future.result() for future in self.futures]
+
+    def cancel(self):
+        """drop the queued calls and cancel their futures"""
+        self.queues = {api_name: [] for api_name in RPC_ENDPOINTS}
+        for future in self.futures:
+            future.cancel()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            # the block or a multicall raised: no future is left pending forever
+            self.cancel()
+
 
 class Onevsh(RpcClient):
     def __init__(self, onev_url, cob_url, plc_url, auth=0):
@@ -151,41 +651,270 @@ class Onevsh(RpcClient):
             }
         )
 
+    def iter_node_names(self, ip_address_id, page_size=DEFAULT_PAGE_SIZE):
+        """listall_node_names streamed page by page"""
+        return self.iter_rpc(
+            'ListAll',
+            {
+                'object_type':'IpAddress',
+                'filter_attrs':{'ip_address_id': ip_address_id},
+                'return_attrs':['type']
+            },
+            page_size,
+        )
+
 class RestClient():
+    # RestRequest-like class or instance exposing get, post, put, delete
+    rest_transport = RestRequest
+    # optional ResponseCache of the get responses
+    cache = None
+    # optional SingleFlight coalescing the concurrent identical get requests
+    single_flight = None
+    request_logger = default_request_logger
+    # data encoder, bytes-like data is sent as is
+    codec = JsonCodec()
+    # return the responses as LazyPayload, decoded by codec on access
+    decode_responses = False
+    # optional credentials provider of the default auth, instead of self.auth
+    credentials = None
+    # optional MetricsRegistry of the requests count and latency per method, path and status
+    metrics = None
+    # optional Tracer of a span per request, its traceparent is sent in the request headers
+    tracer = None
+    # optional RetryPolicy of the IDEMPOTENT_REST_METHODS, CircuitBreakers and RateLimiters per client_name
+    retry_policy = None
+    circuit_breakers = None
+    rate_limiters = None
+    # runs the rest requests under retry_policy, circuit_breakers and rate_limiters
+    call_with_retry = staticmethod(call_with_retry)
+
     def __init__(self, client_name, url, auth):
         self.client_name = client_name
         self.url = url
         self.auth = auth
 
+    def _default_auth(self):
+        """
+        :return: AuthContext auth, else credentials provider auth, else self.auth
+        """
+        auth = current_auth.get()
+        if auth is not None:
+            return auth
+        return self.auth if self.credentials is None else self.credentials.auth()
+
+    def _prepare_operation(self, api_path, **kwargs):
+        """
+        build the request shared by sync and async clients
+        :return: (auth, encoded data, endpoint url)
+        """
+        data = kwargs.get("data", {})
+        if not isinstance(data, RAW_PAYLOAD_TYPES):
+            data = self.codec.encode(data)
+        auth = kwargs["auth"] if "auth" in kwargs else self._default_auth()
+        path = api_path.build(kwargs) if isinstance(api_path, ApiPath) else api_path.format(**kwargs)
+        url = self.url
+        endpoint = f"{url}{path}" if url.endswith('/') else f"{url}/{path}"
+        return auth, data, endpoint
+
+    def _log_operation(self, method_name, api_path, kwargs, response):
+        if self.request_logger.enabled(api_path):
+            self.request_logger.log(
+                'RestClient._do_operation',
+                api_path,
+                method=method_name,
+                path=api_path,
+                kwargs=kwargs,
+                result=response,
+            )
+
+    def _start_span(self, method_name, api_path):
+        return self.tracer.start_span(
+            f"{self.client_name} {method_name} {api_path}",
+            CLIENT,
+            {'backend': self.client_name, 'http.method': method_name, 'http.route': str(api_path)},
+        )
+
+    def _observe_operation(self, method_name, api_path, status, start):
+        if isinstance(api_path, ApiPath):
+            # the '<method> <api_path>' label is built once per endpoint, not per call
+            label = api_path.labels.get(method_name)
+            if label is None:
+                label = api_path.labels[method_name] = f"{method_name} {api_path}"
+        else:
+            label = f"{method_name} {api_path}"
+        self.metrics.observe(self.client_name, label, status, perf_counter() - start)
+
     def _do_operation(self, method_name, api_path, **kwargs):
-        data = json.dumps(kwargs.get("data", {}))
-        auth = kwargs.get("auth", self.auth)
-        endpoint = os.path.join(self.url, api_path.format(**kwargs))
-        response = getattr(RestRequest, method_name)(auth, data, self.client_name, endpoint)
-        logger.info(
-            f"===============================\n"
-            f'RestClient._do_operation\n'
-            f'on method:    {method_name}\n'
-            f'on path:      {api_path}\n'
-            f'with kwargs   {kwargs}\n'
-            f"with result:  {response}\n"
-            f"===============================\n"
+        start = perf_counter() if self.metrics is not None else None
+        span = self._start_span(method_name, api_path) if self.tracer is not None else None
+        try:
+            auth, data, endpoint = self._prepare_operation(api_path, **kwargs)
+            if span is not None:
+                span.set_attribute('http.url', endpoint)
+            if self.cache is None and self.single_flight is None:
+                response = self._send(method_name, auth, data, endpoint)
+            elif method_name == 'get':
+                response = self._read(api_path, auth, data, endpoint)
+            else:
+                response = self._send(method_name, auth, data, endpoint)
+                if self.cache is not None and response_status(response) == AUTHORIZED:
+                    self.cache.invalidate((self.client_name, endpoint))
+        except Exception as e:
+            if start is not None:
+                self._observe_operation(method_name, api_path, ERROR, start)
+            if span is not None:
+                span.end(e)
+            raise
+        if start is not None:
+            self._observe_operation(method_name, api_path, response_status(response), start)
+        if span is not None:
+            span.set_attribute('status', response_status(response))
+            span.end()
+        self._log_operation(method_name, api_path, kwargs, response)
+        if self.decode_responses:
+            return LazyPayload(response, self.codec)
+        return response
+
+    def _send(self, method_name, auth, data, endpoint, headers=None):
+        request = getattr(self.rest_transport, method_name)
+        if self.tracer is not None:
+            headers = inject(headers)
+        if self.retry_policy is None and self.circuit_breakers is None and self.rate_limiters is None:
+            if headers:
+                return request(auth, data, self.client_name, endpoint, headers=headers)
+            return request(auth, data, self.client_name, endpoint)
+        return self.call_with_retry(
+            request,
+            (auth, data, self.client_name, endpoint),
+            {'headers': headers} if headers else {},
+            self.retry_policy,
+            self.circuit_breakers.get(self.client_name) if self.circuit_breakers is not None else None,
+            method_name in IDEMPOTENT_REST_METHODS,
+            self.rate_limiters.get(self.client_name) if self.rate_limiters is not None else None,
+        )
+
+    def _read(self, api_path, auth, data, endpoint):
+        """
+        serve a get from self.cache, coalesced by self.single_flight
+        """
+        key = request_key(self.client_name, endpoint, auth, data)
+        entry = generation = None
+        if self.cache is not None:
+            generation = self.cache.generation()
+            entry, fresh = self.cache.lookup(key)
+            if fresh:
+                return entry.value
+        if self.single_flight is None:
+            return self._fetch(key, entry, generation, api_path, auth, data, endpoint)
+        # a get issued after a write does not join a flight started before it
+        return self.single_flight.do(
+            (key, generation), self._fetch, key, entry, generation, api_path, auth, data, endpoint
         )
+
+    def _fetch(self, key, entry, generation, api_path, auth, data, endpoint):
+        """
+        backend get, a stale cached entry is revalidated with its ETag
+        """
+        response = self._send('get', auth, data, endpoint, revalidation_headers(entry))
+        return self._keep(key, entry, generation, api_path, endpoint, response)
+
+    def _keep(self, key, entry, generation, api_path, endpoint, response):
+        """
+        :return: the fetched response, stored in self.cache, or the revalidated entry value
+        """
+        if self.cache is None:
+            return response
+        if entry is not None and response == NOT_MODIFIED:
+            return self.cache.revalidated(key, entry, api_path, generation)
+        self.cache.store(key, response, api_path, (self.client_name, endpoint), response_etag(response), generation)
         return response
 
 
+class ApiPath(str):
+    """
+    api path template parsed once, at @api_request decoration
+    still a str for logging, caching and custom _do_operation
+    use:
+        path = ApiPath('contentd/cdn_prefix/{cdn_prefix_id}')
+        path.fields -> ('cdn_prefix_id',)
+        path.build({'cdn_prefix_id': 5}) -> 'contentd/cdn_prefix/5'
+    labels caches the '<method> <template>' metrics labels per method
+    """
+    def __new__(cls, template):
+        self = super().__new__(cls, template)
+        self.labels = {}
+        parsed = list(Formatter().parse(template))
+        self.fields = tuple(dict.fromkeys(
+            field.split('.')[0].split('[')[0] for _, field, _, _ in parsed if field is not None
+        ))
+        simple = all(
+            field is None or (field.isidentifier() and not conversion and not spec)
+            for _, field, spec, conversion in parsed
+        )
+        if not simple:
+            self.build = lambda kwargs: template.format(**kwargs)
+        elif not self.fields:
+            self.build = lambda kwargs: template
+        else:
+            segments = tuple((literal, field) for literal, field, _, _ in parsed)
+            tail = ''
+            if segments[-1][1] is None:
+                tail = segments[-1][0]
+                segments = segments[:-1]
+            if len(segments) == 1:
+                (literal, field), = segments
+                self.build = lambda kwargs: f"{literal}{kwargs[field]}{tail}"
+            else:
+                self.build = lambda kwargs: ''.join(
+                    [f"{literal}{kwargs[field]}" for literal, field in segments]
+                ) + tail
+        return self
+
+
 def api_request(method_name, api_path):
+    """
+    expose an endpoint function through self._do_operation
+    the api_path template is compiled once and checked against the endpoint
+    signature, positional arguments are passed by their parameter name
+    the wrapper returns whatever _do_operation returns:
+    on an AsyncRestClient the endpoint call gives an awaitable coroutine
+    """
+    api_path = ApiPath(api_path)
+
     def outer_wrapper(func):
+        # the code object gives the signature without importing inspect at startup
+        code = func.__code__
+        accepts_kwargs = bool(code.co_flags & CO_VARKEYWORDS)
+        positional_names = code.co_varnames[1:code.co_argcount]
+        names = set(code.co_varnames[1:code.co_argcount + code.co_kwonlyargcount])
+        missing = [field for field in api_path.fields if field not in names]
+        if missing and not accepts_kwargs:
+            raise ValueError(
+                f"@api_request path {api_path!r} of {func.__qualname__}: "
+                f"{', '.join(missing)} missing from the function signature"
+            )
+
         @functools.wraps(func)
         def method_wrapper(self, *args, **kwargs):
             # + amc authent: not implemented here for simplicity)
-            logger.info(
-                f"api_request decorator on:\n"
-                f"************** {func.__name__} **************\n"
-                f"with with keyword arguments: {kwargs}\n"
-            )
+            if args:
+                if len(args) > len(positional_names):
+                    raise TypeError(
+                        f"{func.__qualname__}() takes {len(positional_names)} positional arguments "
+                        f"but {len(args)} were given"
+                    )
+                for name, value in zip(positional_names, args):
+                    if name in kwargs:
+                        raise TypeError(f"{func.__qualname__}() got multiple values for argument {name!r}")
+                    kwargs[name] = value
+            if self.request_logger.enabled(api_path):
+                self.request_logger.log(
+                    'api_request decorator', api_path, function=func.__name__, kwargs=kwargs
+                )
             return self._do_operation(method_name, api_path, **kwargs)
 
+        # memoized by default in the macro runs
+        method_wrapper.is_read = method_name == 'get'
         return method_wrapper
 
     return outer_wrapper
@@ -204,34 +933,81 @@ class Contentd(RestClient):
         """"""
 
 
+def traced(func):
+    """
+    open a span of the decorated macro when the client has a tracer: the
+    backend calls of the macro are its children
+    works on regular and coroutine macros
+    """
+    if func.__code__.co_flags & CO_COROUTINE:
+        @functools.wraps(func)
+        async def async_macro_wrapper(self, *args, **kwargs):
+            if self.tracer is None:
+                return await func(self, *args, **kwargs)
+            with self.tracer.start_span(func.__qualname__, INTERNAL, {'macro': func.__name__}):
+                return await func(self, *args, **kwargs)
+        return async_macro_wrapper
+
+    @functools.wraps(func)
+    def macro_wrapper(self, *args, **kwargs):
+        if self.tracer is None:
+            return func(self, *args, **kwargs)
+        with self.tracer.start_span(func.__qualname__, INTERNAL, {'macro': func.__name__}):
+            return func(self, *args, **kwargs)
+    return macro_wrapper
+
+
+def apigw_credentials(identity):
+    """
+    in the apigw project the authent comes from flask context:
+        with self.app.test_request_context():
+            from models import CdnCredentials, CustomerModel
+            logger.info(f"app name {current_app.name} with request context: {has_request_context()} and {request.method}")
+            #kwargs['headers'] = get_jwt_identity()
+            identity=get_jwt_identity()
+            ...
+    :param identity: AuthContext identity of the call, set by the gateway per request
+    resolved once per identity and ttl by the Libcdn CachedCredentialProvider
+    """
+    return AUTHORIZATION_CODE
+
 
 class Libcdn(Contentd, Onevsh):
+    """
+    a single Libcdn can serve every gateway request, its pools and caches stay warm:
+        with AuthContext(identity=get_jwt_identity()):
+            libcdn.macro1()
+    """
+    # rest and rpc calls default auth, of the AuthContext identity, instead of the auth given at init
+    credentials = CachedCredentialProvider(apigw_credentials, identity=context_identity)
+    # threads of the run_macro steps pool, built by the first run and shared by the next ones
+    macro_workers = DEFAULT_CLIENT_WORKERS
+
     def __init__(self, rest_client_name, rest_url, onev_url, cob_url, plc_url, auth=0):
         Contentd.__init__(self, rest_client_name, rest_url, auth)
         Onevsh.__init__(self, onev_url, cob_url, plc_url, auth)
 
-    def _do_operation(self, *args, **kwargs):
+    def bulk(self, macro, inputs, max_workers=DEFAULT_BULK_WORKERS, executor='thread', max_pending=None):
         """
-        redefine RestClient _do_operation
-        in the apigw project the overriden authent comes from flask context:
-            with self.app.test_request_context():
-                from models import CdnCredentials, CustomerModel
-                logger.info(f"app name {current_app.name} with request context: {has_request_context()} and {request.method}")
-                #kwargs['headers'] = get_jwt_identity()
-                identity=get_jwt_identity()
-                ...
+        run a macro over many inputs with bounded concurrency
+        :param macro: method name called with each input, or function(libcdn, input)
+        :param executor: 'thread' or 'process' pool of max_workers
+        :param max_pending: max inputs submitted ahead of the consumed results
+        :return: BulkRun streaming a BulkOutcome per input as they complete, with report()
         """
-        kwargs['auth'] = 911
-        return super()._do_operation(*args, **kwargs)
+        return BulkRun(self, macro, inputs, max_workers, executor, max_pending)
 
-    def _do_rpc_operation(self, *args, **kwargs):
+    def run_macro(self, macro, inputs=None, max_workers=DEFAULT_MACRO_WORKERS):
         """
-        redefine RpcClient _do_rpc_operation
-        in apigw project, authent is given by the app.test_request_context()
+        run a macro_dag.Macro, each step as soon as the steps it refers to are done
+        :param inputs: {name: value} of the Input placeholders of the steps
+        :param max_workers: steps of this run running at once, on the macro_workers
+            threads shared by the runs of this client
+        :return: MacroRun with result, results per step and report() of the step timings
         """
-        kwargs['auth'] = 911
-        return super()._do_rpc_operation(*args, **kwargs)
+        return MacroRun(self, macro, inputs).execute(max_workers, client_executor(self))
 
+    @traced
     def macro1(self):
         return (
             f"***********************************************************\n"
@@ -247,5 +1023,6 @@ if __name__ == '__main__':
     # o = Onevsh('onev_url', 'cob_url', 'plc_url', 911)
     # o.listall_node_names(2)
 
+    setup_logging()
     l = Libcdn('contentd', 'amc_url', 'onev_url', 'cob_url', 'plc_url')
     print(l.macro1())
@@ -0,0 +1,671 @@
+"""
+offline benchmarks of the mock clients
+use:
+    python benchmark.py [bench_name ...]
+"""
+import asyncio
+import io
+import os
+from logging import (
+    getLogger,
+    INFO,
+    StreamHandler,
+    WARNING,
+)
+import statistics
+import subprocess
+import sys
+import time
+from time import perf_counter
+import timeit
+import tracemalloc
+
+from _do_operation import (
+    ApiPath,
+    Contentd,
+    DEFAULT_BATCH_SIZE,
+    Libcdn,
+    logger,
+    methods_to_api,
+    Onevsh,
+    response_status,
+    RPC_ARGUMENT_TYPES,
+    RPC_ENDPOINTS,
+    RPC_OPTIONAL_ARGUMENTS,
+    RestRequest,
+    RpcClient,
+    RpcRequest,
+)
+import _do_async_operation
+from _do_async_operation import (
+    AsyncContentd,
+    AsyncLibcdn,
+)
+from credentials import AuthContext
+from http_transport import HttpSession
+from macro_dag import (
+    Input,
+    Macro,
+    Ref,
+    Step,
+)
+from metrics import MetricsRegistry
+from payload_codec import (
+    JsonCodec,
+    load_orjson,
+    OrjsonCodec,
+)
+from request_logging import RequestLogger
+from rpc_schema import (
+    marshalling_error,
+    RpcArgumentError,
+)
+from standin_servers import RestStandin
+
+
+def bench_async_inflight(n=10000, latency=0.05):
+    """
+    n concurrent AsyncContentd.get_cdn_prefix requests on a single event loop
+    with a mock round trip of latency seconds
+    """
+    _do_async_operation.MOCK_LATENCY = latency
+    client = AsyncContentd('contentd', 'url', 911)
+
+    async def run():
+        return await asyncio.gather(
+            *(client.get_cdn_prefix(cdn_prefix_id=i) for i in range(n))
+        )
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    assert len(results) == n
+    print(
+        f"bench_async_inflight: {n} in-flight requests, latency {latency}s\n"
+        f"    elapsed:    {elapsed:.3f}s (sequential would be {n * latency:.0f}s)\n"
+        f"    throughput: {n / elapsed:.0f} req/s"
+    )
+
+
+def bench_rpc_multicall(n=10000, max_batch_size=DEFAULT_BATCH_SIZE):
+    """
+    n onev ListAll calls one by one, then queued in multicall batches
+    """
+    client = Libcdn('contentd', 'amc_url', 'onev_url', 'cob_url', 'plc_url')
+    calls = [{'object_type': 'IpAddress', 'filter_attrs': {'ip_address_id': i}} for i in range(n)]
+
+    start = time.perf_counter()
+    for data in calls:
+        client.ListAll(data=data)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with client.batch(max_batch_size) as batch:
+        for data in calls:
+            batch.ListAll(data=data)
+    results = batch.results()
+    batched = time.perf_counter() - start
+    assert len(results) == n
+    print(
+        f"bench_rpc_multicall: {n} ListAll calls, max_batch_size {max_batch_size}\n"
+        f"    one by one: {n} requests in {single:.3f}s\n"
+        f"    multicall:  {batch.request_count} requests in {batched:.3f}s"
+    )
+
+
+class LegacyDispatchOnevsh(Onevsh):
+    """
+    Onevsh with the former __getattribute__ dispatch building a closure on
+    every rpc method access, benchmark reference only
+    """
+    def __getattribute__(self, item):
+        if item in methods_to_api:
+            return super().__getattribute__('_legacy_rpc_operation')(item)
+        return super().__getattribute__(item)
+
+    def _legacy_rpc_operation(self, item, **wrapper_kwargs):
+        api_name = methods_to_api[item]
+        api = getattr(self, api_name)
+        method = getattr(api, item)
+        def do_rpc_method(*args, **kwargs):
+            logger.info(f'_do_rpc_method args={args}, kwargs={kwargs}')
+            auth = wrapper_kwargs.get("auth", self.auth)
+            result = method(auth, **kwargs)
+            self._log_rpc_operation(api_name, item, auth, kwargs, result)
+            return result
+        return do_rpc_method
+
+
+def bench_rpc_dispatch(number=200000):
+    """
+    per call cost of the rpc method dispatch, former __getattribute__ closures
+    against the methods built once from RPC_ENDPOINTS
+    """
+    data = {'object_type': 'IpAddress', 'filter_attrs': {'ip_address_id': 2}}
+    print(f"bench_rpc_dispatch: {number} calls, ns per call")
+    for label, client in (
+        ('before (__getattribute__)', LegacyDispatchOnevsh('onev_url', 'cob_url', 'plc_url', 911)),
+        ('after (built methods)', Onevsh('onev_url', 'cob_url', 'plc_url', 911)),
+    ):
+        lookup = timeit.timeit(lambda: client.ListAll, number=number)
+        auth = timeit.timeit(lambda: client.auth, number=number)
+        call = timeit.timeit(lambda: client.ListAll(data=data), number=number)
+        print(
+            f"    {label:28} ListAll lookup {lookup / number * 1e9:6.0f}"
+            f"  self.auth {auth / number * 1e9:5.0f}"
+            f"  ListAll call {call / number * 1e9:6.0f}"
+        )
+
+
+class LegacyLogContentd(Contentd):
+    """
+    Contentd with the former eager f-string banner, built whatever the log level
+    benchmark reference only
+    """
+    def _log_operation(self, method_name, api_path, kwargs, response):
+        logger.info(
+            f"===============================\n"
+            f'RestClient._do_operation\n'
+            f'on method:    {method_name}\n'
+            f'on path:      {api_path}\n'
+            f'with kwargs   {kwargs}\n'
+            f"with result:  {response}\n"
+            f"===============================\n"
+        )
+
+
+def bench_request_logging(number=200000):
+    """
+    per call cost of RestClient._log_operation on a get_cdn_prefix request
+    the enabled cases log to an in memory stream
+    """
+    bench_logger = getLogger('benchmark.request_logging')
+    bench_logger.propagate = False
+    bench_logger.setLevel(INFO)
+    bench_logger.addHandler(StreamHandler(io.StringIO()))
+    disabled_logger = getLogger('benchmark.disabled')
+    disabled_logger.setLevel(WARNING)
+    cases = (
+        ('eager banner, disabled', None),
+        ('lazy, disabled', RequestLogger(disabled_logger)),
+        ('lazy, enabled, 1% sampled', RequestLogger(bench_logger, default_sampling=0.01)),
+        ('lazy, enabled, structured', RequestLogger(bench_logger, structured=True)),
+        ('lazy, enabled, banner', RequestLogger(bench_logger)),
+    )
+    api_path = 'contentd/cdn_prefix/{cdn_prefix_id}'
+    kwargs = {'cdn_prefix_id': 5, 'auth': 911}
+    response = 'authorized get request of {} on contentd url/contentd/cdn_prefix/5'
+    print(f"bench_request_logging: {number} RestClient._log_operation calls")
+    for label, request_logger in cases:
+        if request_logger is None:
+            client = LegacyLogContentd('contentd', 'url', 911)
+        else:
+            client = Contentd('contentd', 'url', 911)
+            client.request_logger = request_logger
+        per_call = min(timeit.repeat(
+            lambda: client._log_operation('get', api_path, kwargs, response),
+            number=number // 5,
+            repeat=5,
+        )) / (number // 5) * 1e9
+        print(f"    {label:28} {per_call:7.0f} ns/call")
+
+
+def bench_http_session(n=2000):
+    """
+    Contentd.get_cdn_prefix against a local stand-in http server
+    a new connection per request against the pooled keep-alive HttpSession
+    """
+    server = RestStandin().start()
+    server.state.seed(n)
+    try:
+        print(f"bench_http_session: {n} get_cdn_prefix requests on {server.url}")
+        for label, session in (
+            ('new connection per request', HttpSession(max_pool_size=0)),
+            ('keep-alive pool', HttpSession()),
+        ):
+            client = Contentd('contentd', server.url, 911)
+            client.rest_transport = session
+            start = time.perf_counter()
+            for i in range(n):
+                client.get_cdn_prefix(cdn_prefix_id=i)
+            elapsed = time.perf_counter() - start
+            stats = session.stats()[server.url.split('//')[1]]
+            print(
+                f"    {label:28} {elapsed / n * 1e6:6.0f} us/request"
+                f"  connections opened: {stats['opened']}"
+            )
+            session.close()
+    finally:
+        server.stop()
+
+
+def bench_path_building(number=500000):
+    """
+    endpoint url of get_cdn_prefix: former per call str.format and os.path.join
+    against the ApiPath compiled at @api_request decoration
+    """
+    template = 'contentd/cdn_prefix/{cdn_prefix_id}'
+    api_path = ApiPath(template)
+    url = 'http://contentd:8000'
+    kwargs = {'cdn_prefix_id': 5, 'auth': 911}
+
+    def compiled():
+        path = api_path.build(kwargs)
+        return f"{url}{path}" if url.endswith('/') else f"{url}/{path}"
+
+    assert compiled() == os.path.join(url, template.format(**kwargs))
+    print(f"bench_path_building: {number} endpoint urls, ns per url")
+    for label, build in (
+        ('before (format + join)', lambda: os.path.join(url, template.format(**kwargs))),
+        ('after (ApiPath.build)', compiled),
+    ):
+        per_call = min(timeit.repeat(build, number=number // 5, repeat=5)) / (number // 5) * 1e9
+        print(f"    {label:28} {per_call:6.0f}")
+
+
+def cdn_prefix_payload(origins=20, cache_rules=200):
+    """update_cdn_prefix body of a production like prefix, about 40KB in json"""
+    return {
+        'prefix': 'cdn.example.com/video/live',
+        'enabled': True,
+        'origins': [
+            {
+                'host': f"origin{i}.example.com",
+                'port': 443,
+                'weight': 100 - i,
+                'health_check': {'path': '/health', 'interval': 10, 'timeout': 2.5, 'expect': [200, 204]},
+            }
+            for i in range(origins)
+        ],
+        'cache_rules': [
+            {
+                'path': f"/segments/{i}/*.ts",
+                'ttl': 3600 + i,
+                'query_string': i % 2 == 0,
+                'headers': {'Cache-Control': 'public, max-age=3600', 'Vary': 'Accept-Encoding'},
+            }
+            for i in range(cache_rules)
+        ],
+        'geo_blocking': ['KP', 'IR', 'SY', 'CU'],
+        'certificate': {'name': 'wildcard.example.com', 'pem': 'MIIF' + 'A' * 3000},
+    }
+
+
+def bench_codec(number=2000):
+    """
+    encode and decode a cdn prefix payload with each codec, and the
+    pre-serialized bytes passthrough of _prepare_operation
+    """
+    payload = cdn_prefix_payload()
+    codecs = [JsonCodec(), JsonCodec(compact=True)]
+    if load_orjson() is not None:
+        codecs.append(OrjsonCodec())
+    client = Contentd('contentd', 'url', 911)
+    api_path = ApiPath('contentd/cdn_prefix/{cdn_prefix_id}')
+    print(f"bench_codec: {number} cdn prefix payloads, us per call")
+    for codec in codecs:
+        encoded = codec.encode(payload)
+        encode = min(timeit.repeat(lambda: codec.encode(payload), number=number, repeat=5)) / number
+        decode = min(timeit.repeat(lambda: codec.decode(encoded), number=number, repeat=5)) / number
+        print(f"    {codec.name:14} {len(encoded):6} bytes  encode {encode * 1e6:7.1f}  decode {decode * 1e6:7.1f}")
+    raw = memoryview(JsonCodec(compact=True).encode(payload).encode())
+    client.codec = JsonCodec()
+    for label, data in (('dict + json', payload), ('bytes passthrough', raw)):
+        prepare = min(timeit.repeat(
+            lambda: client._prepare_operation(api_path, cdn_prefix_id=5, data=data), number=number, repeat=5
+        )) / number
+        print(f"    _prepare_operation, {label:18} {prepare * 1e6:7.1f}")
+
+
+def bench_metrics(number=200000):
+    """
+    per call overhead of the MetricsRegistry instrumentation of
+    RestClient._do_operation and RpcClient._do_rpc_operation
+    """
+    data = {'object_type': 'IpAddress', 'filter_attrs': {'ip_address_id': 2}}
+    registry = MetricsRegistry()
+    result = 'authorized ListAll request of {} on onev onev_url'
+    print(f"bench_metrics: {number} calls, ns per call")
+    observe = min(timeit.repeat(
+        lambda: registry.observe('onev', 'ListAll', 'authorized', 0.001), number=number, repeat=5
+    )) / number
+    # what _do_rpc_operation adds when metrics are enabled
+    instrumentation = min(timeit.repeat(
+        lambda: registry.observe('onev', 'ListAll', response_status(result), perf_counter() - perf_counter()),
+        number=number,
+        repeat=5,
+    )) / number
+    print(f"    {'MetricsRegistry.observe':28} {observe * 1e9:7.0f}")
+    print(f"    {'timing + status + observe':28} {instrumentation * 1e9:7.0f}")
+    contentd = Contentd('contentd', 'url', 911)
+    onevsh = Onevsh('onev_url', 'cob_url', 'plc_url', 911)
+    calls = (
+        ('get_cdn_prefix', lambda: contentd.get_cdn_prefix(cdn_prefix_id=5)),
+        ('ListAll', lambda: onevsh.ListAll(data=data)),
+    )
+    configs = (('metrics disabled', None), ('metrics enabled', registry))
+    # the two configs alternate in each repeat, so that both see the same machine noise
+    timings = {(label, name): [] for label, _ in configs for name, _ in calls}
+    for _ in range(7):
+        for label, metrics in configs:
+            contentd.metrics = metrics
+            onevsh.metrics = metrics
+            for name, call in calls:
+                timings[label, name].append(timeit.timeit(call, number=number // 5) / (number // 5))
+    best = {key: min(values) for key, values in timings.items()}
+    for label, _ in configs:
+        print(f"    {label:28} " + '  '.join(f"{name} {best[label, name] * 1e9:7.0f}" for name, _ in calls))
+    print(f"    {'enabled - disabled':28} " + '  '.join(
+        f"{name} {(best['metrics enabled', name] - best['metrics disabled', name]) * 1e9:7.0f}" for name, _ in calls
+    ))
+
+
+def generic_encode(item, data):
+    """
+    RpcSchemas.encode done per call from the RPC_ENDPOINTS lists and dicts,
+    benchmark reference only
+    """
+    api_name = methods_to_api[item]
+    params = RPC_ENDPOINTS[api_name][item]
+    method = f"{api_name}.{item}"
+    if not isinstance(data, dict):
+        raise RpcArgumentError(method, f"data must be a dict, got {type(data).__name__}")
+    for name in data:
+        if name not in params:
+            raise RpcArgumentError(method, f"unknown argument {name!r}")
+    for name in params:
+        if name not in data:
+            if name not in RPC_OPTIONAL_ARGUMENTS.get(item, ()):
+                raise RpcArgumentError(method, f"missing argument {name!r}")
+            continue
+        expected = RPC_ARGUMENT_TYPES.get(name, object)
+        if not isinstance(data[name], expected):
+            raise RpcArgumentError(method, f"argument {name!r} has a wrong type")
+        error = marshalling_error(data[name], name)
+        if error is not None:
+            raise RpcArgumentError(method, error)
+    return {name: data[name] for name in params if name in data}
+
+
+def bench_rpc_schema(number=200000):
+    """
+    per call cost of the ListAll data check and encoding: generic handling of
+    the RPC_ENDPOINTS dicts against the compiled RpcSchemas, and its trusted mode
+    """
+    data = {'object_type': 'IpAddress', 'filter_attrs': {'ip_address_id': 2}, 'return_attrs': ['type']}
+    compiled = RpcClient.rpc_schemas
+    trusted = compiled.as_trusted()
+    assert generic_encode('ListAll', data) == compiled.encode('ListAll', data) == trusted.encode('ListAll', data)
+    print(f"bench_rpc_schema: {number} ListAll data, ns per call")
+    for label, encode in (
+        ('generic dict handling', generic_encode),
+        ('compiled RpcSchemas', compiled.encode),
+        ('trusted RpcSchemas', trusted.encode),
+    ):
+        per_call = min(timeit.repeat(lambda: encode('ListAll', data), number=number // 5, repeat=5)) / (number // 5)
+        print(f"    {label:28} {per_call * 1e9:7.0f}")
+    onevsh = Onevsh('onev_url', 'cob_url', 'plc_url', 911)
+    for label, schemas in (('no schemas', None), ('compiled', compiled), ('trusted', trusted)):
+        onevsh.rpc_schemas = schemas
+        call = min(timeit.repeat(
+            lambda: onevsh.ListAll(data=data), number=number // 5, repeat=5
+        )) / (number // 5)
+        print(f"    ListAll call, {label:14} {call * 1e9:7.0f}")
+
+
+# emulated round trip of the LatencyLibcdn transports, in seconds
+BACKEND_LATENCY = 0.02
+
+
+def with_latency(request):
+    def slow_request(*args, **kwargs):
+        time.sleep(BACKEND_LATENCY)
+        return request(*args, **kwargs)
+    return slow_request
+
+
+class LatencyRestRequest(RestRequest):
+    get = staticmethod(with_latency(RestRequest.get))
+    put = staticmethod(with_latency(RestRequest.put))
+
+
+class LatencyRpcRequest(RpcRequest):
+    def build_methods(self):
+        super().build_methods()
+        for method in self.methods:
+            setattr(self, method, with_latency(getattr(self, method)))
+
+
+class LatencyLibcdn(Libcdn):
+    """Libcdn whose every backend call takes BACKEND_LATENCY, benchmark only"""
+    rest_transport = LatencyRestRequest
+    rpc_transport = LatencyRpcRequest
+
+
+def mock_object_id(result):
+    """id of a mock Create result, the mock answers a str"""
+    return len(result)
+
+
+def node_filter(ip_address_id):
+    return {'object_type': 'IpAddress', 'filter_attrs': {'ip_address_id': ip_address_id}, 'return_attrs': ['type']}
+
+
+# a 14 steps provisioning macro: 4 independent reads, 2 creates, a bind
+# depending on both, and an update of the prefix read, a read repeated twice
+PROVISION_MACRO = Macro('provision', [
+    Step('prefix', 'get_cdn_prefix', cdn_prefix_id=Input('cdn_prefix_id')),
+    Step('prefix_again', 'get_cdn_prefix', cdn_prefix_id=Input('cdn_prefix_id')),
+    Step('origin_prefix', 'get_cdn_prefix', cdn_prefix_id=Input('origin_prefix_id')),
+    *(Step(f"nodes_{ip}", 'ListAll', data=node_filter(ip)) for ip in range(4)),
+    Step('persons', 'GetPersons', data={'person_filter': {'email': Input('email')}}),
+    Step('slices', 'GetSlices', data={'data_attrs': {'name': Input('slice')}}),
+    Step('node', 'Create', data={'object_type': 'Node', 'data_attrs': {'hostname': Input('hostname')}}),
+    Step('ip', 'Create', data={'object_type': 'IpAddress', 'data_attrs': {'ip': Input('ip')}}),
+    Step('bind', 'Bind', data={
+        '1st_object_type': 'Node', '1st_object_id': Ref('node', mock_object_id),
+        '2nd_object_type': 'IpAddress', '2nd_object_id': Ref('ip', mock_object_id),
+    }),
+    Step('update', 'update_cdn_prefix', cdn_prefix_id=Input('cdn_prefix_id'), data={'origin': Ref('origin_prefix')}),
+    Step('person', 'UpdatePerson', data={'person_id_or_email': Input('email'), 'person_fields': {'node': Ref('node')}}),
+], output='bind')
+PROVISION_INPUTS = {
+    'cdn_prefix_id': 5, 'origin_prefix_id': 6, 'email': 'ops@example.com', 'slice': 'edge',
+    'hostname': 'edge-1', 'ip': '10.0.0.1',
+}
+
+
+def provision_sequential(client, inputs):
+    """PROVISION_MACRO hand written, one call after the other as macro1, benchmark reference"""
+    client.get_cdn_prefix(cdn_prefix_id=inputs['cdn_prefix_id'])
+    client.get_cdn_prefix(cdn_prefix_id=inputs['cdn_prefix_id'])
+    origin = client.get_cdn_prefix(cdn_prefix_id=inputs['origin_prefix_id'])
+    for ip in range(4):
+        client.ListAll(data=node_filter(ip))
+    client.GetPersons(data={'person_filter': {'email': inputs['email']}})
+    client.GetSlices(data={'data_attrs': {'name': inputs['slice']}})
+    node = client.Create(data={'object_type': 'Node', 'data_attrs': {'hostname': inputs['hostname']}})
+    ip = client.Create(data={'object_type': 'IpAddress', 'data_attrs': {'ip': inputs['ip']}})
+    bind = client.Bind(data={
+        '1st_object_type': 'Node', '1st_object_id': mock_object_id(node),
+        '2nd_object_type': 'IpAddress', '2nd_object_id': mock_object_id(ip),
+    })
+    client.update_cdn_prefix(cdn_prefix_id=inputs['cdn_prefix_id'], data={'origin': origin})
+    client.UpdatePerson(data={'person_id_or_email': inputs['email'], 'person_fields': {'node': node}})
+    return bind
+
+
+def bench_macro_dag(runs=5, latency=0.02):
+    """
+    latency of the 14 steps PROVISION_MACRO with backend calls of latency
+    seconds: hand written sequential calls against the macro engine, then the
+    engine overhead per run without latency
+    """
+    global BACKEND_LATENCY
+    BACKEND_LATENCY = latency
+    client = LatencyLibcdn('contentd', 'amc_url', 'onev_url', 'cob_url', 'plc_url')
+    expected = provision_sequential(client, PROVISION_INPUTS)
+    assert client.run_macro(PROVISION_MACRO, PROVISION_INPUTS).result == expected
+    print(f"bench_macro_dag: {len(PROVISION_MACRO.steps)} steps, backend latency {latency * 1e3:.0f} ms, best of {runs} runs")
+
+    def best(run):
+        return min(timeit.repeat(run, number=1, repeat=runs))
+
+    sequential = best(lambda: provision_sequential(client, PROVISION_INPUTS))
+    print(f"    {'hand written sequential':28} {sequential * 1e3:7.1f} ms")
+    print(f"    {'macro engine, 1 worker':28} {best(lambda: client.run_macro(PROVISION_MACRO, PROVISION_INPUTS, max_workers=1)) * 1e3:7.1f} ms")
+    parallel = best(lambda: client.run_macro(PROVISION_MACRO, PROVISION_INPUTS))
+    print(f"    {'macro engine':28} {parallel * 1e3:7.1f} ms  x{sequential / parallel:.1f}")
+    _do_async_operation.MOCK_LATENCY = latency
+    async_client = AsyncLibcdn('contentd', 'amc_url', 'onev_url', 'cob_url', 'plc_url')
+    asynchronous = best(lambda: asyncio.run(async_client.run_macro(PROVISION_MACRO, PROVISION_INPUTS)))
+    print(f"    {'async macro engine':28} {asynchronous * 1e3:7.1f} ms  x{sequential / asynchronous:.1f}")
+    report = client.run_macro(PROVISION_MACRO, PROVISION_INPUTS).report()
+    print(f"    critical path {' -> '.join(report['critical_path'])}, {report['memoized']} memoized step")
+    BACKEND_LATENCY = 0
+    number = 200
+    for label, run in (
+        ('hand written sequential', lambda: provision_sequential(client, PROVISION_INPUTS)),
+        ('macro engine', lambda: client.run_macro(PROVISION_MACRO, PROVISION_INPUTS)),
+    ):
+        per_run = min(timeit.repeat(run, number=number, repeat=runs)) / number
+        print(f"    no latency, {label:24} {per_run * 1e6:7.0f} us per run")
+
+
+class EagerLibcdn(Libcdn):
+    """
+    Libcdn building its onev, cob and plc RpcRequest, and their methods
+    closures, at init as before, benchmark reference only
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in ('onev', 'cob', 'plc'):
+            setattr(self, name, RpcRequest(name, self.rpc_urls[name]))
+
+
+def bench_client_construction(number=20000, retained=1000):
+    """
+    Libcdn construction per gateway request: time per instance, memory held
+    per instance, and construction followed by a first ListAll call, against
+    a long lived Libcdn getting the request identity from an AuthContext
+    """
+    data = {'object_type': 'IpAddress', 'filter_attrs': {'ip_address_id': 2}}
+    args = ('contentd', 'amc_url', 'onev_url', 'cob_url', 'plc_url')
+    print(f"bench_client_construction: {number} Libcdn, memory of {retained} retained instances")
+    for label, client_class in (('eager RpcRequest', EagerLibcdn), ('lazy shared RpcApi', Libcdn)):
+        construction = min(timeit.repeat(lambda: client_class(*args), number=number // 5, repeat=5)) / (number // 5)
+        first_call = min(timeit.repeat(
+            lambda: client_class(*args).ListAll(data=data), number=number // 5, repeat=5
+        )) / (number // 5)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        clients = [client_class(*args) for _ in range(retained)]
+        memory = (tracemalloc.get_traced_memory()[0] - before) / retained
+        tracemalloc.stop()
+        del clients
+        print(
+            f"    {label:22} construction {construction * 1e6:6.1f} us"
+            f"  construction + ListAll {first_call * 1e6:6.1f} us"
+            f"  {memory:7.0f} B/instance"
+        )
+    client = Libcdn(*args)
+
+    def long_lived_call():
+        with AuthContext(identity='user'):
+            return client.ListAll(data=data)
+
+    long_lived = min(timeit.repeat(long_lived_call, number=number // 5, repeat=5)) / (number // 5)
+    print(f"    {'long lived Libcdn':22} AuthContext + ListAll {long_lived * 1e6:6.1f} us")
+
+
+FIRST_CALL_SCRIPT = """
+import time
+start = time.perf_counter()
+import _do_operation
+imported = time.perf_counter()
+client = _do_operation.Libcdn('contentd', 'amc_url', 'onev_url', 'cob_url', 'plc_url')
+client.macro1()
+first = time.perf_counter()
+client.macro1()
+second = time.perf_counter()
+print(imported - start, first - imported, second - first)
+"""
+
+
+def import_times(module):
+    """
+    :return: (cumulative import us of module, [(cumulative us, name) of its direct imports])
+    from python -X importtime in a new process
+    """
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+    ).stderr
+    total, children, pending = 0, [], []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = len(name) - len(name.lstrip()) - 1
+        # the imports of a module are listed before it, one indent deeper
+        if depth == 2:
+            pending.append((int(cumulative), name.strip()))
+        elif depth == 0:
+            if name.strip() == module:
+                total, children = int(cumulative), pending
+            pending = []
+    return total, sorted(children, reverse=True)
+
+
+def bench_startup(runs=10):
+    """
+    startup cost of a short lived process: python -X importtime of _do_operation,
+    the process wall time against an empty interpreter, and the first calls latency
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    totals = []
+    for _ in range(runs):
+        total, children = import_times('_do_operation')
+        totals.append(total)
+    print(f"bench_startup: {runs} new processes")
+    print(f"    import _do_operation (-X importtime)  median {statistics.median(totals) / 1e3:6.1f} ms  min {min(totals) / 1e3:6.1f} ms")
+    print("    slowest direct imports: " + ", ".join(f"{name} {us / 1e3:.1f} ms" for us, name in children[:5]))
+    for label, code in (('python -c pass', 'pass'), ('python -c "import _do_operation"', 'import _do_operation')):
+        walls = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], cwd=directory, check=True)
+            walls.append(time.perf_counter() - start)
+        print(f"    {label:36} median {statistics.median(walls) * 1e3:6.1f} ms wall")
+    firsts = [
+        [float(value) for value in subprocess.run(
+            [sys.executable, '-c', FIRST_CALL_SCRIPT], cwd=directory, capture_output=True, text=True, check=True,
+        ).stdout.split()]
+        for _ in range(runs)
+    ]
+    imported, first, second = (statistics.median(column) for column in zip(*firsts))
+    print(
+        f"    in process: import {imported * 1e3:.1f} ms, Libcdn + first macro1 {first * 1e6:.0f} us,"
+        f" second macro1 {second * 1e6:.0f} us"
+    )
+
+
+BENCHES = {
+    'async_inflight': bench_async_inflight,
+    'rpc_multicall': bench_rpc_multicall,
+    'rpc_dispatch': bench_rpc_dispatch,
+    'request_logging': bench_request_logging,
+    'http_session': bench_http_session,
+    'path_building': bench_path_building,
+    'codec': bench_codec,
+    'metrics': bench_metrics,
+    'rpc_schema': bench_rpc_schema,
+    'client_construction': bench_client_construction,
+    'macro_dag': bench_macro_dag,
+    'startup': bench_startup,
+}
+
+if __name__ == '__main__':
+    logger.setLevel(WARNING)
+    for name in sys.argv[1:] or BENCHES:
+        BENCHES[name]()
@@ -0,0 +1,213 @@
+"""
+offline benchmark suite of the client hot paths, with regression check
+use:
+    python benchmark_suite.py [hot_path ...] [--save-baseline] [--check] [--threshold 0.2]
+each hot path reports ops/sec, per call latency percentiles and the peak
+memory allocated by one call. --save-baseline stores the results in
+--baseline (benchmark_baseline.json), --check compares them with the
+stored ones and exits 1 when a hot path ops/sec drops by more than threshold
+baselines are machine specific: save them on the machine running the checks
+"""
+import argparse
+from logging import WARNING
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from _do_operation import (
+    ApiPath,
+    AUTHORIZATION_CODE,
+    Contentd,
+    Libcdn,
+    logger,
+    Onevsh,
+    RestRequest,
+)
+from http_transport import HttpSession
+from percentiles import percentile
+from standin_servers import RestStandin
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_DURATION = 1.0
+WARMUP_CALLS = 100
+ALLOC_CALLS = 100
+LISTALL_DATA = {
+    'object_type': 'IpAddress',
+    'filter_attrs': {'ip_address_id': 2},
+    'return_attrs': ['type'],
+}
+
+
+def rest_request_dispatch():
+    return lambda: RestRequest.get(AUTHORIZATION_CODE, '{}', 'contentd', 'url/contentd/cdn_prefix/5')
+
+
+def rpc_method_dispatch():
+    client = Onevsh('onev_url', 'cob_url', 'plc_url', AUTHORIZATION_CODE)
+    return lambda: client.ListAll(data=LISTALL_DATA)
+
+
+def rest_prepare_operation():
+    client = Contentd('contentd', 'url', AUTHORIZATION_CODE)
+    data = {'prefix': 'cdn', 'origins': ['origin1', 'origin2']}
+    api_path = ApiPath('contentd/cdn_prefix/{cdn_prefix_id}')
+    return lambda: client._prepare_operation(api_path, cdn_prefix_id=5, data=data)
+
+
+def rest_do_operation():
+    client = Contentd('contentd', 'url', AUTHORIZATION_CODE)
+    return lambda: client.get_cdn_prefix(cdn_prefix_id=5)
+
+
+def libcdn_construction():
+    return lambda: Libcdn('contentd', 'amc_url', 'onev_url', 'cob_url', 'plc_url')
+
+
+def libcdn_macro1():
+    client = Libcdn('contentd', 'amc_url', 'onev_url', 'cob_url', 'plc_url')
+    return client.macro1
+
+
+def http_get_cdn_prefix():
+    server = RestStandin().start()
+    server.state.seed(5)
+    client = Contentd('contentd', server.url, AUTHORIZATION_CODE)
+    client.rest_transport = HttpSession()
+
+    def teardown():
+        client.rest_transport.close()
+        server.stop()
+
+    return lambda: client.get_cdn_prefix(cdn_prefix_id=5), teardown
+
+
+# name: setup returning the call to measure, or (call, teardown)
+HOT_PATHS = {
+    'rest_request_dispatch': rest_request_dispatch,
+    'rpc_method_dispatch': rpc_method_dispatch,
+    'rest_prepare_operation': rest_prepare_operation,
+    'rest_do_operation': rest_do_operation,
+    'libcdn_construction': libcdn_construction,
+    'libcdn_macro1': libcdn_macro1,
+    'http_get_cdn_prefix': http_get_cdn_prefix,
+}
+
+
+def measure(call, duration=DEFAULT_DURATION):
+    """
+    time each call for duration seconds
+    :return: dict of calls, ops_per_sec, p50/p90/p99 latency ns, peak_alloc_bytes
+    """
+    for _ in range(WARMUP_CALLS):
+        call()
+    samples = []
+    clock = time.perf_counter_ns
+    deadline = clock() + int(duration * 1e9)
+    while clock() < deadline:
+        start = clock()
+        call()
+        samples.append(clock() - start)
+    samples.sort()
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(ALLOC_CALLS):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+    tracemalloc.stop()
+
+    return {
+        'calls': len(samples),
+        'ops_per_sec': round(len(samples) / (sum(samples) / 1e9)),
+        'p50_ns': percentile(samples, 0.50),
+        'p90_ns': percentile(samples, 0.90),
+        'p99_ns': percentile(samples, 0.99),
+        'peak_alloc_bytes': sorted(peaks)[len(peaks) // 2],
+    }
+
+
+def run(names, duration=DEFAULT_DURATION):
+    results = {}
+    for name in names:
+        setup = HOT_PATHS[name]()
+        call, teardown = setup if isinstance(setup, tuple) else (setup, None)
+        try:
+            results[name] = measure(call, duration)
+        finally:
+            if teardown is not None:
+                teardown()
+        result = results[name]
+        print(
+            f"{name:24} {result['ops_per_sec']:>9} ops/s"
+            f"  p50 {result['p50_ns'] / 1e3:8.1f}us"
+            f"  p90 {result['p90_ns'] / 1e3:8.1f}us"
+            f"  p99 {result['p99_ns'] / 1e3:8.1f}us"
+            f"  peak alloc {result['peak_alloc_bytes']:>7}B"
+        )
+    return results
+
+
+def check(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    :return: list of the hot paths whose ops/sec dropped by more than threshold
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]['ops_per_sec']
+        change = result['ops_per_sec'] / reference - 1
+        status = 'REGRESSION' if change < -threshold else 'ok'
+        print(f"{name:24} {change:+7.1%} ops/s against baseline  {status}")
+        if status != 'ok':
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('hot_paths', nargs='*', help=f"among {', '.join(HOT_PATHS)}, default all")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help='seconds per hot path')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='tolerated ops/sec drop')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args(argv)
+    for name in args.hot_paths:
+        if name not in HOT_PATHS:
+            parser.error(f"unknown hot path {name}")
+    if args.check and not args.save_baseline and not os.path.exists(args.baseline):
+        # checked before the run, the baseline is machine specific and not versioned
+        parser.error(f"no baseline {args.baseline} to check against, save one first with --save-baseline")
+
+    logger.setLevel(WARNING)
+    results = run(args.hot_paths or list(HOT_PATHS), args.duration)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"baseline saved in {args.baseline}")
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if check(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
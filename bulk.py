@@ -0,0 +1,152 @@
+"""
+bounded concurrency execution of a client macro over many inputs
+use:
+    run = libcdn.bulk('listall_node_names', ip_address_ids, max_workers=16)
+    for outcome in run:           # streamed as they complete
+        if not outcome.ok:
+            ...
+    run.report()
+the macro is a client method name, called with each input as single argument,
+or a function(client, input). Thread workers share the client and its
+credentials provider, and run each macro in a copy of the caller context
+(AuthContext, current span). Process workers get a copy of the client once,
+at start: the client and a macro function must be picklable
+"""
+import contextvars
+import time
+
+DEFAULT_BULK_WORKERS = 8
+EXHAUSTED = object()
+# concurrent.futures, and multiprocessing for the process pool, are imported by the first run
+EXECUTORS = ('thread', 'process')
+
+
+class BulkOutcome():
+    __slots__ = ('input', 'result', 'error', 'elapsed')
+
+    def __init__(self, input, result, error, elapsed):
+        self.input = input
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        status = f"result={self.result!r}" if self.ok else f"error={self.error!r}"
+        return f"BulkOutcome(input={self.input!r}, {status}, elapsed={self.elapsed:.6f})"
+
+
+def run_macro(client, macro, item):
+    """
+    :return: (result, error, elapsed seconds), errors are returned and not raised
+    """
+    start = time.perf_counter()
+    try:
+        if isinstance(macro, str):
+            result = getattr(client, macro)(item)
+        else:
+            result = macro(client, item)
+        return result, None, time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+
+# client copy of a process worker
+worker_client = None
+
+
+def init_worker(client):
+    global worker_client
+    worker_client = client
+
+
+def run_worker_macro(macro, item):
+    return run_macro(worker_client, macro, item)
+
+
+class BulkRun():
+    """
+    iterate to run: at most max_workers macros run concurrently, and at most
+    max_pending inputs are read ahead of the results consumption (backpressure)
+    """
+    def __init__(self, client, macro, inputs, max_workers=DEFAULT_BULK_WORKERS, executor='thread', max_pending=None):
+        if executor not in EXECUTORS:
+            raise ValueError(f"executor must be one of {', '.join(EXECUTORS)}, got {executor}")
+        if max_workers < 1:
+            raise ValueError(f"max_workers must be >= 1, got {max_workers}")
+        self.client = client
+        self.macro = macro
+        self.inputs = inputs
+        self.max_workers = max_workers
+        self.executor = executor
+        self.max_pending = max_pending or 2 * max_workers
+        self.succeeded = 0
+        self.failed = 0
+        self.errors = {}
+        self.started = None
+        self.finished = None
+
+    def _pool(self):
+        if self.executor == 'process':
+            from concurrent.futures import ProcessPoolExecutor
+            return ProcessPoolExecutor(self.max_workers, initializer=init_worker, initargs=(self.client,))
+        from concurrent.futures import ThreadPoolExecutor
+        return ThreadPoolExecutor(self.max_workers)
+
+    def _submit(self, pool, item):
+        if self.executor == 'process':
+            return pool.submit(run_worker_macro, self.macro, item)
+        return pool.submit(contextvars.copy_context().run, run_macro, self.client, self.macro, item)
+
+    def __iter__(self):
+        from concurrent.futures import FIRST_COMPLETED, wait
+        self.started = time.perf_counter()
+        pool = self._pool()
+        inputs = iter(self.inputs)
+        pending = {}
+        try:
+            while True:
+                while len(pending) < self.max_pending:
+                    item = next(inputs, EXHAUSTED)
+                    if item is EXHAUSTED:
+                        break
+                    pending[self._submit(pool, item)] = item
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    try:
+                        result, error, elapsed = future.result()
+                    except Exception as e:
+                        # the worker itself failed, e.g. an unpicklable result
+                        result, error, elapsed = None, e, 0.0
+                    yield self._count(BulkOutcome(item, result, error, elapsed))
+        finally:
+            self.finished = time.perf_counter()
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _count(self, outcome):
+        if outcome.ok:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+            name = type(outcome.error).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return outcome
+
+    def report(self):
+        end = self.finished or time.perf_counter()
+        elapsed = end - self.started if self.started else 0.0
+        total = self.succeeded + self.failed
+        return {
+            'total': total,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'errors': dict(self.errors),
+            'elapsed': elapsed,
+            'throughput': total / elapsed if elapsed else 0.0,
+        }
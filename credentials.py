@@ -0,0 +1,189 @@
+"""
+credentials providers: the default auth of the RestClient and RpcClient calls
+use:
+    client.credentials = CachedCredentialProvider(resolve, identity=get_identity, ttl=300)
+    client.credentials.auth()  # auth of the current identity
+resolve(identity) is the expensive resolution (flask request context, jwt
+identity, CdnCredentials...): it runs once per identity and ttl. The cached
+auth is read without lock, and refreshed in the background refresh_ahead
+before it expires so that the callers never wait for it
+per call auth of a long lived client:
+    client.credentials = CachedCredentialProvider(resolve, identity=context_identity)
+    with AuthContext(identity=user_id):     # or AuthContext(auth=auth)
+        client.macro1()
+the context is a contextvar: it is per thread and per asyncio task
+"""
+import contextvars
+from logging import getLogger
+import threading
+import time
+
+logger = getLogger()
+
+DEFAULT_CREDENTIALS_TTL = 300
+DEFAULT_REFRESH_AHEAD = 0.2
+DEFAULT_MAX_IDENTITIES = 10000
+# resolutions of the identities of a stripe are serialized, those of distinct stripes run concurrently
+RESOLVE_LOCK_STRIPES = 64
+
+# identity and auth of the current call, set by AuthContext
+current_identity = contextvars.ContextVar('current_identity', default=None)
+current_auth = contextvars.ContextVar('current_auth', default=None)
+
+
+def context_identity():
+    """identity function of a provider resolving the AuthContext identity"""
+    return current_identity.get()
+
+
+class AuthContext():
+    """
+    identity, or auth, of the client calls made in the with block
+    :param identity: resolved by a credentials provider built with identity=context_identity
+    :param auth: used as is, before any credentials provider or client auth
+    an explicit auth kwarg of a call still wins. The threads started in the
+    block do not inherit it, unless run in a copied context (contextvars.copy_context)
+    the asyncio tasks created in the block do
+    """
+    def __init__(self, identity=None, auth=None):
+        self.identity = identity
+        self.auth = auth
+        self.tokens = []
+
+    def __enter__(self):
+        # a stack of tokens: the same AuthContext can be nested
+        self.tokens.append((current_identity.set(self.identity), current_auth.set(self.auth)))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        identity_token, auth_token = self.tokens.pop()
+        current_auth.reset(auth_token)
+        current_identity.reset(identity_token)
+
+
+class StaticCredentials():
+    def __init__(self, auth):
+        self._auth = auth
+
+    def auth(self):
+        return self._auth
+
+
+class CachedToken():
+    __slots__ = ('auth', 'refresh_at', 'expires')
+
+    def __init__(self, auth, refresh_at, expires):
+        self.auth = auth
+        self.refresh_at = refresh_at
+        self.expires = expires
+
+
+class CachedCredentialProvider():
+    """
+    :param resolve: function(identity) -> auth, or (auth, ttl seconds)
+    :param identity: function() -> identity of the current caller, default a single None identity
+    :param ttl: default token ttl in seconds
+    :param refresh_ahead: fraction of the ttl, before expiry, when the background refresh starts
+    :param max_identities: tokens kept at most: beyond, the expired tokens are
+        dropped, then the least recently resolved ones. The identities in use
+        are refreshed every ttl, so the dropped ones are the idle ones
+    """
+    def __init__(self, resolve, identity=None, ttl=DEFAULT_CREDENTIALS_TTL,
+                 refresh_ahead=DEFAULT_REFRESH_AHEAD, max_identities=DEFAULT_MAX_IDENTITIES, clock=time.monotonic):
+        self.resolve = resolve
+        self.identity = identity
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.max_identities = max_identities
+        self.clock = clock
+        # in resolution order
+        self.tokens = {}
+        self.locks = [threading.Lock() for _ in range(RESOLVE_LOCK_STRIPES)]
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.resolutions = 0
+        self.background_refreshes = 0
+        self.evicted = 0
+
+    def auth(self):
+        return self.get(None if self.identity is None else self.identity())
+
+    def get(self, identity):
+        # lock free hot path: tokens are replaced, never mutated
+        token = self.tokens.get(identity)
+        if token is not None:
+            now = self.clock()
+            if now < token.refresh_at:
+                return token.auth
+            if now < token.expires:
+                self._refresh_in_background(identity)
+                return token.auth
+        return self._resolve(identity).auth
+
+    def invalidate(self, identity=None):
+        with self.lock:
+            self.tokens.pop(identity, None)
+
+    def clear(self):
+        with self.lock:
+            self.tokens.clear()
+
+    def _identity_lock(self, identity):
+        return self.locks[hash(identity) % RESOLVE_LOCK_STRIPES]
+
+    def _store(self, identity, token):
+        with self.lock:
+            # moved to the end: the least recently resolved tokens come first
+            self.tokens.pop(identity, None)
+            self.tokens[identity] = token
+            self.resolutions += 1
+            if len(self.tokens) <= self.max_identities:
+                return
+            now = self.clock()
+            expired = [key for key, cached in self.tokens.items() if cached.expires <= now]
+            for key in expired:
+                del self.tokens[key]
+            oldest = list(self.tokens)[:max(0, len(self.tokens) - self.max_identities)]
+            for key in oldest:
+                del self.tokens[key]
+            self.evicted += len(expired) + len(oldest)
+
+    def _resolve(self, identity, force=False):
+        """one resolution per identity at a time, the concurrent callers reuse it"""
+        with self._identity_lock(identity):
+            token = self.tokens.get(identity)
+            if not force and token is not None and self.clock() < token.expires:
+                return token
+            resolved = self.resolve(identity)
+            auth, ttl = resolved if isinstance(resolved, tuple) else (resolved, self.ttl)
+            now = self.clock()
+            token = CachedToken(auth, now + ttl * (1 - self.refresh_ahead), now + ttl)
+            self._store(identity, token)
+            return token
+
+    def _refresh_in_background(self, identity):
+        with self.lock:
+            if identity in self.refreshing:
+                return
+            self.refreshing.add(identity)
+            self.background_refreshes += 1
+        threading.Thread(target=self._refresh, args=(identity,), daemon=True).start()
+
+    def _refresh(self, identity):
+        try:
+            self._resolve(identity, force=True)
+        except Exception as e:
+            # keep the current token until it expires, the next caller retries
+            logger.warning(f"background credentials refresh of {identity!r} failed: {e!r}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(identity)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'identities': len(self.tokens),
+                'resolutions': self.resolutions,
+                'background_refreshes': self.background_refreshes,
+                'evicted': self.evicted,
+            }
@@ -0,0 +1,326 @@
+"""
+session based http transport with per host keep-alive connection pools
+use:
+    session = HttpSession(max_pool_size=10, idle_timeout=30)
+    session.prewarm('http://contentd:8000', 4)
+    client.rest_transport = session
+    client.rpc_transport = XmlRpcRequest
+HttpSession exposes the RestRequest get, post, put, delete signature,
+XmlRpcRequest the RpcRequest one, sending xmlrpc calls on an HttpSession
+a 5xx answer raises HttpServerError, an HTTPException: the retry policies
+and circuit breakers count it as a backend failure
+"""
+from http.client import (
+    HTTPConnection,
+    HTTPException,
+    HTTPSConnection,
+)
+import select
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+from _do_operation import (
+    IDEMPOTENT_REST_METHODS,
+    MULTICALL_METHOD,
+    NOT_MODIFIED,
+    RPC_ENDPOINTS,
+)
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_IDLE_TIMEOUT = 30
+DEFAULT_TIMEOUT = 10
+
+
+class HttpServerError(HTTPException):
+    def __init__(self, status, body):
+        super().__init__(f"http {status}: {body[:200]}")
+        self.status = status
+        self.body = body
+
+
+class KeepAliveConnection(HTTPConnection):
+    """
+    http.client sends the headers and the body in two writes:
+    disable Nagle so the body does not wait for the delayed ack of the headers
+    """
+    def connect(self):
+        super().connect()
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class KeepAliveHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        super().connect()
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def connection_dropped(connection):
+    """
+    :return: True when the server closed the idle keep-alive connection: an
+        idle connection is readable only on its end of file
+    """
+    sock = connection.sock
+    if sock is None:
+        # closed on our side, http.client opens it again on the next request
+        return False
+    try:
+        if hasattr(select, 'poll'):
+            poller = select.poll()
+            poller.register(sock, select.POLLIN)
+            return bool(poller.poll(0))
+        return bool(select.select([sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+class ConnectionPool():
+    """
+    keep-alive connections to one (scheme, host, port)
+    at most max_size idle connections are kept, the last released is reused
+    first (LIFO), and connections idle for more than idle_timeout, or closed
+    by the server while idle, are closed
+    """
+    def __init__(self, scheme, host, port, max_size=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, timeout=DEFAULT_TIMEOUT, clock=time.monotonic):
+        self.connection_class = KeepAliveHTTPSConnection if scheme == 'https' else KeepAliveConnection
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.clock = clock
+        self.idle = []
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+        self.evicted = 0
+
+    def _new_connection(self):
+        with self.lock:
+            self.opened += 1
+        return self.connection_class(self.host, self.port, timeout=self.timeout)
+
+    def acquire(self):
+        """
+        :return: (connection, True if reused from the pool)
+        """
+        self.evict_idle()
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                connection, _ = self.idle.pop()
+            if not connection_dropped(connection):
+                with self.lock:
+                    self.reused += 1
+                return connection, True
+            with self.lock:
+                self.evicted += 1
+            connection.close()
+        return self._new_connection(), False
+
+    def release(self, connection):
+        with self.lock:
+            if len(self.idle) < self.max_size:
+                self.idle.append((connection, self.clock()))
+                return
+        connection.close()
+
+    def discard(self, connection):
+        connection.close()
+
+    def evict_idle(self):
+        deadline = self.clock() - self.idle_timeout
+        with self.lock:
+            expired = [connection for connection, last_used in self.idle if last_used <= deadline]
+            self.idle = [(connection, last_used) for connection, last_used in self.idle if last_used > deadline]
+            self.evicted += len(expired)
+        for connection in expired:
+            connection.close()
+
+    def prewarm(self, count):
+        """open count connections ahead of the first requests, up to max_size"""
+        with self.lock:
+            count = min(count, self.max_size - len(self.idle))
+        for _ in range(count):
+            connection = self._new_connection()
+            connection.connect()
+            self.release(connection)
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection, _ in idle:
+            connection.close()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'idle': len(self.idle),
+                'opened': self.opened,
+                'reused': self.reused,
+                'evicted': self.evicted,
+            }
+
+
+class HttpSession():
+    """
+    RestRequest-like transport sending real http requests on pooled connections
+    use:
+        response = session.<method>(auth, data, name, url, headers=None)
+        <method> in ('get', 'post', 'put', 'delete')
+    auth goes in the Authorization header, name in X-Client-Name
+    returns the response body, or NOT_MODIFIED on a 304 answer
+    """
+    def __init__(self, max_pool_size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT, timeout=DEFAULT_TIMEOUT):
+        self.max_pool_size = max_pool_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def pool(self, url):
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        pool = self.pools.get(key)
+        if pool is None:
+            with self.lock:
+                pool = self.pools.get(key)
+                if pool is None:
+                    pool = self.pools[key] = ConnectionPool(
+                        scheme, parts.hostname, port, self.max_pool_size, self.idle_timeout, self.timeout
+                    )
+        return pool
+
+    def prewarm(self, url, count):
+        self.pool(url).prewarm(count)
+
+    def request(self, method, auth, data, name, url, headers=None):
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        body = data.encode() if isinstance(data, str) else data
+        request_headers = {'Authorization': str(auth), 'X-Client-Name': str(name)}
+        if headers:
+            request_headers.update(headers)
+        pool = self.pool(url)
+        connection, reused = pool.acquire()
+        sent = False
+        try:
+            try:
+                connection.request(method.upper(), path, body=body, headers=request_headers)
+                sent = True
+                response = connection.getresponse()
+            except (HTTPException, ConnectionError):
+                pool.discard(connection)
+                # the server may have closed the reused connection between the
+                # drop check and the request: send it again on a new connection,
+                # unless it was written and may have been processed, for a post
+                if not reused or (sent and method not in IDEMPOTENT_REST_METHODS):
+                    raise
+                connection = pool._new_connection()
+                response = self._send(connection, method, path, body, request_headers)
+            # a body cut short leaves the connection mid response: it is not reused
+            payload = response.read()
+        except Exception:
+            pool.discard(connection)
+            raise
+        if response.will_close:
+            pool.discard(connection)
+        else:
+            pool.release(connection)
+        if response.status == 304:
+            return NOT_MODIFIED
+        if response.status >= 500:
+            raise HttpServerError(response.status, payload.decode(errors='replace'))
+        return payload.decode()
+
+    def _send(self, connection, method, path, body, headers):
+        connection.request(method.upper(), path, body=body, headers=headers)
+        return connection.getresponse()
+
+    def get(self, auth, data, name, url, headers=None):
+        return self.request('get', auth, data, name, url, headers)
+
+    def post(self, auth, data, name, url, headers=None):
+        return self.request('post', auth, data, name, url, headers)
+
+    def put(self, auth, data, name, url, headers=None):
+        return self.request('put', auth, data, name, url, headers)
+
+    def delete(self, auth, data, name, url, headers=None):
+        return self.request('delete', auth, data, name, url, headers)
+
+    def close(self):
+        with self.lock:
+            pools, self.pools = list(self.pools.values()), {}
+        for pool in pools:
+            pool.close()
+
+    def stats(self):
+        return {f"{pool.host}:{pool.port}": pool.stats() for pool in list(self.pools.values())}
+
+
+class XmlRpcRequest():
+    """
+    RpcRequest-like transport sending real xmlrpc requests to url
+    use:
+        client.rpc_transport = XmlRpcRequest
+        onev = XmlRpcRequest(name, url)
+        onev.<method>(auth, data, headers=None)
+        onev.multicall(auth, [(<method>, data), ...])
+    a call sends (auth, data) params and raises xmlrpc.client.Fault on a fault
+    answer; a multicall result holds a Fault instance for each failed call
+    :param session: HttpSession of the requests, default one per instance
+    """
+    def __init__(self, name, url, session=None):
+        self.name = name
+        self.url = url
+        self.session = session if session is not None else HttpSession()
+        self.methods = list(RPC_ENDPOINTS[name])
+        for method in self.methods:
+            setattr(self, method, self._rpc_method(method))
+
+    def _rpc_method(self, method):
+        def rpc_method(auth, data, headers=None):
+            return self.call(method, (auth, data), auth, headers)
+        rpc_method.__name__ = method
+        return rpc_method
+
+    def call(self, method, params, auth, headers=None):
+        """:return: result of the xmlrpc call method(*params)"""
+        # xmlrpc.client is imported by the first call and not by the rest only users
+        from xmlrpc.client import dumps, loads
+        body = dumps(params, method)
+        request_headers = {'Content-Type': 'text/xml', **headers} if headers else {'Content-Type': 'text/xml'}
+        response = self.session.request('post', auth, body, self.name, self.url, request_headers)
+        (result,), _ = loads(response)
+        return result
+
+    def multicall(self, auth, calls, headers=None):
+        from xmlrpc.client import Fault
+        results = self.call(
+            MULTICALL_METHOD,
+            ([{'methodName': method, 'params': [auth, data]} for method, data in calls],),
+            auth,
+            headers,
+        )
+        if not isinstance(results, list):
+            # a call level answer, e.g. unauthorized
+            return results
+        return [
+            result[0] if isinstance(result, list) else Fault(result['faultCode'], result['faultString'])
+            for result in results
+        ]
+
+    def close(self):
+        self.session.close()
+
+    def __reduce__(self):
+        # the built methods are closures and the session holds sockets
+        return type(self), (self.name, self.url)
@@ -0,0 +1,339 @@
+"""
+load generator of the Libcdn macros and of single Contentd/Onevsh endpoints
+use:
+    python loadgen.py macro1 --concurrency 16 --duration 30
+    python loadgen.py get_cdn_prefix --rate 500 --duration 60 --backend standin --latency 0.02
+    python loadgen.py lookup --rate 200 --backend standin --error-rate 0.01 --json after.json --compare before.json
+    python loadgen.py ListAll --backend remote --rest-url http://127.0.0.1:8000 --rpc-url http://127.0.0.1:8001
+modes:
+    --concurrency N   closed loop: N workers, each calling again as soon as its call returns
+    --rate R          open loop: calls start on a fixed schedule of R per second, on
+                      up to --concurrency workers (default RATE_WORKERS); a call
+                      latency counts from its scheduled start, so the time waited
+                      behind a saturated backend is measured and not hidden
+backends:
+    mock      the all_method mock transports, client overhead only
+    standin   RestStandin and RpcStandin started in this process, seeded, reached
+              over http with HttpSession and XmlRpcRequest, with --latency and faults
+    remote    the backends of --rest-url and --rpc-url (/onev, /cob and /plc), e.g.
+              stand-ins started apart, so that cpu_per_request is the client cost only
+each run first warms up for --warmup seconds, then reports throughput,
+p50/p90/p99/p999 latency, errors per type and process cpu per request: with
+the standin backend the cpu includes the stand-in threads. --json writes the
+report, --compare prints the changes against the report of an earlier run
+"""
+import argparse
+from itertools import count
+from logging import WARNING
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+from _do_operation import (
+    Libcdn,
+    logger,
+    response_status,
+    UNAUTHORIZED,
+)
+from macro_dag import (
+    Input,
+    Macro,
+    MacroStepError,
+    Step,
+)
+from percentiles import percentile
+
+BACKENDS = ('mock', 'standin', 'remote')
+DEFAULT_DURATION = 10.0
+DEFAULT_WARMUP = 1.0
+DEFAULT_CONCURRENCY = 1
+# open loop workers: a rate whose calls outlast RATE_WORKERS / rate seconds starts late
+RATE_WORKERS = 64
+# stand-in state, the targets spread their calls over it
+PREFIXES = 100
+ADDRESSES = 50
+PERCENTILES = (('p50', 0.50), ('p90', 0.90), ('p99', 0.99), ('p999', 0.999))
+
+LOOKUP_MACRO = Macro('lookup', [
+    Step('prefix', 'get_cdn_prefix', cdn_prefix_id=Input('cdn_prefix_id')),
+    Step('nodes', 'listall_node_names', Input('ip_address_id')),
+], output='prefix')
+
+
+def node_filter(i):
+    return {'object_type': 'IpAddress', 'filter_attrs': {'ip_address_id': i % ADDRESSES}, 'return_attrs': ['type']}
+
+
+# target: function(libcdn, i) of the call number i
+TARGETS = {
+    'macro1': lambda libcdn, i: libcdn.macro1(),
+    'lookup': lambda libcdn, i: libcdn.run_macro(
+        LOOKUP_MACRO, {'cdn_prefix_id': i % PREFIXES + 1, 'ip_address_id': i % ADDRESSES},
+    ).result,
+    'get_cdn_prefix': lambda libcdn, i: libcdn.get_cdn_prefix(cdn_prefix_id=i % PREFIXES + 1),
+    'update_cdn_prefix': lambda libcdn, i: libcdn.update_cdn_prefix(
+        cdn_prefix_id=i % PREFIXES + 1, data={'prefix': f"cdn{i % PREFIXES + 1}.example.com"},
+    ),
+    'listall_node_names': lambda libcdn, i: libcdn.listall_node_names(i % ADDRESSES),
+    'ListAll': lambda libcdn, i: libcdn.ListAll(data=node_filter(i)),
+    'GetPersons': lambda libcdn, i: libcdn.GetPersons(
+        data={'person_filter': {'email': f"user{i % ADDRESSES}@example.com"}},
+    ),
+}
+
+
+class Backend():
+    """
+    the Libcdn of a run and the servers and sessions to stop after it
+    """
+    def __init__(self, args):
+        self.servers = []
+        self.sessions = []
+        if args.backend == 'mock':
+            self.client = Libcdn('contentd', 'amc_url', 'onev_url', 'cob_url', 'plc_url')
+            return
+        # the http modules are only imported by the http backends
+        from functools import partial
+        from http_transport import HttpSession, XmlRpcRequest
+        if args.backend == 'standin':
+            from standin_servers import Faults, LogNormalLatency, RestStandin, RpcStandin
+            options = {
+                'latency': LogNormalLatency(args.latency) if args.latency else None,
+                'faults': Faults(error_rate=args.error_rate, drop_rate=args.drop_rate),
+                'seed': args.seed,
+            }
+            rest = RestStandin(**options).start()
+            rest.state.seed(PREFIXES)
+            rpc = RpcStandin(**options).start()
+            for ip_address_id in range(ADDRESSES):
+                rpc.state.Create({'object_type': 'IpAddress', 'data_attrs': {'ip_address_id': ip_address_id, 'type': 'edge'}})
+                rpc.state.AddPerson({'person_fields': {'email': f"user{ip_address_id}@example.com"}})
+            self.servers = [rest, rpc]
+            rest_url, rpc_urls = rest.url, rpc.rpc_urls
+        else:
+            rest_url = args.rest_url
+            rpc_urls = [f"{args.rpc_url.rstrip('/')}/{api}" for api in ('onev', 'cob', 'plc')]
+        # pools sized for the workers, no connection opened and closed per call
+        workers = args.concurrency or RATE_WORKERS
+        rest_session = HttpSession(max_pool_size=workers)
+        rpc_session = HttpSession(max_pool_size=workers)
+        self.sessions = [rest_session, rpc_session]
+        self.client = Libcdn('contentd', rest_url, *rpc_urls)
+        self.client.rest_transport = rest_session
+        self.client.rpc_transport = partial(XmlRpcRequest, session=rpc_session)
+
+    def stats(self):
+        """:return: {server: per endpoint stats} of the stand-ins"""
+        return {type(server).__name__: server.stats() for server in self.servers}
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
+        for server in self.servers:
+            server.stop()
+
+
+class Recorder():
+    """latencies and errors of the calls of one worker, merged at the end, without lock"""
+    def __init__(self):
+        self.latencies = []
+        self.service_times = []
+        self.errors = {}
+
+    def call(self, target, client, i, scheduled):
+        start = time.perf_counter()
+        try:
+            result = target(client, i)
+        except Exception as e:
+            # a failed macro step is counted by its backend error
+            name = type(e.error if isinstance(e, MacroStepError) else e).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+        else:
+            if response_status(result) == UNAUTHORIZED:
+                self.errors['unauthorized'] = self.errors.get('unauthorized', 0) + 1
+        end = time.perf_counter()
+        self.service_times.append(end - start)
+        self.latencies.append(end - (start if scheduled is None else scheduled))
+
+
+def closed_loop(target, client, recorder, calls, deadline):
+    while time.perf_counter() < deadline:
+        recorder.call(target, client, next(calls), None)
+
+
+def open_loop(target, client, recorder, calls, deadline, start, rate):
+    while True:
+        # next() of itertools.count is atomic: each schedule slot goes to one worker
+        i = next(calls)
+        scheduled = start + i / rate
+        if scheduled >= deadline:
+            return
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        recorder.call(target, client, i, scheduled)
+
+
+def run_phase(target, client, duration, concurrency, rate=None):
+    """
+    :return: (recorders, elapsed seconds, process cpu seconds) of duration seconds of load
+    """
+    workers = concurrency or (RATE_WORKERS if rate else DEFAULT_CONCURRENCY)
+    recorders = [Recorder() for _ in range(workers)]
+    calls = count()
+    cpu = time.process_time()
+    start = time.perf_counter()
+    deadline = start + duration
+    if rate:
+        threads = [
+            threading.Thread(target=open_loop, args=(target, client, recorder, calls, deadline, start, rate))
+            for recorder in recorders
+        ]
+    else:
+        threads = [
+            threading.Thread(target=closed_loop, args=(target, client, recorder, calls, deadline))
+            for recorder in recorders
+        ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorders, time.perf_counter() - start, time.process_time() - cpu
+
+
+def distribution(samples):
+    """:return: {p50, p90, p99, p999, max, mean} in ms of the seconds samples"""
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    result = {name: round(percentile(samples, rate) * 1e3, 3) for name, rate in PERCENTILES}
+    result['max'] = round(samples[-1] * 1e3, 3)
+    result['mean'] = round(sum(samples) / len(samples) * 1e3, 3)
+    return result
+
+
+def report(args, recorders, elapsed, cpu):
+    latencies = [latency for recorder in recorders for latency in recorder.latencies]
+    errors = {}
+    for recorder in recorders:
+        for name, number in recorder.errors.items():
+            errors[name] = errors.get(name, 0) + number
+    requests = len(latencies)
+    failed = sum(errors.values())
+    result = {
+        'target': args.target,
+        'backend': args.backend,
+        'mode': 'open' if args.rate else 'closed',
+        'rate': args.rate,
+        'concurrency': args.concurrency or (RATE_WORKERS if args.rate else DEFAULT_CONCURRENCY),
+        'duration': round(elapsed, 3),
+        'requests': requests,
+        'throughput': round(requests / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': distribution(latencies),
+        'errors': errors,
+        'error_rate': round(failed / requests, 6) if requests else 0.0,
+        'cpu_per_request_us': round(cpu / requests * 1e6, 1) if requests else 0.0,
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'started': round(time.time() - elapsed, 3),
+    }
+    if args.rate:
+        # latency without the wait for a free worker: a gap with latency_ms means saturation
+        result['service_ms'] = distribution(
+            [service for recorder in recorders for service in recorder.service_times]
+        )
+    if args.backend == 'standin':
+        result['latency'] = args.latency
+        result['faults'] = {'error_rate': args.error_rate, 'drop_rate': args.drop_rate}
+    return result
+
+
+def print_report(result):
+    latency = result['latency_ms']
+    print(
+        f"loadgen {result['target']}: {result['backend']} backend, {result['mode']} loop,"
+        f" concurrency {result['concurrency']}"
+        + (f", rate {result['rate']}/s" if result['rate'] else '')
+        + f", {result['duration']:.1f}s"
+    )
+    print(f"    {'requests':12} {result['requests']:>10}  throughput {result['throughput']:.1f}/s")
+    if latency:
+        print('    ' + f"{'latency ms':12} " + '  '.join(f"{name} {latency[name]:.3f}" for name in (*dict(PERCENTILES), 'max')))
+    if result.get('service_ms'):
+        service = result['service_ms']
+        print('    ' + f"{'service ms':12} " + '  '.join(f"{name} {service[name]:.3f}" for name in (*dict(PERCENTILES), 'max')))
+    errors = ', '.join(f"{name} {number}" for name, number in sorted(result['errors'].items()))
+    print(f"    {'errors':12} {result['error_rate']:>10.3%}  {errors}")
+    print(f"    {'cpu':12} {result['cpu_per_request_us']:>10.1f} us/request")
+
+
+def compare(result, reference):
+    """print the changes of result against the reference run report"""
+    print(f"    against {reference['target']} on {reference['backend']}, {reference['requests']} requests:")
+    rows = [('throughput', result['throughput'], reference['throughput'])]
+    rows += [
+        (f"{name} ms", result['latency_ms'].get(name), reference['latency_ms'].get(name))
+        for name in (*dict(PERCENTILES), 'max')
+    ]
+    rows += [
+        ('error_rate', result['error_rate'], reference['error_rate']),
+        ('cpu us', result['cpu_per_request_us'], reference['cpu_per_request_us']),
+    ]
+    for name, value, before in rows:
+        if value is None or before is None:
+            continue
+        change = f"{value / before - 1:+7.1%}" if before else ''
+        print(f"    {name:12} {before:>12} -> {value:<12} {change}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('target', choices=list(TARGETS))
+    parser.add_argument('--backend', choices=BACKENDS, default='mock')
+    parser.add_argument('--rate', type=float, help='calls started per second, open loop')
+    parser.add_argument('--concurrency', type=int, help=f"workers, default {DEFAULT_CONCURRENCY}, or {RATE_WORKERS} with --rate")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help='seconds of measured load')
+    parser.add_argument('--warmup', type=float, default=DEFAULT_WARMUP, help='seconds of load before the measure')
+    parser.add_argument('--latency', type=float, default=0.0, help='standin median latency in seconds, log normal')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='standin 503 answers rate')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='standin dropped connections rate')
+    parser.add_argument('--seed', type=int, help='standin latency and faults random seed')
+    parser.add_argument('--rest-url', help='remote contentd url')
+    parser.add_argument('--rpc-url', help='remote url of the /onev, /cob and /plc apis')
+    parser.add_argument('--json', help='write the report to this file')
+    parser.add_argument('--compare', help='report json file of an earlier run')
+    args = parser.parse_args(argv)
+    if args.rate is not None and args.rate <= 0:
+        parser.error('--rate must be > 0')
+    if args.concurrency is not None and args.concurrency < 1:
+        parser.error('--concurrency must be >= 1')
+    if args.backend == 'remote' and not (args.rest_url and args.rpc_url):
+        parser.error('the remote backend needs --rest-url and --rpc-url')
+
+    logger.setLevel(WARNING)
+    target = TARGETS[args.target]
+    backend = Backend(args)
+    try:
+        if args.warmup > 0:
+            run_phase(target, backend.client, args.warmup, args.concurrency, args.rate)
+        recorders, elapsed, cpu = run_phase(target, backend.client, args.duration, args.concurrency, args.rate)
+        result = report(args, recorders, elapsed, cpu)
+        if backend.servers:
+            result['standin'] = backend.stats()
+    finally:
+        backend.close()
+    print_report(result)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,470 @@
+"""
+macros declared as a graph of backend steps, run with maximal parallelism
+use:
+    PROVISION = Macro('provision', [
+        Step('prefix', 'get_cdn_prefix', cdn_prefix_id=Input('cdn_prefix_id')),
+        Step('node', 'Create', data={'object_type': 'Node', 'data_attrs': Input('node')}),
+        Step('ip', 'Create', data={'object_type': 'IpAddress', 'data_attrs': Input('ip')}),
+        # Create answers the id of the new object
+        Step('bind', 'Bind', data={
+            '1st_object_type': 'Node', '1st_object_id': Ref('node'),
+            '2nd_object_type': 'IpAddress', '2nd_object_id': Ref('ip'),
+        }),
+    ], output='bind')
+    run = libcdn.run_macro(PROVISION, {'cdn_prefix_id': 5, 'node': {...}, 'ip': {...}})
+    run.result, run.results['prefix'], run.report()
+a step runs as soon as the steps it refers to are done: above, prefix, node
+and ip run together, then bind. A step is a client method name, or a
+function(client, *args, **kwargs), and its arguments may hold Ref to the
+result of another step and Input of the run inputs, at any depth of dicts,
+lists and tuples
+within a run, the read steps (RPC_READ_METHODS and get endpoints) with the
+same call and arguments are run once and share their result
+sync clients run the steps on a thread pool, in copies of the caller context
+(AuthContext, current span), async clients run them as asyncio tasks. The
+thread pool of a client is built by its first run and shared by the next ones
+"""
+import contextvars
+import threading
+import time
+import weakref
+
+from response_cache import request_key
+from tracing import INTERNAL
+
+DEFAULT_MACRO_WORKERS = 16
+# threads of the pool of a client, shared by its concurrent runs
+DEFAULT_CLIENT_WORKERS = 32
+
+# client -> its step thread pool, dropped with the client: the client stays picklable
+client_executors = weakref.WeakKeyDictionary()
+executors_lock = threading.Lock()
+worker_state = threading.local()
+
+
+def mark_step_worker():
+    worker_state.step_worker = True
+
+
+def client_executor(client):
+    """
+    :return: ThreadPoolExecutor of the steps of client, built on first use,
+        None in a step thread: a macro run by a step gets its own pool, it
+        would otherwise wait for the pool threads it holds
+    """
+    if getattr(worker_state, 'step_worker', False):
+        return None
+    executor = client_executors.get(client)
+    if executor is None:
+        with executors_lock:
+            executor = client_executors.get(client)
+            if executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                executor = client_executors[client] = ThreadPoolExecutor(
+                    getattr(client, 'macro_workers', DEFAULT_CLIENT_WORKERS),
+                    thread_name_prefix='macro-step',
+                    initializer=mark_step_worker,
+                )
+    return executor
+
+
+class Ref():
+    """
+    result of the step named step, as a step argument
+    :param transform: function(result) giving the argument, e.g. an id out of a Create result
+    """
+    __slots__ = ('step', 'transform')
+
+    def __init__(self, step, transform=None):
+        self.step = step
+        self.transform = transform
+
+    def __repr__(self):
+        return f"Ref({self.step!r})"
+
+
+class Input():
+    """run input named name, as a step argument"""
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"Input({self.name!r})"
+
+
+def placeholders(value, refs, inputs):
+    """
+    collect the Ref step names and Input names of a step argument
+    :return: True when value holds at least one placeholder
+    """
+    if isinstance(value, Ref):
+        refs.add(value.step)
+        return True
+    if isinstance(value, Input):
+        inputs.add(value.name)
+        return True
+    # lists and not generators: every placeholder is collected, not only the first one
+    if isinstance(value, dict):
+        return any([placeholders(item, refs, inputs) for item in value.values()])
+    if isinstance(value, (list, tuple)):
+        return any([placeholders(item, refs, inputs) for item in value])
+    return False
+
+
+def resolve(value, results, inputs):
+    """:return: value with its Ref and Input replaced"""
+    if isinstance(value, Ref):
+        result = results[value.step]
+        return result if value.transform is None else value.transform(result)
+    if isinstance(value, Input):
+        return inputs[value.name]
+    if isinstance(value, dict):
+        return {key: resolve(item, results, inputs) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve(item, results, inputs) for item in value]
+    if isinstance(value, tuple):
+        return tuple(resolve(item, results, inputs) for item in value)
+    return value
+
+
+class Step():
+    """
+    :param name: step name, unique in its macro, key of its result
+    :param call: client method name, or function(client, *args, **kwargs)
+    :param args, kwargs: call arguments, with Ref and Input placeholders
+    :param after: names of the steps to run before this one, without using their result
+    :param memoize: share the result with the steps of the run with the same call
+        and arguments, default True for the client reads (methods with is_read)
+    """
+    __slots__ = ('name', 'call', 'args', 'kwargs', 'depends', 'inputs', 'static', 'memoize')
+
+    def __init__(self, name, call, *args, after=(), memoize=None, **kwargs):
+        self.name = name
+        self.call = call
+        self.args = args
+        self.kwargs = kwargs
+        refs, inputs = set(after), set()
+        # arguments without placeholder are not resolved at each run
+        self.static = not placeholders((args, kwargs), refs, inputs)
+        self.depends = frozenset(refs)
+        self.inputs = frozenset(inputs)
+        self.memoize = memoize
+
+    def arguments(self, results, inputs):
+        """:return: (args, kwargs) of the call, placeholders replaced"""
+        if self.static:
+            return self.args, self.kwargs
+        return resolve(self.args, results, inputs), resolve(self.kwargs, results, inputs)
+
+    def __repr__(self):
+        return f"Step({self.name!r}, {self.call!r})"
+
+
+class Macro():
+    """
+    :param name: macro name, for the spans and errors
+    :param steps: list of Step, in any order
+    :param output: name of the step giving the run result, or function(results)
+        building it from the {step name: result} dict, default that dict
+    the graph is checked and ordered once, at declaration
+    """
+    def __init__(self, name, steps, output=None):
+        self.name = name
+        self.steps = {}
+        for step in steps:
+            if step.name in self.steps:
+                raise ValueError(f"macro {name}: duplicate step {step.name}")
+            self.steps[step.name] = step
+        self.dependents = {step_name: [] for step_name in self.steps}
+        for step in steps:
+            unknown = sorted(step.depends - self.steps.keys())
+            if unknown:
+                raise ValueError(f"macro {name}: step {step.name} refers to unknown steps {', '.join(unknown)}")
+            for depend in step.depends:
+                self.dependents[depend].append(step.name)
+        if isinstance(output, str) and output not in self.steps:
+            raise ValueError(f"macro {name}: unknown output step {output}")
+        self.output = output
+        self.order = self._order()
+        self.roots = tuple(step_name for step_name in self.order if not self.steps[step_name].depends)
+        self.inputs = frozenset().union(*(step.inputs for step in steps))
+
+    def _order(self):
+        """:return: tuple of the step names in a topological order, raise ValueError on a cycle"""
+        waiting = {step_name: len(step.depends) for step_name, step in self.steps.items()}
+        ready = [step_name for step_name, count in waiting.items() if not count]
+        order = []
+        while ready:
+            step_name = ready.pop(0)
+            order.append(step_name)
+            for dependent in self.dependents[step_name]:
+                waiting[dependent] -= 1
+                if not waiting[dependent]:
+                    ready.append(dependent)
+        if len(order) < len(self.steps):
+            cycle = sorted(set(self.steps) - set(order))
+            raise ValueError(f"macro {self.name}: cycle between steps {', '.join(cycle)}")
+        return tuple(order)
+
+    def __repr__(self):
+        return f"Macro({self.name!r}, {len(self.steps)} steps)"
+
+
+class MacroStepError(Exception):
+    """a step failed: its run is in run, with the results of the steps done"""
+    def __init__(self, macro, step, error, run):
+        super().__init__(f"macro {macro} step {step} failed: {type(error).__name__}: {error}")
+        self.step = step
+        self.error = error
+        self.run = run
+
+
+class StepTiming():
+    __slots__ = ('start', 'elapsed', 'memoized')
+
+    def __init__(self, start, elapsed, memoized):
+        self.start = start
+        self.elapsed = elapsed
+        self.memoized = memoized
+
+    def __repr__(self):
+        return f"StepTiming(start={self.start:.6f}, elapsed={self.elapsed:.6f}, memoized={self.memoized})"
+
+
+def call_step(client, step, args, kwargs):
+    if isinstance(step.call, str):
+        return getattr(client, step.call)(*args, **kwargs)
+    return step.call(client, *args, **kwargs)
+
+
+def timed_step(started, client, step, args, kwargs):
+    """:return: (result, start and elapsed seconds since the run start), run in a pool thread"""
+    start = time.perf_counter()
+    result = call_step(client, step, args, kwargs)
+    return result, start - started, time.perf_counter() - start
+
+
+async def async_timed_step(started, client, step, args, kwargs):
+    start = time.perf_counter()
+    result = call_step(client, step, args, kwargs)
+    if hasattr(result, '__await__'):
+        result = await result
+    return result, start - started, time.perf_counter() - start
+
+
+class MacroRun():
+    """
+    one run of macro on client, started by execute() or async_execute()
+    results: {step name: result}, timings: {step name: StepTiming}
+    """
+    def __init__(self, client, macro, inputs=None):
+        self.client = client
+        self.macro = macro
+        self.inputs = dict(inputs or {})
+        missing = sorted(macro.inputs - self.inputs.keys())
+        if missing:
+            raise ValueError(f"macro {macro.name}: missing inputs {', '.join(missing)}")
+        self.results = {}
+        self.timings = {}
+        self.started = None
+        self.finished = None
+        # memo key -> name of the first step of the key
+        self.memo = {}
+
+    @property
+    def result(self):
+        output = self.macro.output
+        if output is None:
+            return dict(self.results)
+        if isinstance(output, str):
+            return self.results[output]
+        return output(self.results)
+
+    def _memo_key(self, step, args, kwargs):
+        memoize = step.memoize
+        if memoize is None:
+            memoize = isinstance(step.call, str) and getattr(getattr(type(self.client), step.call, None), 'is_read', False)
+        return (step.call, request_key(args, kwargs)) if memoize else None
+
+    def _prepare(self, step_name):
+        """
+        :return: (step, args, kwargs, name of the first step of its memo key, None if it is this one)
+        """
+        step = self.macro.steps[step_name]
+        args, kwargs = step.arguments(self.results, self.inputs)
+        key = self._memo_key(step, args, kwargs)
+        first = None
+        if key is not None:
+            first = self.memo.setdefault(key, step_name)
+            if first == step_name:
+                first = None
+        return step, args, kwargs, first
+
+    def _prepare_or_raise(self, step_name):
+        """
+        _prepare, its errors (a failing Ref transform, a step argument that
+        cannot be keyed) raised as MacroStepError of the step
+        """
+        try:
+            return self._prepare(step_name)
+        except Exception as e:
+            raise MacroStepError(self.macro.name, step_name, e, self) from e
+
+    def _complete(self, step_name, result, start, elapsed, memoized=False):
+        """
+        :return: names of the dependent steps made ready
+        """
+        self.results[step_name] = result
+        self.timings[step_name] = StepTiming(start, elapsed, memoized)
+        ready = []
+        for dependent in self.macro.dependents[step_name]:
+            if all(depend in self.results for depend in self.macro.steps[dependent].depends):
+                ready.append(dependent)
+        return ready
+
+    def _start_span(self):
+        tracer = getattr(self.client, 'tracer', None)
+        if tracer is None:
+            return None
+        return tracer.start_span(
+            f"macro {self.macro.name}", INTERNAL, {'macro': self.macro.name, 'macro.steps': len(self.macro.steps)}
+        )
+
+    def execute(self, max_workers=DEFAULT_MACRO_WORKERS, executor=None):
+        """
+        run the steps of a sync client, at most max_workers at a time
+        :param executor: thread pool of the steps, shared with other runs,
+            default a pool of max_workers threads for this run only
+        :return: self, raise MacroStepError when a step fails, once the running steps are done
+        """
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+        span = self._start_span()
+        self.started = time.perf_counter()
+        pool = ThreadPoolExecutor(max_workers) if executor is None else executor
+        # future -> names of the steps waiting for it, the first one runs it
+        pending = {}
+        # memoized steps -> future of their first step
+        futures = {}
+        ready = list(self.macro.roots)
+        error = None
+        try:
+            while ready or pending:
+                while ready and len(pending) < max_workers:
+                    step_name = ready.pop(0)
+                    step, args, kwargs, first = self._prepare_or_raise(step_name)
+                    if first is None:
+                        future = pool.submit(
+                            contextvars.copy_context().run, timed_step, self.started, self.client, step, args, kwargs
+                        )
+                        futures[step_name] = future
+                        pending[future] = [step_name]
+                    elif first in self.results:
+                        ready.extend(self._complete(step_name, self.results[first], time.perf_counter() - self.started, 0.0, True))
+                    else:
+                        futures[step_name] = futures[first]
+                        pending[futures[first]].append(step_name)
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step_names = pending.pop(future)
+                    try:
+                        result, start, elapsed = future.result()
+                    except Exception as e:
+                        raise MacroStepError(self.macro.name, step_names[0], e, self) from e
+                    ready.extend(self._complete(step_names[0], result, start, elapsed))
+                    for step_name in step_names[1:]:
+                        ready.extend(self._complete(step_name, result, start, elapsed, True))
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.finished = time.perf_counter()
+            if executor is None:
+                pool.shutdown(wait=True, cancel_futures=True)
+            elif pending:
+                # the steps of a failed run: the queued ones are dropped, the running ones awaited
+                for future in pending:
+                    future.cancel()
+                wait(pending)
+            if span is not None:
+                # also resets the current span, whatever ended the run
+                span.end(error)
+        return self
+
+    async def async_execute(self, max_workers=DEFAULT_MACRO_WORKERS):
+        """
+        run the steps of an async client as asyncio tasks, at most max_workers at a time
+        :return: self, raise MacroStepError when a step fails, the running steps are cancelled
+        """
+        # already imported by the running event loop
+        import asyncio
+        span = self._start_span()
+        self.started = time.perf_counter()
+        pending = {}
+        tasks = {}
+        ready = list(self.macro.roots)
+        error = None
+        try:
+            while ready or pending:
+                while ready and len(pending) < max_workers:
+                    step_name = ready.pop(0)
+                    step, args, kwargs, first = self._prepare_or_raise(step_name)
+                    if first is None:
+                        task = asyncio.ensure_future(async_timed_step(self.started, self.client, step, args, kwargs))
+                        tasks[step_name] = task
+                        pending[task] = [step_name]
+                    elif first in self.results:
+                        ready.extend(self._complete(step_name, self.results[first], time.perf_counter() - self.started, 0.0, True))
+                    else:
+                        tasks[step_name] = tasks[first]
+                        pending[tasks[first]].append(step_name)
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    step_names = pending.pop(task)
+                    try:
+                        result, start, elapsed = task.result()
+                    except Exception as e:
+                        raise MacroStepError(self.macro.name, step_names[0], e, self) from e
+                    ready.extend(self._complete(step_names[0], result, start, elapsed))
+                    for step_name in step_names[1:]:
+                        ready.extend(self._complete(step_name, result, start, elapsed, True))
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.finished = time.perf_counter()
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+            if span is not None:
+                span.end(error)
+        return self
+
+    def critical_path(self):
+        """:return: names of the chain of steps ending last, each after its last ended dependency"""
+        ends = {step_name: timing.start + timing.elapsed for step_name, timing in self.timings.items()}
+        step_name = max(ends, key=ends.get, default=None)
+        path = []
+        while step_name is not None:
+            path.append(step_name)
+            depends = [depend for depend in self.macro.steps[step_name].depends if depend in ends]
+            step_name = max(depends, key=ends.get, default=None)
+        return path[::-1]
+
+    def report(self):
+        end = self.finished or time.perf_counter()
+        elapsed = end - self.started if self.started else 0.0
+        return {
+            'macro': self.macro.name,
+            'elapsed': elapsed,
+            # the steps run one after the other would have taken at least
+            'sequential': sum(timing.elapsed for timing in self.timings.values() if not timing.memoized),
+            'memoized': sum(timing.memoized for timing in self.timings.values()),
+            'critical_path': self.critical_path(),
+            'steps': {
+                step_name: {'start': timing.start, 'elapsed': timing.elapsed, 'memoized': timing.memoized}
+                for step_name, timing in self.timings.items()
+            },
+        }
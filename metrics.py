@@ -0,0 +1,143 @@
+"""
+per backend request counters and latency histograms
+use:
+    client.metrics = MetricsRegistry()
+    ...
+    client.metrics.render()   # prometheus text exposition
+RestClient._do_operation and RpcClient._do_rpc_operation observe every call:
+    backend: rest client_name (contentd), or rpc api (onev, cob, plc)
+    method:  rest '<method> <api_path>', or rpc method name
+    status:  authorized, unauthorized or error (the call raised)
+"""
+from bisect import bisect_left
+from collections import deque
+import threading
+
+AUTHORIZED = 'authorized'
+UNAUTHORIZED = 'unauthorized'
+ERROR = 'error'
+# latency histogram upper bounds, in seconds
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_METRICS_PREFIX = 'libcdn_backend'
+# observations queued lock free before being aggregated by the observing thread
+MAX_PENDING_OBSERVATIONS = 512
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class RequestSeries():
+    """
+    call count, latency sum and latency histogram of one (backend, method, status)
+    the observed latencies are appended to pending, thread safe without lock,
+    and aggregated in batches: bucket counts are stored per bucket and made
+    cumulative at render
+    """
+    __slots__ = ('labels', 'buckets', 'pending', 'counts', 'count', 'sum', 'lock')
+
+    def __init__(self, labels, buckets):
+        self.labels = labels
+        self.buckets = buckets
+        self.pending = deque()
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        self.pending.append(seconds)
+        if len(self.pending) >= MAX_PENDING_OBSERVATIONS:
+            self.aggregate()
+
+    def aggregate(self):
+        with self.lock:
+            pending, buckets, counts = self.pending, self.buckets, self.counts
+            total = 0.0
+            # only the observations queued so far, others may be appended meanwhile
+            size = len(pending)
+            for _ in range(size):
+                seconds = pending.popleft()
+                counts[bisect_left(buckets, seconds)] += 1
+                total += seconds
+            self.count += size
+            self.sum += total
+
+    def snapshot(self):
+        self.aggregate()
+        with self.lock:
+            return list(self.counts), self.count, self.sum
+
+
+class MetricsRegistry():
+    """
+    :param buckets: sorted latency histogram upper bounds in seconds, +Inf is implicit
+    :param prefix: metric names prefix
+    one registry can be shared by several clients, e.g. the Contentd and
+    Onevsh sides of a Libcdn
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix=DEFAULT_METRICS_PREFIX):
+        if list(buckets) != sorted(buckets):
+            raise ValueError(f"buckets must be sorted, got {buckets}")
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, backend, method, status, seconds):
+        series = self.series.get((backend, method, status))
+        if series is None:
+            series = self._new_series(backend, method, status)
+        # RequestSeries.observe inlined, it is on every backend call
+        pending = series.pending
+        pending.append(seconds)
+        if len(pending) >= MAX_PENDING_OBSERVATIONS:
+            series.aggregate()
+
+    def _new_series(self, backend, method, status):
+        key = (backend, method, status)
+        labels = f'backend="{escape_label(backend)}",method="{escape_label(method)}",status="{escape_label(status)}"'
+        with self.lock:
+            return self.series.setdefault(key, RequestSeries(labels, self.buckets))
+
+    def clear(self):
+        with self.lock:
+            self.series = {}
+
+    def stats(self):
+        """
+        :return: {(backend, method, status): {'count': n, 'sum': seconds}}
+        """
+        with self.lock:
+            series = dict(self.series)
+        stats = {}
+        for key, item in series.items():
+            _, count, total = item.snapshot()
+            stats[key] = {'count': count, 'sum': total}
+        return stats
+
+    def render(self):
+        """
+        :return: str prometheus text exposition format
+        """
+        with self.lock:
+            series = sorted(self.series.items())
+        requests = f"{self.prefix}_requests_total"
+        latency = f"{self.prefix}_request_duration_seconds"
+        snapshots = [(item.labels, *item.snapshot()) for _, item in series]
+        lines = [
+            f"# HELP {requests} Backend requests by backend, method and status.",
+            f"# TYPE {requests} counter",
+        ]
+        lines.extend(f"{requests}{{{labels}}} {count}" for labels, _, count, _ in snapshots)
+        lines.append(f"# HELP {latency} Backend request latency in seconds.")
+        lines.append(f"# TYPE {latency} histogram")
+        bounds = [repr(float(bucket)) for bucket in self.buckets] + ['+Inf']
+        for labels, counts, count, total in snapshots:
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                lines.append(f'{latency}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{latency}_sum{{{labels}}} {total!r}")
+            lines.append(f"{latency}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
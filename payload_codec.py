@@ -0,0 +1,85 @@
+"""
+pluggable rest payload codecs
+use:
+    contentd.codec = fastest_codec()   # orjson when installed, else stdlib json
+    contentd.update_cdn_prefix(5, data=already_encoded_bytes)   # passed through as is
+    contentd.decode_responses = True   # responses become LazyPayload
+"""
+import json
+
+# pre-serialized payloads, sent without being encoded or copied
+RAW_PAYLOAD_TYPES = (bytes, bytearray, memoryview)
+UNDECODED = object()
+NOT_IMPORTED = object()
+orjson = NOT_IMPORTED
+
+
+def load_orjson():
+    """
+    :return: orjson module, None when not installed
+    imported on first call and not at import, for the startup time
+    """
+    global orjson
+    if orjson is NOT_IMPORTED:
+        try:
+            import orjson as module
+        except ImportError:
+            module = None
+        orjson = module
+    return orjson
+
+
+class JsonCodec():
+    """stdlib json, encodes to str"""
+    name = 'json'
+
+    def __init__(self, compact=False):
+        self.separators = (',', ':') if compact else None
+        if compact:
+            self.name = 'json-compact'
+
+    def encode(self, obj):
+        return json.dumps(obj, separators=self.separators)
+
+    def decode(self, payload):
+        return json.loads(payload)
+
+
+class OrjsonCodec():
+    """orjson, encodes to bytes"""
+    name = 'orjson'
+
+    def __init__(self):
+        module = load_orjson()
+        if module is None:
+            raise ImportError("OrjsonCodec needs the orjson package: pip install orjson")
+        self.encode = module.dumps
+        self.decode = module.loads
+
+
+def fastest_codec():
+    return OrjsonCodec() if load_orjson() is not None else JsonCodec(compact=True)
+
+
+class LazyPayload():
+    """
+    raw response, decoded by codec on first access to value
+    """
+    __slots__ = ('raw', 'codec', '_value')
+
+    def __init__(self, raw, codec):
+        self.raw = raw
+        self.codec = codec
+        self._value = UNDECODED
+
+    @property
+    def value(self):
+        if self._value is UNDECODED:
+            self._value = self.codec.decode(self.raw)
+        return self._value
+
+    def __str__(self):
+        return self.raw if isinstance(self.raw, str) else bytes(self.raw).decode()
+
+    def __repr__(self):
+        return f"LazyPayload({self.raw!r})"
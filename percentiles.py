@@ -0,0 +1,14 @@
+"""
+nearest rank percentiles of sorted samples, shared by benchmark_suite and loadgen
+no dependency: importing it pulls neither the clients nor the stand-ins
+"""
+from math import ceil
+
+
+def percentile(samples, rate):
+    """
+    :param samples: sorted non empty list
+    :param rate: 0 < rate <= 1, e.g. 0.99
+    :return: smallest sample with at least rate of the samples <= it
+    """
+    return samples[max(0, ceil(len(samples) * rate) - 1)]
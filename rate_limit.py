@@ -0,0 +1,124 @@
+"""
+client side token bucket rate limiting per backend
+use:
+    client.rate_limiters = RateLimiters(backends={'cob': {'rate': 20, 'burst': 5}, 'contentd': {'rate': 100}})
+    client.rate_limiters.stats()   # calls, waits and time spent waiting per backend
+backend is the rest client_name, or the rpc api (onev, cob, plc) of RPC_ENDPOINTS;
+a backend without rate, and without default rate, is not limited
+"""
+import asyncio
+import threading
+import time
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, backend, wait):
+        super().__init__(f"rate limit of {backend}: a token in {wait:.3f}s is beyond max_wait")
+        self.backend = backend
+        self.wait = wait
+
+
+class TokenBucket():
+    """
+    :param rate: tokens per second
+    :param burst: bucket capacity, the calls allowed at once after an idle period, default max(1, rate)
+    :param max_wait: max seconds a call waits for its token, else RateLimitExceeded
+    the tokens are reserved in arrival order, the bucket going in debt, and the
+    callers sleep their wait outside of the lock: threads and asyncio tasks get
+    their turn first come first served
+    """
+    def __init__(self, backend, rate, burst=None, max_wait=None, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError(f"rate must be > 0, got {rate}")
+        self.backend = backend
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, rate)
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self.updated = clock()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.longest_wait = 0.0
+        self.rejected = 0
+
+    def reserve(self):
+        """
+        :return: seconds to wait before using the reserved token
+        """
+        with self.lock:
+            now = self.clock()
+            tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            self.updated = now
+            if self.max_wait is not None and wait > self.max_wait:
+                self.tokens = tokens
+                self.rejected += 1
+                raise RateLimitExceeded(self.backend, wait)
+            self.tokens = tokens - 1
+            self.calls += 1
+            if wait:
+                self.waited += 1
+                self.wait_seconds += wait
+                self.longest_wait = max(self.longest_wait, wait)
+            return wait
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            self.sleep(wait)
+        return wait
+
+    async def async_acquire(self):
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+    def stats(self):
+        with self.lock:
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'calls': self.calls,
+                'waited': self.waited,
+                'wait_seconds': self.wait_seconds,
+                'longest_wait': self.longest_wait,
+                'rejected': self.rejected,
+            }
+
+
+class RateLimiters():
+    """
+    one TokenBucket per backend
+    :param backends: {backend: TokenBucket kwargs} overriding the default kwargs
+    :param defaults: TokenBucket kwargs, with a rate to limit every backend
+    """
+    def __init__(self, backends=None, **defaults):
+        self.defaults = defaults
+        self.backends = dict(backends or {})
+        self.lock = threading.Lock()
+        self.buckets = {
+            backend: TokenBucket(backend, **{**defaults, **kwargs})
+            for backend, kwargs in self.backends.items()
+        }
+
+    def get(self, backend):
+        """
+        :return: TokenBucket of backend, None if it is not limited
+        """
+        bucket = self.buckets.get(backend)
+        if bucket is None and 'rate' in self.defaults:
+            with self.lock:
+                bucket = self.buckets.get(backend)
+                if bucket is None:
+                    bucket = self.buckets[backend] = TokenBucket(backend, **self.defaults)
+        return bucket
+
+    def stats(self):
+        with self.lock:
+            buckets = dict(self.buckets)
+        return {backend: bucket.stats() for backend, bucket in buckets.items()}
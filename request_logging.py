@@ -0,0 +1,79 @@
+import json
+from logging import (
+    getLogger,
+    INFO,
+)
+from random import random
+
+DEFAULT_MAX_PAYLOAD = 200
+
+
+def truncate(value, max_payload):
+    text = value if isinstance(value, str) else repr(value)
+    if max_payload and len(text) > max_payload:
+        return f"{text[:max_payload]}...({len(text)} chars)"
+    return text
+
+
+class RequestLogRecord():
+    """
+    log message of a backend request, only rendered when a handler formats it
+    """
+    __slots__ = ('title', 'fields', 'max_payload', 'structured')
+
+    def __init__(self, title, fields, max_payload, structured):
+        self.title = title
+        self.fields = fields
+        self.max_payload = max_payload
+        self.structured = structured
+
+    def __str__(self):
+        if self.structured:
+            return json.dumps(
+                {'event': self.title, **{
+                    name: truncate(value, self.max_payload) for name, value in self.fields.items()
+                }}
+            )
+        lines = [f"{name + ':':<14}{truncate(value, self.max_payload)}" for name, value in self.fields.items()]
+        return (
+            f"===============================\n"
+            f"{self.title}\n"
+            + "\n".join(lines) +
+            f"\n===============================\n"
+        )
+
+
+class RequestLogger():
+    """
+    level gated, sampled and lazily rendered logging of the backend requests
+    use:
+        client.request_logger = RequestLogger(sampling={'ListAll': 0.01}, structured=True)
+        if client.request_logger.enabled(endpoint):
+            client.request_logger.log(title, endpoint, method=method, result=result)
+    :param sampling: {endpoint: rate in [0, 1]}, endpoint is the rest api_path or the rpc method
+    :param max_payload: truncate the rendered values to max_payload chars, 0 to disable
+    :param structured: render one json object per request instead of a banner
+    the fields are also passed as extra={'request': fields} for structured handlers
+    """
+    def __init__(self, logger=None, level=INFO, sampling=None, default_sampling=1.0,
+                 max_payload=DEFAULT_MAX_PAYLOAD, structured=False):
+        self.logger = getLogger() if logger is None else logger
+        self.level = level
+        self.sampling = dict(sampling or {})
+        self.default_sampling = default_sampling
+        self.max_payload = max_payload
+        self.structured = structured
+
+    def enabled(self, endpoint):
+        if not self.logger.isEnabledFor(self.level):
+            return False
+        rate = self.sampling.get(endpoint, self.default_sampling)
+        return rate >= 1 or random() < rate
+
+    def log(self, title, endpoint, **fields):
+        self.logger.log(
+            self.level,
+            '%s',
+            RequestLogRecord(title, fields, self.max_payload, self.structured),
+            extra={'request': {'endpoint': endpoint, **fields}},
+        )
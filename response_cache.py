@@ -0,0 +1,149 @@
+from collections import OrderedDict
+import json
+import threading
+import time
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 60
+
+
+def key_default(obj):
+    if isinstance(obj, (bytearray, memoryview)):
+        return bytes(obj).hex()
+    return repr(obj)
+
+
+def request_key(*parts):
+    """hashable cache key of request parts that may hold dicts, lists or raw payloads"""
+    return json.dumps(parts, sort_keys=True, default=key_default)
+
+
+class CacheEntry():
+    __slots__ = ('value', 'etag', 'group', 'expires')
+
+    def __init__(self, value, etag, group, expires):
+        self.value = value
+        self.etag = etag
+        self.group = group
+        self.expires = expires
+
+
+class ResponseCache():
+    """
+    bounded LRU cache of backend read responses with per endpoint TTL
+    use:
+        client.cache = ResponseCache(max_size=1024, ttls={'ListAll': 5})
+    RestClient and RpcClient look the cache up on their reads and invalidate
+    the entries group on an authorized write:
+        rest: endpoint ttl name is the api_path, group is the endpoint url
+        rpc:  endpoint ttl name is the method, group is the api (onev, cob, plc)
+    a ttl of 0 disables caching for the endpoint
+    a read takes the cache generation() before its fetch and stores with it:
+    the store is skipped when its group was invalidated meanwhile
+    """
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, default_ttl=DEFAULT_CACHE_TTL, ttls=None, clock=time.monotonic):
+        if max_size < 1:
+            raise ValueError(f"max_size must be >= 1, got {max_size}")
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.groups = {}
+        # invalidations count, and group -> count at its last invalidation, at most max_size groups
+        self.invalidation_count = 0
+        self.invalidated = OrderedDict()
+        # newest count dropped from self.invalidated: the groups not in it are older
+        self.forgotten = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revalidations = 0
+        self.invalidations = 0
+
+    def ttl(self, endpoint):
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def lookup(self, key):
+        """
+        :return: (entry or None, True if the entry is fresh)
+        a stale entry is returned for ETag revalidation
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires > self.clock():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry, True
+            self.misses += 1
+            return entry, False
+
+    def generation(self):
+        """:return: stamp of a read about to fetch, given back to store"""
+        return self.invalidation_count
+
+    def store(self, key, value, endpoint, group, etag=None, generation=None):
+        """
+        :param generation: generation() taken before the fetch of value, None to store anyway
+        """
+        ttl = self.ttl(endpoint)
+        if ttl <= 0:
+            return
+        with self.lock:
+            if generation is not None and self.invalidated.get(group, self.forgotten) > generation:
+                # a write invalidated the group during the fetch: value may be stale
+                return
+            self._remove(key)
+            self.entries[key] = CacheEntry(value, etag, group, self.clock() + ttl)
+            self.groups.setdefault(group, set()).add(key)
+            while len(self.entries) > self.max_size:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def revalidated(self, key, entry, endpoint, generation=None):
+        """
+        the backend answered 304 Not Modified to the entry ETag: keep it one more ttl
+        :return: cached value
+        """
+        self.store(key, entry.value, endpoint, entry.group, entry.etag, generation)
+        with self.lock:
+            self.revalidations += 1
+        return entry.value
+
+    def invalidate(self, group):
+        with self.lock:
+            self.invalidation_count += 1
+            self.invalidated[group] = self.invalidation_count
+            self.invalidated.move_to_end(group)
+            if len(self.invalidated) > self.max_size:
+                _, self.forgotten = self.invalidated.popitem(last=False)
+            keys = self.groups.pop(group, ())
+            for key in keys:
+                del self.entries[key]
+            self.invalidations += len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.groups.clear()
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            keys = self.groups[entry.group]
+            keys.discard(key)
+            if not keys:
+                del self.groups[entry.group]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'revalidations': self.revalidations,
+                'invalidations': self.invalidations,
+            }
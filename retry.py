@@ -0,0 +1,270 @@
+"""
+retries with exponential backoff and per backend circuit breakers
+use:
+    client.retry_policy = RetryPolicy(max_attempts=3, base_delay=0.05)
+    client.circuit_breakers = CircuitBreakers(failure_rate=0.5, window=20, reset_timeout=30)
+only the idempotent requests are retried by default: rest get, put and delete,
+and the RPC_READ_METHODS (ListAll, GetSlices, GetPersons)
+a breaker opens when the failure rate of its last window calls crosses
+failure_rate: its backend calls then fail fast with CircuitOpenError until
+reset_timeout, after which half_open_calls trial calls close it or open it again
+every attempt also takes its token from the backend rate limiter, if any
+"""
+from collections import deque
+from random import uniform
+import threading
+import time
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 0.05
+DEFAULT_MAX_DELAY = 2.0
+# circuit breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def backend_errors():
+    """
+    :return: transport failures, retried and counted by the circuit breakers
+    http.client is imported by the first policy or breaker, not at import
+    """
+    from http.client import HTTPException
+    return (OSError, HTTPException)
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, backend, retry_in):
+        super().__init__(f"circuit breaker of {backend} is open, retry in {retry_in:.1f}s")
+        self.backend = backend
+        self.retry_in = retry_in
+
+
+class RetryPolicy():
+    """
+    :param max_attempts: calls per request, first one included
+    :param base_delay: backoff before the second attempt, in seconds, then multiplied
+        by multiplier per attempt up to max_delay
+    :param jitter: full jitter, sleep a random delay in [0, backoff] so that the
+        retries of concurrent callers do not hit the backend together
+    :param retry_on: retried exception types, default backend_errors()
+    :param retry_non_idempotent: also retry post, rpc writes and multicalls with a write
+    """
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, multiplier=2.0, jitter=True, retry_on=None,
+                 retry_non_idempotent=False, sleep=time.sleep):
+        if max_attempts < 1:
+            raise ValueError(f"max_attempts must be >= 1, got {max_attempts}")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.retry_on = backend_errors() if retry_on is None else retry_on
+        self.retry_non_idempotent = retry_non_idempotent
+        self.sleep = sleep
+
+    def backoff(self, attempt):
+        """:return: seconds to wait after the failed attempt number attempt (from 1)"""
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        return uniform(0, delay) if self.jitter else delay
+
+    def should_retry(self, error, idempotent, attempt):
+        return (
+            attempt < self.max_attempts
+            and isinstance(error, self.retry_on)
+            and (idempotent or self.retry_non_idempotent)
+        )
+
+
+class CircuitBreaker():
+    """
+    :param failure_rate: failed calls ratio of the window opening the breaker
+    :param window: number of last calls the failure rate is computed on
+    :param min_calls: no opening before min_calls calls in the window
+    :param reset_timeout: seconds open before the half open trial calls
+    :param failure_errors: exception types counted as failures, default
+        backend_errors(), the other exceptions mean that the backend answered
+    """
+    def __init__(self, backend, failure_rate=0.5, window=20, min_calls=10, reset_timeout=30.0,
+                 half_open_calls=1, failure_errors=None, clock=time.monotonic):
+        self.backend = backend
+        self.failure_rate = failure_rate
+        self.min_calls = min(min_calls, window)
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.failure_errors = backend_errors() if failure_errors is None else failure_errors
+        self.clock = clock
+        self.outcomes = deque(maxlen=window)
+        self.failures = 0
+        self.state = CLOSED
+        self.opened_at = None
+        self.trials = 0
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def before_call(self):
+        """raise CircuitOpenError when the call must fail fast"""
+        if self.state == CLOSED:
+            # lock free read of the usual state
+            return
+        with self.lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN:
+                retry_in = self.opened_at + self.reset_timeout - self.clock()
+                if retry_in > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.backend, retry_in)
+                self.state = HALF_OPEN
+                self.trials = 0
+            if self.trials >= self.half_open_calls:
+                self.rejected += 1
+                raise CircuitOpenError(self.backend, 0)
+            self.trials += 1
+
+    def record(self, failed):
+        with self.lock:
+            if self.state == HALF_OPEN:
+                if failed:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self.outcomes.clear()
+                    self.failures = 0
+                return
+            if self.state == OPEN:
+                # a call started before the opening
+                return
+            if len(self.outcomes) == self.outcomes.maxlen:
+                self.failures -= self.outcomes[0]
+            self.outcomes.append(failed)
+            self.failures += failed
+            if len(self.outcomes) >= self.min_calls and self.failures >= self.failure_rate * len(self.outcomes):
+                self._open()
+
+    def record_error(self, error):
+        self.record(isinstance(error, self.failure_errors))
+
+    def cancelled(self):
+        """a call was cancelled before its outcome: give its half open trial back"""
+        with self.lock:
+            if self.state == HALF_OPEN and self.trials:
+                self.trials -= 1
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = self.clock()
+        self.opened += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'calls': len(self.outcomes),
+                'failures': self.failures,
+                'opened': self.opened,
+                'rejected': self.rejected,
+            }
+
+
+class CircuitBreakers():
+    """
+    one CircuitBreaker per backend (rest client_name, or rpc api onev, cob, plc),
+    created on first use
+    :param backends: {backend: CircuitBreaker kwargs} overriding the default kwargs
+    """
+    def __init__(self, backends=None, **defaults):
+        self.defaults = defaults
+        self.backends = dict(backends or {})
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def get(self, backend):
+        breaker = self.breakers.get(backend)
+        if breaker is None:
+            with self.lock:
+                breaker = self.breakers.get(backend)
+                if breaker is None:
+                    kwargs = {**self.defaults, **self.backends.get(backend, {})}
+                    breaker = self.breakers[backend] = CircuitBreaker(backend, **kwargs)
+        return breaker
+
+    def stats(self):
+        with self.lock:
+            breakers = dict(self.breakers)
+        return {backend: breaker.stats() for backend, breaker in breakers.items()}
+
+
+def call_with_retry(request, args, kwargs, policy, breaker, idempotent, limiter=None):
+    """
+    :param policy: RetryPolicy or None
+    :param breaker: CircuitBreaker or None
+    :param idempotent: the request can be retried without side effect
+    :param limiter: rate_limit.TokenBucket or None
+    :return: request(*args, **kwargs)
+    """
+    attempt = 1
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+        if limiter is not None:
+            try:
+                limiter.acquire()
+            except BaseException:
+                # no call made: its half open trial is given back
+                if breaker is not None:
+                    breaker.cancelled()
+                raise
+        try:
+            result = request(*args, **kwargs)
+        except Exception as e:
+            if breaker is not None:
+                breaker.record_error(e)
+            if policy is None or not policy.should_retry(e, idempotent, attempt):
+                raise
+            policy.sleep(policy.backoff(attempt))
+            attempt += 1
+            continue
+        if breaker is not None:
+            breaker.record(False)
+        return result
+
+
+async def async_call_with_retry(request, args, kwargs, policy, breaker, idempotent, limiter=None):
+    """
+    call_with_retry of a coroutine function request, the backoff and the rate
+    limiter wait do not block the event loop
+    """
+    # already imported by the running event loop
+    import asyncio
+    attempt = 1
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+        if limiter is not None:
+            try:
+                await limiter.async_acquire()
+            except BaseException:
+                # over max_wait, or cancelled while waiting for the token
+                if breaker is not None:
+                    breaker.cancelled()
+                raise
+        try:
+            result = await request(*args, **kwargs)
+        except asyncio.CancelledError:
+            if breaker is not None:
+                breaker.cancelled()
+            raise
+        except Exception as e:
+            if breaker is not None:
+                breaker.record_error(e)
+            if policy is None or not policy.should_retry(e, idempotent, attempt):
+                raise
+            await asyncio.sleep(policy.backoff(attempt))
+            attempt += 1
+            continue
+        if breaker is not None:
+            breaker.record(False)
+        return result
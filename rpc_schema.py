@@ -0,0 +1,213 @@
+"""
+argument schemas of the xmlrpc methods, compiled once from RPC_ENDPOINTS
+use:
+    client.ListAll(data={'object_type': 'IpAddress', 'filter_attr': {}})
+    -> RpcArgumentError: onev.ListAll: unknown argument 'filter_attr', did you mean 'filter_attrs'?
+    client.rpc_schemas = RpcClient.rpc_schemas.as_trusted()   # encode only, no check
+    client.rpc_schemas = None                                  # data sent as is
+the data of every RpcClient call, and of every RpcBatch queued call, is checked
+locally before any round trip: unknown and missing arguments, argument types,
+and the xmlrpc marshalling limits (str dict keys, 32 bits ints, no None).
+It is then encoded as the dict of its declared arguments, in RPC_ENDPOINTS order
+"""
+# xmlrpc ints are signed 32 bits, see xmlrpc.client.MAXINT
+MAX_XMLRPC_INT = 2 ** 31 - 1
+MIN_XMLRPC_INT = -2 ** 31
+# marshalled without a walk, the other leaves (datetime, xmlrpc DateTime and
+# Binary) are checked on the slow path, their modules imported there
+XMLRPC_SCALARS = (str, bool, float, bytes, bytearray)
+
+
+class RpcArgumentError(ValueError):
+    def __init__(self, method, message):
+        super().__init__(f"{method}: {message}")
+        self.method = method
+
+
+def marshallable(value):
+    """
+    :return: True when value can be sent over xmlrpc
+    the exact builtin types are checked by identity, the rest by marshalling_error
+    """
+    kind = type(value)
+    if kind is str or kind is bool or kind is float:
+        return True
+    if kind is int:
+        return MIN_XMLRPC_INT <= value <= MAX_XMLRPC_INT
+    if kind is dict:
+        for key, item in value.items():
+            if type(key) is not str:
+                return False
+            kind = type(item)
+            if kind is str or kind is bool or kind is float:
+                continue
+            if kind is int:
+                if not MIN_XMLRPC_INT <= item <= MAX_XMLRPC_INT:
+                    return False
+            elif not marshallable(item):
+                return False
+        return True
+    if kind is list or kind is tuple:
+        for item in value:
+            kind = type(item)
+            if kind is str or kind is bool or kind is float:
+                continue
+            if kind is int:
+                if not MIN_XMLRPC_INT <= item <= MAX_XMLRPC_INT:
+                    return False
+            elif not marshallable(item):
+                return False
+        return True
+    return marshalling_error(value, '') is None
+
+
+def marshalling_error(value, path):
+    """
+    :param path: str argument path of value, for the message
+    :return: str reason why value cannot be sent over xmlrpc, None if it can
+    """
+    if isinstance(value, XMLRPC_SCALARS):
+        return None
+    if isinstance(value, int):
+        if MIN_XMLRPC_INT <= value <= MAX_XMLRPC_INT:
+            return None
+        return f"{path} = {value} is out of the xmlrpc 32 bits int range"
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if not isinstance(key, str):
+                return f"{path} has the {type(key).__name__} key {key!r}, xmlrpc struct keys are str"
+            error = marshalling_error(item, f"{path}[{key!r}]")
+            if error is not None:
+                return error
+        return None
+    if isinstance(value, (list, tuple)):
+        for index, item in enumerate(value):
+            error = marshalling_error(item, f"{path}[{index}]")
+            if error is not None:
+                return error
+        return None
+    if value is None:
+        return f"{path} is None, xmlrpc has no nil without allow_none"
+    from datetime import datetime
+    from xmlrpc.client import Binary, DateTime
+    if isinstance(value, (datetime, DateTime, Binary)):
+        return None
+    return f"{path} of type {type(value).__name__} cannot be marshalled by xmlrpc"
+
+
+def type_names(types):
+    types = types if isinstance(types, tuple) else (types,)
+    return ' or '.join(t.__name__ for t in types)
+
+
+class RpcSchema():
+    """
+    compiled arguments of one xmlrpc method
+    :param method: str 'api.Method', for the error messages
+    :param params: declared argument names, in order
+    :param types: {argument name: type or tuple of types}, the unlisted
+        arguments take any marshallable value
+    :param optional: argument names that may be missing, the others are required
+    """
+    __slots__ = ('method', 'params', 'names', 'checks')
+
+    def __init__(self, method, params, types, optional=()):
+        self.method = method
+        self.params = tuple(params)
+        self.names = frozenset(params)
+        # (name, expected types, walk, required): a str argument is fully
+        # checked by its type, the others are walked for the marshalling limits
+        self.checks = tuple(
+            (name, types.get(name, object), types.get(name, object) is not str, name not in optional)
+            for name in params
+        )
+
+    def validate_encode(self, data):
+        """
+        encode checking data in the same pass
+        :return: encoded data, raise RpcArgumentError when data is not a valid argument dict
+        """
+        if not isinstance(data, dict):
+            raise RpcArgumentError(self.method, f"data must be a dict, got {type(data).__name__}")
+        encoded = {}
+        for name, expected, walk, required in self.checks:
+            if name not in data:
+                if required:
+                    # a misspelled argument is reported rather than the missing one
+                    if not self.names.issuperset(data):
+                        self._unknown(data)
+                    raise RpcArgumentError(self.method, f"missing argument {name!r}")
+                continue
+            value = data[name]
+            if not isinstance(value, expected):
+                raise RpcArgumentError(
+                    self.method,
+                    f"argument {name!r} must be {type_names(expected)}, got {type(value).__name__}",
+                )
+            if walk and not marshallable(value):
+                raise RpcArgumentError(self.method, marshalling_error(value, name))
+            encoded[name] = value
+        if len(encoded) != len(data):
+            self._unknown(data)
+        return encoded
+
+    def _unknown(self, data):
+        # error path only: difflib is not imported by the valid calls
+        from difflib import get_close_matches
+        name = next(name for name in data if name not in self.names)
+        close = get_close_matches(str(name), self.params, n=1)
+        hint = f", did you mean {close[0]!r}?" if close else f", expected {', '.join(self.params)}"
+        raise RpcArgumentError(self.method, f"unknown argument {name!r}{hint}")
+
+    def encode(self, data):
+        """:return: dict of the declared arguments of data, in declaration order"""
+        return {name: data[name] for name in self.params if name in data}
+
+
+class RpcSchemas():
+    """
+    the RpcSchema of every method of endpoints
+    :param endpoints: {api: {method: [argument names]}}, RPC_ENDPOINTS
+    :param types: {argument name: type or tuple of types}
+    :param optional: {method: argument names that may be missing}
+    :param trusted: skip the validation, only encode: for callers building
+        their data from already validated inputs
+    """
+    def __init__(self, endpoints, types=None, optional=None, trusted=False):
+        self.schemas = {
+            method: RpcSchema(f"{api}.{method}", params, types or {}, (optional or {}).get(method, ()))
+            for api, methods in endpoints.items()
+            for method, params in methods.items()
+        }
+        self.trusted = trusted
+
+    def as_trusted(self):
+        """:return: RpcSchemas sharing these compiled schemas, in trusted mode"""
+        schemas = RpcSchemas({})
+        schemas.schemas = self.schemas
+        schemas.trusted = True
+        return schemas
+
+    def encode(self, item, data):
+        """
+        :param item: str xmlrpc method name
+        :return: encoded data, raise RpcArgumentError when not trusted and invalid
+        """
+        if self.trusted:
+            return self.schemas[item].encode(data)
+        return self.schemas[item].validate_encode(data)
+
+    def encode_call(self, item, args, kwargs):
+        """
+        encode the data of an RpcClient.<item>(data) or <item>(data=data) call
+        :param kwargs: the call kwargs, its data is replaced in place
+        :return: call args, with the data encoded
+        """
+        if 'data' in kwargs:
+            kwargs['data'] = self.encode(item, kwargs['data'])
+            return args
+        if args:
+            return (self.encode(item, args[0]), *args[1:])
+        # no data at all: checked as empty, missing required arguments raise
+        kwargs['data'] = self.encode(item, {})
+        return args
@@ -0,0 +1,107 @@
+"""
+coalescing of concurrent identical reads: the first caller of a key (the leader)
+makes the backend call, the callers arriving while it is in flight (the
+followers) wait and share its result or exception
+use:
+    client.single_flight = SingleFlight()        # threads
+    client.single_flight = AsyncSingleFlight()   # asyncio clients, one event loop
+"""
+import asyncio
+import threading
+
+
+class InFlightCall():
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight():
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key, function, *args):
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = self.calls[key] = InFlightCall()
+                self.leaders += 1
+                leader = True
+            else:
+                self.followers += 1
+                leader = False
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self.lock:
+            return {'leaders': self.leaders, 'followers': self.followers, 'in_flight': len(self.calls)}
+
+
+class AsyncInFlightCall():
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight():
+    """
+    the shared call runs in its own task, awaited by the leader and the
+    followers alike: a cancelled caller, the leader included, does not cancel
+    it for the others, it is cancelled only once every caller gave up
+    """
+    def __init__(self):
+        self.calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key, function, *args):
+        """
+        :param function: coroutine function called by the leader, in a task
+            run in a copy of the leader context
+        """
+        call = self.calls.get(key)
+        if call is None:
+            call = self.calls[key] = AsyncInFlightCall(asyncio.ensure_future(function(*args)))
+            call.task.add_done_callback(lambda task: self._done(key, call))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if not call.waiters and not call.task.done():
+                call.task.cancel()
+
+    def _done(self, key, call):
+        if self.calls.get(key) is call:
+            del self.calls[key]
+        if not call.task.cancelled():
+            # retrieved, even when no caller awaits it any more
+            call.task.exception()
+
+    def stats(self):
+        return {'leaders': self.leaders, 'followers': self.followers, 'in_flight': len(self.calls)}
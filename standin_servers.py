@@ -0,0 +1,696 @@
+"""
+local stand-in backends over real http, with in memory state
+use:
+    rest = RestStandin(latency=LogNormalLatency(0.02, 0.5), faults=Faults(error_rate=0.01)).start()
+    rpc = RpcStandin(endpoints={'ListAll': {'latency': 0.05}}).start()
+    rest.state.seed(100)
+    client = Libcdn('contentd', rest.url, *rpc.rpc_urls)
+    client.rest_transport = HttpSession()
+    client.rpc_transport = XmlRpcRequest
+    ...
+    rest.stats(), rpc.stats()   # requests, errors, dropped, stalled, unauthorized per endpoint
+    rest.stop(), rpc.stop()
+RestStandin emulates the contentd/cdn_prefix/{cdn_prefix_id} endpoints: get,
+put, delete, and post on contentd/cdn_prefix. RpcStandin implements every
+RPC_ENDPOINTS method, and system.multicall, on /onev, /cob and /plc.
+Both check the auth against AUTHORIZATION_CODE and answer the unauthorized
+calls as all_method does
+per endpoint ('get contentd/cdn_prefix/{cdn_prefix_id}', 'ListAll', ...):
+    latency: seconds, or a FixedLatency, UniformLatency or LogNormalLatency distribution
+    faults:  Faults rates of server errors, dropped connections and stalls
+record/replay:
+    RestStandin(recording=Recording(), upstream='http://contentd.staging:8000')
+    recording.save('contentd.jsonl')   # answers of upstream, else of the stand-in
+    RestStandin(recording=Recording.load('contentd.jsonl'), replay=True)
+"""
+from http.client import HTTPConnection
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+import json
+import math
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+from xmlrpc.client import (
+    dumps,
+    Fault,
+    loads,
+)
+
+from _do_operation import (
+    AUTHORIZATION_CODE,
+    methods_to_api,
+    MULTICALL_METHOD,
+    RPC_ENDPOINTS,
+    response_etag,
+    UNAUTHORIZED_RESPONSE,
+)
+from response_cache import request_key
+
+# injected faults
+ERROR_FAULT = 'error'
+DROP_FAULT = 'drop'
+# status of a dropped exchange in a Recording
+DROPPED = 0
+# xmlrpc fault codes of the stand-in
+INVALID_PARAMS = 400
+NOT_FOUND = 404
+CONFLICT = 409
+METHOD_NOT_FOUND = -32601
+# filter keys of the paginated reads, see RpcClient.iter_rpc
+PAGE_KEYS = ('offset', 'limit', 'cursor')
+FORWARDED_HEADERS = ('authorization', 'x-client-name', 'content-type', 'if-none-match', 'traceparent')
+UPSTREAM_TIMEOUT = 30
+CDN_PREFIX_PATH = re.compile(r'/contentd/cdn_prefix(?:/(?P<cdn_prefix_id>[^/?]+))?/?(?:\?.*)?$')
+
+
+class FixedLatency():
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def sample(self, rng):
+        return self.seconds
+
+
+class UniformLatency():
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def sample(self, rng):
+        return rng.uniform(self.low, self.high)
+
+
+class LogNormalLatency():
+    """
+    heavy tailed latency of median seconds, its p99 is about median * exp(2.33 * sigma)
+    :param limit: max seconds of a sample
+    """
+    def __init__(self, median, sigma=0.5, limit=None):
+        self.median = median
+        self.sigma = sigma
+        self.limit = limit
+
+    def sample(self, rng):
+        seconds = rng.lognormvariate(math.log(self.median), self.sigma)
+        return seconds if self.limit is None else min(seconds, self.limit)
+
+
+def sample_latency(latency, rng):
+    if latency is None:
+        return 0.0
+    if isinstance(latency, (int, float)):
+        return latency
+    return latency.sample(rng)
+
+
+class Faults():
+    """
+    :param error_rate: share of the requests answered by an http 503 server error, rest or xmlrpc:
+        HttpServerError of the retries and circuit breakers
+    :param drop_rate: share of the requests whose connection is closed without answer
+    :param stall_rate: share of the requests delayed by stall seconds on top of their latency
+    """
+    def __init__(self, error_rate=0.0, drop_rate=0.0, stall_rate=0.0, stall=5.0):
+        if error_rate + drop_rate > 1:
+            raise ValueError(f"error_rate + drop_rate must be <= 1, got {error_rate + drop_rate}")
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.stall_rate = stall_rate
+        self.stall = stall
+
+
+class Recording():
+    """
+    exchanges of a stand-in, in request order
+    replayed per request key in the same order, the last answer of a key repeated
+    """
+    def __init__(self, exchanges=None):
+        self.exchanges = []
+        self.answers = {}
+        self.cursors = {}
+        self.lock = threading.Lock()
+        for exchange in exchanges or ():
+            self._add(exchange)
+
+    def _add(self, exchange):
+        self.exchanges.append(exchange)
+        self.answers.setdefault(exchange['key'], []).append(exchange)
+
+    def record(self, key, endpoint, status, payload, headers, elapsed):
+        exchange = {
+            'key': key,
+            'endpoint': endpoint,
+            'status': status,
+            # payloads are text, surrogateescape keeps any byte through json
+            'payload': payload.decode('utf-8', 'surrogateescape'),
+            'headers': headers,
+            'elapsed': elapsed,
+        }
+        with self.lock:
+            self._add(exchange)
+
+    def replay(self, key):
+        """:return: (status, payload, headers, elapsed) recorded for key, None if not recorded"""
+        with self.lock:
+            answers = self.answers.get(key)
+            if not answers:
+                return None
+            index = self.cursors.get(key, 0)
+            self.cursors[key] = index + 1
+            exchange = answers[min(index, len(answers) - 1)]
+        payload = exchange['payload'].encode('utf-8', 'surrogateescape')
+        return exchange['status'], payload, exchange['headers'], exchange['elapsed']
+
+    def rewind(self):
+        with self.lock:
+            self.cursors = {}
+
+    def save(self, path):
+        with self.lock:
+            exchanges = list(self.exchanges)
+        with open(path, 'w') as f:
+            for exchange in exchanges:
+                f.write(json.dumps(exchange) + '\n')
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.loads(line) for line in f if line.strip())
+
+    def __len__(self):
+        return len(self.exchanges)
+
+
+class EndpointStats():
+    __slots__ = ('requests', 'errors', 'dropped', 'stalled', 'unauthorized')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.dropped = 0
+        self.stalled = 0
+        self.unauthorized = 0
+
+
+class Standin(ThreadingHTTPServer):
+    """
+    threaded http server on host:port (port 0 picks a free port)
+    :param latency: default latency of the endpoints, seconds or a distribution
+    :param faults: default Faults of the endpoints
+    :param endpoints: {endpoint: {'latency': ..., 'faults': ...}} overriding the defaults
+    :param recording: Recording of the exchanges
+    :param replay: answer from recording only, without latency, faults nor state
+    :param replay_latency: in replay, wait the recorded elapsed time of each answer
+    :param upstream: url of a real backend answering the requests instead of the
+        state, e.g. to record it
+    :param seed: seed of the latency and faults random draws, for reproducible runs
+    counts the requests and the distinct client connections it served
+    """
+    daemon_threads = True
+
+    def __init__(self, host, port, handler, latency=None, faults=None, endpoints=None, recording=None,
+                 replay=False, replay_latency=False, upstream=None, seed=None):
+        if replay and recording is None:
+            raise ValueError("replay needs a recording")
+        super().__init__((host, port), handler)
+        self.url = f"http://{host}:{self.server_address[1]}"
+        self.default_behavior = (latency, faults)
+        self.behaviors = {
+            endpoint: (options.get('latency', latency), options.get('faults', faults))
+            for endpoint, options in (endpoints or {}).items()
+        }
+        self.recording = recording
+        self.replay = replay
+        self.replay_latency = replay_latency
+        self.upstream = upstream
+        self.random = random.Random(seed)
+        self.request_count = 0
+        self.connections = set()
+        self.endpoint_stats = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def count_request(self, client_address):
+        with self.lock:
+            self.request_count += 1
+            self.connections.add(client_address)
+
+    def _stats(self, endpoint):
+        stats = self.endpoint_stats.get(endpoint)
+        if stats is None:
+            with self.lock:
+                stats = self.endpoint_stats.setdefault(endpoint, EndpointStats())
+        return stats
+
+    def count_unauthorized(self, endpoint):
+        stats = self._stats(endpoint)
+        with self.lock:
+            stats.unauthorized += 1
+
+    def inject(self, endpoint):
+        """
+        wait the endpoint latency, stall included
+        :return: fault of the request, ERROR_FAULT, DROP_FAULT or None
+        """
+        latency, faults = self.behaviors.get(endpoint, self.default_behavior)
+        delay = sample_latency(latency, self.random)
+        fault = None
+        stalled = False
+        if faults is not None:
+            draw = self.random.random()
+            if draw < faults.drop_rate:
+                fault = DROP_FAULT
+            elif draw < faults.drop_rate + faults.error_rate:
+                fault = ERROR_FAULT
+            if faults.stall_rate and self.random.random() < faults.stall_rate:
+                delay += faults.stall
+                stalled = True
+        stats = self._stats(endpoint)
+        with self.lock:
+            stats.requests += 1
+            stats.errors += fault == ERROR_FAULT
+            stats.dropped += fault == DROP_FAULT
+            stats.stalled += stalled
+        if delay > 0:
+            time.sleep(delay)
+        return fault
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def stats(self):
+        """:return: {endpoint: {'requests', 'errors', 'dropped', 'stalled', 'unauthorized'}}"""
+        with self.lock:
+            return {
+                endpoint: {name: getattr(stats, name) for name in EndpointStats.__slots__}
+                for endpoint, stats in self.endpoint_stats.items()
+            }
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    # keep-alive connections, as a production http server
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def send(self, status, payload, headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def exchange(self, endpoint, key, body, answer):
+        """
+        answer a request from the recording in replay, else after its latency
+        and faults, from upstream or from answer()
+        :param key: request key in the recording
+        :param answer: function() -> (status, payload, headers) of the stand-in
+        """
+        server = self.server
+        server.count_request(self.client_address)
+        if server.replay:
+            recorded = server.recording.replay(key)
+            if recorded is None:
+                return self.send(501, f"{endpoint} request not recorded".encode(), {'Content-Type': 'text/plain'})
+            status, payload, headers, elapsed = recorded
+            if server.replay_latency:
+                time.sleep(elapsed)
+        else:
+            start = time.perf_counter()
+            fault = server.inject(endpoint)
+            if fault == DROP_FAULT:
+                status, payload, headers = DROPPED, b'', {}
+            elif fault == ERROR_FAULT:
+                status, payload, headers = self.error_answer()
+            elif server.upstream is not None:
+                status, payload, headers = self.forward(body)
+            else:
+                status, payload, headers = answer()
+            if server.recording is not None:
+                server.recording.record(key, endpoint, status, payload, headers, time.perf_counter() - start)
+        if status == DROPPED:
+            # nothing sent: the client sees the connection closed
+            self.close_connection = True
+            return
+        self.respond(status, payload, headers)
+
+    def respond(self, status, payload, headers):
+        self.send(status, payload, headers)
+
+    def error_answer(self):
+        return 503, b'injected server error', {'Content-Type': 'text/plain'}
+
+    def forward(self, body):
+        """:return: (status, payload, headers) of the upstream answer"""
+        parts = urlsplit(self.server.upstream)
+        connection = HTTPConnection(parts.hostname, parts.port, timeout=UPSTREAM_TIMEOUT)
+        try:
+            headers = {name: value for name, value in self.headers.items() if name.lower() in FORWARDED_HEADERS}
+            connection.request(self.command, f"{parts.path.rstrip('/')}{self.path}", body=body, headers=headers)
+            response = connection.getresponse()
+            payload = response.read()
+            headers = {name: response.getheader(name) for name in ('ETag', 'Content-Type') if response.getheader(name)}
+            return response.status, payload, headers
+        finally:
+            connection.close()
+
+
+def json_answer(status, value):
+    return status, json.dumps(value).encode(), {'Content-Type': 'application/json'}
+
+
+class ContentdState():
+    """in memory cdn prefixes of the contentd stand-in"""
+    def __init__(self):
+        self.prefixes = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    def seed(self, count, **attrs):
+        """add the prefixes 1 to count"""
+        with self.lock:
+            for cdn_prefix_id in range(1, count + 1):
+                self.prefixes[cdn_prefix_id] = {
+                    'cdn_prefix_id': cdn_prefix_id, 'prefix': f"cdn{cdn_prefix_id}.example.com", **attrs,
+                }
+            self.next_id = max(self.next_id, count + 1)
+
+    def get(self, cdn_prefix_id, data):
+        prefix = self.prefixes.get(cdn_prefix_id)
+        if prefix is None:
+            return json_answer(404, {'error': f"cdn_prefix {cdn_prefix_id} not found"})
+        return json_answer(200, prefix)
+
+    def put(self, cdn_prefix_id, data):
+        if not isinstance(data, dict):
+            return json_answer(400, {'error': 'cdn_prefix data must be an object'})
+        with self.lock:
+            prefix = self.prefixes[cdn_prefix_id] = {**data, 'cdn_prefix_id': cdn_prefix_id}
+            self.next_id = max(self.next_id, cdn_prefix_id + 1)
+        return json_answer(200, prefix)
+
+    def post(self, cdn_prefix_id, data):
+        if not isinstance(data, dict):
+            return json_answer(400, {'error': 'cdn_prefix data must be an object'})
+        with self.lock:
+            cdn_prefix_id = self.next_id
+            self.next_id += 1
+            prefix = self.prefixes[cdn_prefix_id] = {**data, 'cdn_prefix_id': cdn_prefix_id}
+        return json_answer(201, prefix)
+
+    def delete(self, cdn_prefix_id, data):
+        with self.lock:
+            prefix = self.prefixes.pop(cdn_prefix_id, None)
+        if prefix is None:
+            return json_answer(404, {'error': f"cdn_prefix {cdn_prefix_id} not found"})
+        return json_answer(200, {'deleted': cdn_prefix_id})
+
+
+class RestStandinHandler(StandinHandler):
+    def _answer(self):
+        body = self.read_body()
+        method = self.command.lower()
+        match = CDN_PREFIX_PATH.search(self.path)
+        if match is None:
+            endpoint = f"{method} {self.path}"
+        elif match['cdn_prefix_id'] is None:
+            endpoint = f"{method} contentd/cdn_prefix"
+        else:
+            endpoint = f"{method} contentd/cdn_prefix/{{cdn_prefix_id}}"
+        text = body.decode('utf-8', 'surrogateescape')
+        key = request_key('rest', method, self.path, text, self.headers.get('Authorization'))
+        self.exchange(endpoint, key, body, lambda: self.answer(endpoint, method, match, text))
+
+    do_GET = do_POST = do_PUT = do_DELETE = _answer
+
+    def answer(self, endpoint, method, match, text):
+        auth = self.headers.get('Authorization')
+        if auth != str(AUTHORIZATION_CODE):
+            self.server.count_unauthorized(endpoint)
+            name = self.headers.get('X-Client-Name')
+            body = f"{UNAUTHORIZED_RESPONSE}, auth = {auth} on {name} {self.server.url}{self.path}"
+            return 401, body.encode(), {'Content-Type': 'text/plain'}
+        cdn_prefix_id = None
+        if match is None or (match['cdn_prefix_id'] is None) != (method == 'post'):
+            return json_answer(404, {'error': f"no endpoint {method} {self.path}"})
+        if match['cdn_prefix_id'] is not None:
+            try:
+                cdn_prefix_id = int(match['cdn_prefix_id'])
+            except ValueError:
+                return json_answer(400, {'error': f"cdn_prefix_id must be an int, got {match['cdn_prefix_id']}"})
+        try:
+            data = json.loads(text) if text else None
+        except ValueError:
+            return json_answer(400, {'error': 'body is not json'})
+        return getattr(self.server.state, method)(cdn_prefix_id, data)
+
+    def respond(self, status, payload, headers):
+        if status == 200 and self.command == 'GET':
+            etag = response_etag(payload.decode('utf-8', 'surrogateescape'))
+            if self.headers.get('If-None-Match') == etag:
+                return self.send(304, b'', {'ETag': etag})
+            headers = {**headers, 'ETag': etag}
+        self.send(status, payload, headers)
+
+
+class RestStandin(Standin):
+    """
+    contentd stand-in
+    :param state: ContentdState, default empty: state.seed(count) adds prefixes
+    other options: see Standin
+    """
+    def __init__(self, host='127.0.0.1', port=0, handler=RestStandinHandler, state=None, **options):
+        super().__init__(host, port, handler, **options)
+        self.state = state if state is not None else ContentdState()
+
+
+def matches(attrs, filters):
+    return all(attrs.get(name) == value for name, value in filters.items() if name not in PAGE_KEYS)
+
+
+def project(row, fields):
+    return {name: row[name] for name in fields if name in row} if fields else row
+
+
+def page(rows, filters):
+    """:return: rows of the offset and limit of filters, a list page as RpcClient.iter_rpc expects"""
+    offset = filters.get('offset', 0)
+    limit = filters.get('limit')
+    return rows[offset:] if limit is None else rows[offset:offset + limit]
+
+
+class RpcState():
+    """
+    in memory state of the onev, cob and plc stand-ins, a method per
+    RPC_ENDPOINTS method taking the call data, raising xmlrpc Fault
+    onev objects: {object_type: {object_id: attrs}} and their bindings
+    cob persons and plc slices: {id: fields}, slices are added by add_slice
+    """
+    def __init__(self):
+        self.objects = {}
+        self.bindings = set()
+        self.persons = {}
+        self.slices = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    def _new_id(self):
+        new_id = self.next_id
+        self.next_id += 1
+        return new_id
+
+    def _object(self, object_type, object_id):
+        attrs = self.objects.get(object_type, {}).get(object_id)
+        if attrs is None:
+            raise Fault(NOT_FOUND, f"{object_type} {object_id} not found")
+        return attrs
+
+    def _person_id(self, person_id_or_email):
+        if person_id_or_email in self.persons:
+            return person_id_or_email
+        for person_id, fields in self.persons.items():
+            if fields.get('email') == person_id_or_email:
+                return person_id
+        raise Fault(NOT_FOUND, f"person {person_id_or_email} not found")
+
+    def ListAll(self, data):
+        filters = data.get('filter_attrs') or {}
+        with self.lock:
+            rows = [
+                {'object_id': object_id, **attrs}
+                for object_id, attrs in sorted(self.objects.get(data['object_type'], {}).items())
+                if matches(attrs, filters)
+            ]
+        return [project(row, data.get('return_attrs')) for row in page(rows, filters)]
+
+    def Create(self, data):
+        with self.lock:
+            object_id = self._new_id()
+            self.objects.setdefault(data['object_type'], {})[object_id] = dict(data['data_attrs'])
+        return object_id
+
+    def Update(self, data):
+        with self.lock:
+            self._object(data['object_type'], data['object_id']).update(data['data_attrs'])
+        return 1
+
+    def Bind(self, data):
+        with self.lock:
+            self._object(data['1st_object_type'], data['1st_object_id'])
+            self._object(data['2nd_object_type'], data['2nd_object_id'])
+            self.bindings.add((
+                data['1st_object_type'], data['1st_object_id'], data['2nd_object_type'], data['2nd_object_id'],
+            ))
+        return 1
+
+    def Delete(self, data):
+        object_type, object_id = data['object_type'], data['object_id']
+        with self.lock:
+            self._object(object_type, object_id)
+            del self.objects[object_type][object_id]
+            self.bindings = {
+                binding for binding in self.bindings
+                if (object_type, object_id) not in (binding[:2], binding[2:])
+            }
+        return 1
+
+    def add_slice(self, **attrs):
+        with self.lock:
+            slice_id = self._new_id()
+            self.slices[slice_id] = attrs
+        return slice_id
+
+    def GetSlices(self, data):
+        filters = data.get('data_attrs') or {}
+        with self.lock:
+            rows = [
+                {'slice_id': slice_id, **attrs}
+                for slice_id, attrs in sorted(self.slices.items()) if matches(attrs, filters)
+            ]
+        return [project(row, data.get('return_attrs')) for row in page(rows, filters)]
+
+    def GetPersons(self, data):
+        filters = data.get('person_filter') or {}
+        with self.lock:
+            rows = [
+                {'person_id': person_id, **fields}
+                for person_id, fields in sorted(self.persons.items()) if matches(fields, filters)
+            ]
+        return [project(row, data.get('return_fields')) for row in page(rows, filters)]
+
+    def AddPerson(self, data):
+        fields = dict(data['person_fields'])
+        with self.lock:
+            email = fields.get('email')
+            if email is not None and any(person.get('email') == email for person in self.persons.values()):
+                raise Fault(CONFLICT, f"person {email} already exists")
+            person_id = self._new_id()
+            self.persons[person_id] = fields
+        return person_id
+
+    def UpdatePerson(self, data):
+        with self.lock:
+            self.persons[self._person_id(data['person_id_or_email'])].update(data['person_fields'])
+        return 1
+
+    def DeletePerson(self, data):
+        with self.lock:
+            del self.persons[self._person_id(data['person_id_or_email'])]
+        return 1
+
+
+class RpcStandinHandler(StandinHandler):
+    def do_POST(self):
+        body = self.read_body()
+        try:
+            params, method = loads(body)
+        except Exception as e:
+            self.server.count_request(self.client_address)
+            return self.send(400, f"invalid xmlrpc request: {e}".encode(), {'Content-Type': 'text/plain'})
+        api_name = self.path.rstrip('/').rsplit('/', 1)[-1]
+        key = request_key('rpc', self.path, method, params)
+        self.exchange(method, key, body, lambda: self.answer(api_name, method, params))
+
+    def answer(self, api_name, method, params):
+        try:
+            if method == MULTICALL_METHOD:
+                result = [self.multicall_result(api_name, call) for call in (params[0] if params else [])]
+            else:
+                result = self.call(api_name, method, params)
+            payload = dumps((result,), methodresponse=True)
+        except Fault as fault:
+            payload = dumps(fault, methodresponse=True)
+        return 200, payload.encode(), {'Content-Type': 'text/xml'}
+
+    def multicall_result(self, api_name, call):
+        try:
+            return [self.call(api_name, call['methodName'], tuple(call['params']))]
+        except Fault as fault:
+            return {'faultCode': fault.faultCode, 'faultString': fault.faultString}
+
+    def call(self, api_name, method, params):
+        """:return: result of method(auth, data), raise Fault"""
+        if method not in methods_to_api or (api_name in RPC_ENDPOINTS and methods_to_api[method] != api_name):
+            raise Fault(METHOD_NOT_FOUND, f"{api_name} has no method {method}")
+        if len(params) != 2 or not isinstance(params[1], dict):
+            raise Fault(INVALID_PARAMS, f"{method} takes (auth, data struct) params")
+        auth, data = params
+        if auth != AUTHORIZATION_CODE:
+            self.server.count_unauthorized(method)
+            return f"{UNAUTHORIZED_RESPONSE}, auth = {auth} on {methods_to_api[method]} {self.server.url}{self.path}"
+        try:
+            return getattr(self.server.state, method)(data)
+        except KeyError as e:
+            raise Fault(INVALID_PARAMS, f"{method} data misses {e}")
+
+
+class RpcStandin(Standin):
+    """
+    onev, cob and plc stand-in, each api on its path of one server
+    :param state: RpcState shared by the apis
+    other options: see Standin
+    """
+    def __init__(self, host='127.0.0.1', port=0, handler=RpcStandinHandler, state=None, **options):
+        super().__init__(host, port, handler, **options)
+        self.state = state if state is not None else RpcState()
+        missing = [method for method in methods_to_api if not callable(getattr(self.state, method, None))]
+        if missing:
+            raise ValueError(f"rpc stand-in state has no {', '.join(missing)} method")
+
+    @property
+    def urls(self):
+        """:return: {api name: url}"""
+        return {api_name: f"{self.url}/{api_name}" for api_name in RPC_ENDPOINTS}
+
+    @property
+    def rpc_urls(self):
+        """:return: (onev_url, cob_url, plc_url), the RpcClient arguments"""
+        urls = self.urls
+        return urls['onev'], urls['cob'], urls['plc']
+
+
+if __name__ == '__main__':
+    rest = RestStandin(port=8000)
+    rest.state.seed(100)
+    rpc = RpcStandin(port=8001).start()
+    print(f"rest stand-in on {rest.url}, rpc stand-in on {', '.join(rpc.rpc_urls)}")
+    rest.serve_forever()
@@ -0,0 +1,8 @@
+"""
+the client modules are flat at the repository root
+run from it: python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,60 @@
+"""ApiPath templates and the @api_request signature checks"""
+import pytest
+
+from _do_operation import ApiPath, api_request, AUTHORIZATION_CODE, RestClient
+
+
+@pytest.mark.parametrize('template, kwargs', [
+    ('contentd/cdn_prefix', {}),
+    ('contentd/cdn_prefix/{cdn_prefix_id}', {'cdn_prefix_id': 5}),
+    ('contentd/{cdn}/prefix/{cdn_prefix_id}/origin', {'cdn': 'edge', 'cdn_prefix_id': 5, 'data': {}}),
+    ('contentd/{cdn_prefix_id:04d}', {'cdn_prefix_id': 5}),
+    ('contentd/{prefix[id]}/{prefix[name]!r}', {'prefix': {'id': 5, 'name': 'cdn'}}),
+])
+def test_build_is_format(template, kwargs):
+    assert ApiPath(template).build(kwargs) == template.format(**kwargs)
+
+
+def test_fields():
+    assert ApiPath('contentd/cdn_prefix').fields == ()
+    assert ApiPath('a/{x}/{y}/{x}').fields == ('x', 'y')
+    assert ApiPath('a/{prefix[id]}/{origin.host}').fields == ('prefix', 'origin')
+    path = ApiPath('contentd/{cdn_prefix_id}')
+    assert path == 'contentd/{cdn_prefix_id}' and isinstance(path, str)
+
+
+def test_path_field_missing_from_the_signature_raises_at_decoration():
+    with pytest.raises(ValueError, match='cdn_prefix_id missing from the function signature'):
+        @api_request('get', 'contentd/cdn_prefix/{cdn_prefix_id}')
+        def get_cdn_prefix(self, prefix_id):
+            """"""
+
+    @api_request('get', 'contentd/cdn_prefix/{cdn_prefix_id}')
+    def get_any(self, **kwargs):
+        """"""
+
+
+class Client(RestClient):
+    def _do_operation(self, method_name, api_path, **kwargs):
+        return method_name, api_path.build(kwargs), kwargs
+
+    @api_request('put', 'contentd/cdn_prefix/{cdn_prefix_id}')
+    def update_cdn_prefix(self, cdn_prefix_id, data):
+        """"""
+
+
+def test_positional_arguments_are_passed_by_name():
+    client = Client('contentd', 'amc_url', AUTHORIZATION_CODE)
+    expected = ('put', 'contentd/cdn_prefix/5', {'cdn_prefix_id': 5, 'data': {'a': 1}})
+    assert client.update_cdn_prefix(5, {'a': 1}) == expected
+    assert client.update_cdn_prefix(5, data={'a': 1}) == expected
+    assert client.update_cdn_prefix(cdn_prefix_id=5, data={'a': 1}) == expected
+    assert Client.update_cdn_prefix.is_read is False
+
+
+def test_bad_calls_raise_type_error():
+    client = Client('contentd', 'amc_url', AUTHORIZATION_CODE)
+    with pytest.raises(TypeError, match='takes 2 positional arguments but 3 were given'):
+        client.update_cdn_prefix(5, {}, 'extra')
+    with pytest.raises(TypeError, match="multiple values for argument 'cdn_prefix_id'"):
+        client.update_cdn_prefix(5, cdn_prefix_id=6)
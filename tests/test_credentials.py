@@ -0,0 +1,68 @@
+"""CachedCredentialProvider tokens per identity"""
+import threading
+
+from credentials import AuthContext, CachedCredentialProvider, context_identity
+
+
+class Clock():
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_resolves_once_per_identity_and_ttl():
+    clock = Clock()
+    provider = CachedCredentialProvider(lambda identity: f"auth {identity}", identity=context_identity, ttl=10, clock=clock)
+    with AuthContext(identity='alice'):
+        assert provider.auth() == 'auth alice'
+        assert provider.auth() == 'auth alice'
+    clock.now = 11
+    with AuthContext(identity='alice'):
+        assert provider.auth() == 'auth alice'
+    assert provider.stats()['resolutions'] == 2
+
+
+def test_identities_are_bounded():
+    clock = Clock()
+    provider = CachedCredentialProvider(lambda identity: identity, ttl=10, max_identities=3, clock=clock)
+    for identity in range(5):
+        provider.get(identity)
+    assert list(provider.tokens) == [2, 3, 4]
+    # a resolution makes a token the most recent one
+    provider.invalidate(2)
+    provider.get(2)
+    provider.get(5)
+    assert list(provider.tokens) == [4, 2, 5]
+    assert provider.stats()['evicted'] == 3
+
+
+def test_expired_identities_are_dropped_first():
+    clock = Clock()
+    provider = CachedCredentialProvider(lambda identity: (identity, 5 if identity == 'short' else 100),
+                                        max_identities=2, clock=clock)
+    provider.get('long')
+    provider.get('short')
+    clock.now = 6
+    provider.get('new')
+    assert list(provider.tokens) == ['long', 'new']
+
+
+def test_concurrent_callers_share_one_resolution():
+    release = threading.Event()
+    calls = []
+
+    def resolve(identity):
+        calls.append(identity)
+        release.wait(1)
+        return 'auth'
+
+    provider = CachedCredentialProvider(resolve)
+    threads = [threading.Thread(target=provider.auth) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [None]
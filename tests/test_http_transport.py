@@ -0,0 +1,170 @@
+"""HttpSession connection pools and XmlRpcRequest, against the local stand-ins"""
+from functools import partial
+from http.client import IncompleteRead
+import socket
+import threading
+import time
+
+import pytest
+
+from _do_operation import AUTHORIZATION_CODE, Contentd, Onevsh
+from http_transport import ConnectionPool, HttpServerError, HttpSession, XmlRpcRequest
+from standin_servers import Faults, RestStandin, RpcStandin
+
+
+@pytest.fixture
+def rest():
+    server = RestStandin().start()
+    server.state.seed(5)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def rpc():
+    server = RpcStandin().start()
+    yield server
+    server.stop()
+
+
+def contentd(url, session):
+    client = Contentd('contentd', url, AUTHORIZATION_CODE)
+    client.rest_transport = session
+    return client
+
+
+def onevsh(server, session):
+    client = Onevsh(*server.rpc_urls, AUTHORIZATION_CODE)
+    client.share_rpc_apis = False
+    client.rpc_transport = partial(XmlRpcRequest, session=session)
+    return client
+
+
+def test_pool_reuses_keep_alive_connection(rest):
+    session = HttpSession()
+    client = contentd(rest.url, session)
+    for cdn_prefix_id in range(1, 6):
+        assert f"cdn{cdn_prefix_id}.example.com" in client.get_cdn_prefix(cdn_prefix_id=cdn_prefix_id)
+    pool = session.pool(rest.url)
+    assert pool.stats() == {'idle': 1, 'opened': 1, 'reused': 4, 'evicted': 0}
+    assert len(rest.connections) == 1
+    session.close()
+
+
+def test_pool_evicts_idle_connections(rest):
+    session = HttpSession(idle_timeout=30)
+    client = contentd(rest.url, session)
+    client.get_cdn_prefix(cdn_prefix_id=1)
+    pool = session.pool(rest.url)
+    now = time.monotonic()
+    pool.clock = lambda: now + 31
+    client.get_cdn_prefix(cdn_prefix_id=2)
+    assert pool.stats() == {'idle': 1, 'opened': 2, 'reused': 0, 'evicted': 1}
+    session.close()
+
+
+def test_pool_keeps_max_size_idle_connections():
+    pool = ConnectionPool('http', '127.0.0.1', 1, max_size=2)
+    connections = [pool._new_connection() for _ in range(3)]
+    for connection in connections:
+        pool.release(connection)
+    assert [connection for connection, _ in pool.idle] == connections[:2]
+    # last released, first reused
+    assert pool.acquire() == (connections[1], True)
+
+
+def test_pool_drops_connection_closed_by_server():
+    listener = socket.create_server(('127.0.0.1', 0))
+    pool = ConnectionPool('http', '127.0.0.1', listener.getsockname()[1])
+    connection = pool._new_connection()
+    connection.connect()
+    peer, _ = listener.accept()
+    pool.release(connection)
+    peer.close()
+    time.sleep(0.05)
+    reused_connection, reused = pool.acquire()
+    assert not reused and reused_connection is not connection
+    assert pool.stats()['evicted'] == 1
+    listener.close()
+
+
+def test_body_cut_short_discards_the_connection():
+    listener = socket.create_server(('127.0.0.1', 0))
+
+    def answer():
+        peer, _ = listener.accept()
+        peer.recv(65536)
+        peer.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\ncut short")
+        peer.close()
+
+    server = threading.Thread(target=answer)
+    server.start()
+    session = HttpSession()
+    url = f"http://127.0.0.1:{listener.getsockname()[1]}/contentd"
+    pool = session.pool(url)
+    discarded = []
+    pool.discard = lambda connection: discarded.append(connection) or connection.close()
+    with pytest.raises(IncompleteRead):
+        session.get(AUTHORIZATION_CODE, '', 'contentd', url)
+    server.join(5)
+    assert len(discarded) == 1 and discarded[0].sock is None
+    assert pool.stats()['idle'] == 0
+    session.close()
+    listener.close()
+
+
+def test_prewarm_opens_connections_ahead(rest):
+    session = HttpSession()
+    session.prewarm(rest.url, 3)
+    assert session.pool(rest.url).stats()['idle'] == 3
+    contentd(rest.url, session).get_cdn_prefix(cdn_prefix_id=1)
+    assert session.pool(rest.url).stats()['reused'] == 1
+    session.close()
+
+
+def test_server_error_raises(rest):
+    rest.default_behavior = (None, Faults(error_rate=1.0))
+    session = HttpSession()
+    with pytest.raises(HttpServerError) as error:
+        contentd(rest.url, session).get_cdn_prefix(cdn_prefix_id=1)
+    assert error.value.status == 503
+    session.close()
+
+
+def test_dropped_post_is_not_sent_again(rpc):
+    session = HttpSession()
+    client = onevsh(rpc, session)
+    client.Create(data={'object_type': 'Node', 'data_attrs': {}})
+    rpc.default_behavior = (None, Faults(drop_rate=1.0))
+    with pytest.raises(ConnectionError):
+        client.Create(data={'object_type': 'Node', 'data_attrs': {}})
+    assert rpc.stats()['Create']['dropped'] == 1
+    session.close()
+
+
+def test_xmlrpc_calls_and_multicall(rpc):
+    session = HttpSession()
+    client = onevsh(rpc, session)
+    object_id = client.Create(data={'object_type': 'IpAddress', 'data_attrs': {'ip_address_id': 7, 'type': 'edge'}})
+    assert client.listall_node_names(7) == [{'type': 'edge'}]
+    with client.batch() as batch:
+        found = batch.ListAll(data={'object_type': 'IpAddress', 'filter_attrs': {'ip_address_id': 7}})
+        missing = batch.Update(data={'object_type': 'IpAddress', 'object_id': object_id + 100, 'data_attrs': {}})
+    assert found.result() == [{'object_id': object_id, 'ip_address_id': 7, 'type': 'edge'}]
+    assert missing.result().faultCode == 404
+    session.close()
+
+
+def test_rpc_server_error_is_retried_and_counted_by_the_breaker(rpc):
+    from retry import CircuitBreakers, RetryPolicy
+    rpc.behaviors['ListAll'] = (None, Faults(error_rate=1.0))
+    session = HttpSession()
+    client = onevsh(rpc, session)
+    client.retry_policy = RetryPolicy(max_attempts=3, sleep=lambda delay: None)
+    client.circuit_breakers = CircuitBreakers(min_calls=10)
+    with pytest.raises(HttpServerError) as error:
+        client.ListAll(data={'object_type': 'IpAddress'})
+    assert error.value.status == 503
+    assert rpc.stats()['ListAll']['errors'] == 3
+    assert client.circuit_breakers.get('onev').stats()['failures'] == 3
+    session.close()
@@ -0,0 +1,106 @@
+"""RpcClient.iter_rpc and AsyncRpcClient.iter_rpc pagination"""
+import asyncio
+import time
+
+import pytest
+
+from _do_async_operation import AsyncOnevsh
+from _do_operation import AUTHORIZATION_CODE, Onevsh
+
+NODES = {'object_type': 'IpAddress', 'filter_attrs': {'ip_address_id': 2}}
+
+
+class PagedBackend():
+    """ListAll answering rows[offset:offset + limit], or cursor pages {'results', 'cursor'}"""
+    def __init__(self, count, cursor_pages=False):
+        self.rows = list(range(count))
+        self.cursor_pages = cursor_pages
+        self.positions = []
+
+    def page(self, data):
+        page_filter = dict(data['filter_attrs'])
+        assert page_filter.pop('ip_address_id') == 2
+        self.positions.append(page_filter)
+        limit = page_filter['limit']
+        if not self.cursor_pages:
+            offset = page_filter['offset']
+            return self.rows[offset:offset + limit]
+        start = page_filter.get('cursor', 0)
+        end = start + limit
+        return {'results': self.rows[start:end], 'cursor': end if end < len(self.rows) else None}
+
+    def ListAll(self, auth, data, headers=None):
+        return self.page(data)
+
+
+class AsyncPagedBackend(PagedBackend):
+    async def ListAll(self, auth, data, headers=None):
+        await asyncio.sleep(0)
+        return self.page(data)
+
+
+def onevsh(client_class, backend):
+    client = client_class('onev_url', 'cob_url', 'plc_url', AUTHORIZATION_CODE)
+    client.share_rpc_apis = False
+    client.rpc_transport = lambda name, url: backend
+    return client
+
+
+@pytest.mark.parametrize('prefetch', [True, False])
+@pytest.mark.parametrize('count, offsets', [
+    (0, [0]),
+    (2, [0]),
+    (3, [0, 3]),
+    (7, [0, 3, 6]),
+])
+def test_offset_page_boundaries(count, offsets, prefetch):
+    backend = PagedBackend(count)
+    rows = list(onevsh(Onevsh, backend).iter_rpc('ListAll', NODES, page_size=3, prefetch=prefetch))
+    assert rows == list(range(count))
+    assert backend.positions == [{'offset': offset, 'limit': 3} for offset in offsets]
+
+
+def test_cursor_pages():
+    backend = PagedBackend(7, cursor_pages=True)
+    assert list(onevsh(Onevsh, backend).iter_rpc('ListAll', NODES, page_size=3)) == list(range(7))
+    assert backend.positions == [{'offset': 0, 'limit': 3}, {'cursor': 3, 'limit': 3}, {'cursor': 6, 'limit': 3}]
+
+
+def test_next_page_is_prefetched_while_the_current_one_is_consumed():
+    backend = PagedBackend(7)
+    rows = onevsh(Onevsh, backend).iter_rpc('ListAll', NODES, page_size=3)
+    assert next(rows) == 0
+    deadline = time.monotonic() + 5
+    while len(backend.positions) < 2:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    assert backend.positions[1] == {'offset': 3, 'limit': 3}
+    rows.close()
+
+    backend = PagedBackend(7)
+    rows = onevsh(Onevsh, backend).iter_rpc('ListAll', NODES, page_size=3, prefetch=False)
+    assert [next(rows) for _ in range(3)] == [0, 1, 2]
+    assert len(backend.positions) == 1
+    rows.close()
+
+
+def test_not_paginated_method_raises():
+    with pytest.raises(ValueError, match='not a paginated method'):
+        next(onevsh(Onevsh, PagedBackend(1)).iter_rpc('Update', {}))
+
+
+def test_async_pages_and_prefetch():
+    async def main():
+        backend = AsyncPagedBackend(7)
+        client = onevsh(AsyncOnevsh, backend)
+        assert [row async for row in client.iter_rpc('ListAll', NODES, page_size=3)] == list(range(7))
+        assert [position['offset'] for position in backend.positions] == [0, 3, 6]
+
+        backend = AsyncPagedBackend(7)
+        rows = onevsh(AsyncOnevsh, backend).iter_rpc('ListAll', NODES, page_size=3)
+        assert await rows.__anext__() == 0
+        await asyncio.sleep(0.01)
+        assert len(backend.positions) == 2
+        await rows.aclose()
+
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+"""macro graphs run on the shared step pool of a Libcdn"""
+import asyncio
+import threading
+
+import pytest
+
+from _do_async_operation import AsyncLibcdn
+from _do_operation import Libcdn
+from macro_dag import client_executors, Input, Macro, MacroStepError, Ref, Step
+from tracing import current_span, ERROR, InMemorySpanExporter, Tracer
+
+
+def libcdn():
+    return Libcdn('contentd', 'amc_url', 'onev_url', 'cob_url', 'plc_url')
+
+
+def thread_name(client):
+    return threading.current_thread().name
+
+
+LOOKUP = Macro('lookup', [
+    Step('prefix', 'get_cdn_prefix', cdn_prefix_id=Input('cdn_prefix_id')),
+    Step('again', 'get_cdn_prefix', cdn_prefix_id=Input('cdn_prefix_id')),
+    Step('nodes', 'listall_node_names', 2),
+    Step('both', lambda client, prefix, nodes: (prefix, nodes), Ref('prefix'), Ref('nodes')),
+], output='both')
+
+
+def test_runs_share_the_client_pool():
+    client = libcdn()
+    first = client.run_macro(LOOKUP, {'cdn_prefix_id': 5})
+    second = client.run_macro(LOOKUP, {'cdn_prefix_id': 5})
+    assert first.result == second.result
+    assert first.result[0] == client.get_cdn_prefix(cdn_prefix_id=5)
+    assert second.report()['memoized'] == 1
+    executor = client_executors[client]
+    assert client.run_macro(Macro('thread', [Step('name', thread_name)])).result['name'].startswith('macro-step')
+    assert client_executors[client] is executor
+
+
+def test_max_workers_bounds_the_steps_of_a_run():
+    running = []
+    peak = []
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def step(client):
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        release.wait(0.05)
+        with lock:
+            running.pop()
+
+    macro = Macro('wide', [Step(f"step{i}", step) for i in range(8)])
+    libcdn().run_macro(macro, max_workers=2)
+    assert max(peak) == 2
+
+
+def test_macro_run_by_a_step_does_not_wait_for_the_pool():
+    client = libcdn()
+    client.macro_workers = 1
+    inner = Macro('inner', [Step('prefix', 'get_cdn_prefix', cdn_prefix_id=1)], output='prefix')
+    outer = Macro('outer', [Step('nested', lambda client: client.run_macro(inner).result)], output='nested')
+    assert client.run_macro(outer).result == client.get_cdn_prefix(cdn_prefix_id=1)
+
+
+def test_failed_step_raises_after_the_running_steps():
+    done = []
+    started = threading.Event()
+
+    def fail(client):
+        started.wait(1)
+        raise ValueError('backend refused')
+
+    def slow(client):
+        started.set()
+        threading.Event().wait(0.05)
+        done.append('slow')
+
+    client = libcdn()
+    with pytest.raises(MacroStepError) as error:
+        client.run_macro(Macro('failing', [Step('fail', fail), Step('slow', slow)]))
+    assert error.value.step == 'fail'
+    assert done == ['slow']
+    assert client.run_macro(LOOKUP, {'cdn_prefix_id': 5}).result
+
+
+def missing_id(result):
+    raise KeyError('object_id')
+
+
+FAILING_TRANSFORM = Macro('transform', [
+    Step('prefix', 'get_cdn_prefix', cdn_prefix_id=5),
+    Step('bind', lambda client, object_id: object_id, Ref('prefix', missing_id)),
+])
+
+
+@pytest.mark.parametrize('client_class', [Libcdn, AsyncLibcdn])
+def test_failing_transform_raises_a_step_error_and_ends_the_span(client_class):
+    client = client_class('contentd', 'amc_url', 'onev_url', 'cob_url', 'plc_url')
+    client.tracer = Tracer(InMemorySpanExporter())
+    with pytest.raises(MacroStepError) as error:
+        if client_class is AsyncLibcdn:
+            asyncio.run(client.run_macro(FAILING_TRANSFORM))
+        else:
+            client.run_macro(FAILING_TRANSFORM)
+    assert error.value.step == 'bind'
+    assert isinstance(error.value.error, KeyError)
+    assert 'prefix' in error.value.run.results
+    macro_span, = [span for span in client.tracer.exporter.spans if span.name == 'macro transform']
+    assert macro_span.status == ERROR
+    assert current_span.get() is None
+
+
+def test_max_workers_bounds_the_tasks_of_an_async_run():
+    running = []
+    peak = []
+
+    async def step(client):
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+
+    macro = Macro('async_wide', [Step(f"step{index}", step) for index in range(8)])
+    client = AsyncLibcdn('contentd', 'amc_url', 'onev_url', 'cob_url', 'plc_url')
+    asyncio.run(client.run_macro(macro, max_workers=3))
+    assert max(peak) == 3 and len(peak) == 8
@@ -0,0 +1,66 @@
+"""payload codecs round trips and LazyPayload"""
+import pytest
+
+from _do_operation import ApiPath, AUTHORIZATION_CODE, Contentd
+from payload_codec import fastest_codec, JsonCodec, LazyPayload, load_orjson, OrjsonCodec
+
+PATH = 'contentd/cdn_prefix/{cdn_prefix_id}'
+PAYLOAD = {'name': 'cdn5.example.com', 'origins': [1, 2.5, None, True], 'labels': {'é': 'ü'}}
+
+
+def codecs():
+    found = [JsonCodec(), JsonCodec(compact=True)]
+    if load_orjson() is not None:
+        found.append(OrjsonCodec())
+    return found
+
+
+@pytest.mark.parametrize('codec', codecs(), ids=lambda codec: codec.name)
+def test_round_trip(codec):
+    encoded = codec.encode(PAYLOAD)
+    assert codec.decode(encoded) == PAYLOAD
+    assert LazyPayload(encoded, codec).value == PAYLOAD
+
+
+def test_compact_json_has_no_spaces():
+    assert JsonCodec(compact=True).encode({'a': [1, 2]}) == '{"a":[1,2]}'
+    assert JsonCodec().encode({'a': [1, 2]}) == '{"a": [1, 2]}'
+
+
+def test_fastest_codec():
+    expected = 'orjson' if load_orjson() is not None else 'json-compact'
+    assert fastest_codec().name == expected
+
+
+class CountingCodec(JsonCodec):
+    def __init__(self):
+        super().__init__()
+        self.decoded = 0
+
+    def decode(self, payload):
+        self.decoded += 1
+        return super().decode(payload)
+
+
+def test_lazy_payload_decodes_once_on_access():
+    codec = CountingCodec()
+    payload = LazyPayload(b'{"a": 1}', codec)
+    assert str(payload) == '{"a": 1}'
+    assert codec.decoded == 0
+    assert payload.value == payload.value == {'a': 1}
+    assert codec.decoded == 1
+
+
+@pytest.mark.parametrize('raw', [b'{"a":1}', bytearray(b'{"a":1}'), memoryview(b'{"a":1}')])
+def test_raw_payloads_are_sent_as_is(raw):
+    client = Contentd('contentd', 'amc_url', AUTHORIZATION_CODE)
+    _, data, endpoint = client._prepare_operation(ApiPath(PATH), cdn_prefix_id=5, data=raw)
+    assert data is raw
+    assert endpoint == 'amc_url/contentd/cdn_prefix/5'
+
+
+def test_client_encodes_with_its_codec():
+    client = Contentd('contentd', 'amc_url', AUTHORIZATION_CODE)
+    client.codec = JsonCodec(compact=True)
+    _, data, _ = client._prepare_operation(ApiPath(PATH), cdn_prefix_id=5, data=PAYLOAD)
+    assert client.codec.decode(data) == PAYLOAD
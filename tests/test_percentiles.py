@@ -0,0 +1,11 @@
+"""nearest rank percentiles"""
+from percentiles import percentile
+
+
+def test_nearest_rank():
+    samples = list(range(1, 101))
+    assert percentile(samples, 0.50) == 50
+    assert percentile(samples, 0.99) == 99
+    assert percentile(samples, 1.0) == 100
+    assert percentile(list(range(1, 11)), 0.90) == 9
+    assert percentile([7], 0.5) == 7
@@ -0,0 +1,174 @@
+"""ResponseCache on the sync and async rest and rpc clients"""
+import asyncio
+import threading
+
+from _do_async_operation import AsyncContentd, AsyncOnevsh
+from _do_operation import AUTHORIZATION_CODE, Contentd, Onevsh, UNAUTHORIZED_RESPONSE
+from response_cache import ResponseCache
+
+NODES = {'object_type': 'IpAddress', 'filter_attrs': {'ip_address_id': 2}}
+UPDATE = {'object_type': 'IpAddress', 'object_id': 2, 'data_attrs': {}}
+
+
+class Backend():
+    """rest and rpc transport counting its reads, each authorized write bumps the version"""
+    def __init__(self):
+        self.version = 0
+        self.reads = 0
+        # set to block the reads until released
+        self.read_started = None
+        self.release_read = None
+
+    def answer(self, auth):
+        if auth != AUTHORIZATION_CODE:
+            return f"{UNAUTHORIZED_RESPONSE}, auth = {auth}"
+        return f"version {self.version}"
+
+    def get(self, auth, data, name, url, headers=None):
+        self.reads += 1
+        response = self.answer(auth)
+        if self.read_started is not None:
+            self.read_started.set()
+            self.release_read.wait(5)
+        return response
+
+    def put(self, auth, data, name, url, headers=None):
+        if auth == AUTHORIZATION_CODE:
+            self.version += 1
+        return self.answer(auth)
+
+    def ListAll(self, auth, data, headers=None):
+        return self.get(auth, data, 'onev', 'onev_url')
+
+    def Update(self, auth, data, headers=None):
+        return self.put(auth, data, 'onev', 'onev_url')
+
+
+class AsyncBackend(Backend):
+    async def get(self, auth, data, name, url, headers=None):
+        self.reads += 1
+        response = self.answer(auth)
+        if self.read_started is not None:
+            self.read_started.set()
+            await self.release_read.wait()
+        return response
+
+    async def put(self, auth, data, name, url, headers=None):
+        return super().put(auth, data, name, url)
+
+    async def ListAll(self, auth, data, headers=None):
+        return await self.get(auth, data, 'onev', 'onev_url')
+
+    async def Update(self, auth, data, headers=None):
+        return await self.put(auth, data, 'onev', 'onev_url')
+
+
+def contentd(client_class, backend):
+    client = client_class('contentd', 'amc_url', AUTHORIZATION_CODE)
+    client.rest_transport = backend
+    client.cache = ResponseCache()
+    return client
+
+
+def onevsh(client_class, backend):
+    client = client_class('onev_url', 'cob_url', 'plc_url', AUTHORIZATION_CODE)
+    client.share_rpc_apis = False
+    client.rpc_transport = lambda name, url: backend
+    client.cache = ResponseCache()
+    return client
+
+
+def test_rest_get_is_cached_until_an_authorized_write():
+    backend = Backend()
+    client = contentd(Contentd, backend)
+    assert client.get_cdn_prefix(cdn_prefix_id=5) == client.get_cdn_prefix(cdn_prefix_id=5) == 'version 0'
+    assert backend.reads == 1
+    assert client.update_cdn_prefix(cdn_prefix_id=5, data={}, auth=0).startswith(UNAUTHORIZED_RESPONSE)
+    assert client.get_cdn_prefix(cdn_prefix_id=5) == 'version 0'
+    assert backend.reads == 1
+    client.update_cdn_prefix(cdn_prefix_id=5, data={})
+    assert client.get_cdn_prefix(cdn_prefix_id=5) == 'version 1'
+    assert backend.reads == 2
+    assert client.cache.stats()['invalidations'] == 1
+
+
+def test_rest_get_in_flight_during_a_write_is_not_stored():
+    backend = Backend()
+    backend.read_started, backend.release_read = threading.Event(), threading.Event()
+    client = contentd(Contentd, backend)
+    reader = threading.Thread(target=client.get_cdn_prefix, kwargs={'cdn_prefix_id': 5})
+    reader.start()
+    assert backend.read_started.wait(5)
+    backend.read_started = None
+    client.update_cdn_prefix(cdn_prefix_id=5, data={})
+    backend.release_read.set()
+    reader.join(5)
+    assert client.get_cdn_prefix(cdn_prefix_id=5) == 'version 1'
+    assert backend.reads == 2
+
+
+def test_rpc_reads_are_cached_until_an_authorized_write():
+    backend = Backend()
+    client = onevsh(Onevsh, backend)
+    assert client.ListAll(NODES) == client.ListAll(NODES) == 'version 0'
+    assert backend.reads == 1
+    client.Update(UPDATE, auth=0)
+    assert client.ListAll(NODES) == 'version 0'
+    client.Update(UPDATE)
+    assert client.ListAll(NODES) == 'version 1'
+    assert backend.reads == 2
+
+
+def test_async_clients_use_the_cache():
+    async def main():
+        backend = AsyncBackend()
+        rest = contentd(AsyncContentd, backend)
+        rpc = onevsh(AsyncOnevsh, backend)
+        assert await rest.get_cdn_prefix(cdn_prefix_id=5) == await rest.get_cdn_prefix(cdn_prefix_id=5)
+        assert await rpc.ListAll(NODES) == await rpc.ListAll(NODES)
+        assert backend.reads == 2
+        await rest.update_cdn_prefix(cdn_prefix_id=5, data={}, auth=0)
+        await rpc.Update(UPDATE, auth=0)
+        assert await rest.get_cdn_prefix(cdn_prefix_id=5) == await rpc.ListAll(NODES) == 'version 0'
+        assert backend.reads == 2
+        await rest.update_cdn_prefix(cdn_prefix_id=5, data={})
+        await rpc.Update(UPDATE)
+        assert await rest.get_cdn_prefix(cdn_prefix_id=5) == await rpc.ListAll(NODES) == 'version 2'
+        assert backend.reads == 4
+
+    asyncio.run(main())
+
+
+def test_async_get_in_flight_during_a_write_is_not_stored():
+    async def main():
+        backend = AsyncBackend()
+        backend.read_started, backend.release_read = asyncio.Event(), asyncio.Event()
+        client = contentd(AsyncContentd, backend)
+        reader = asyncio.ensure_future(client.get_cdn_prefix(cdn_prefix_id=5))
+        await backend.read_started.wait()
+        backend.read_started = None
+        await client.update_cdn_prefix(cdn_prefix_id=5, data={})
+        backend.release_read.set()
+        assert await reader == 'version 0'
+        assert await client.get_cdn_prefix(cdn_prefix_id=5) == 'version 1'
+        assert backend.reads == 2
+
+    asyncio.run(main())
+
+
+def test_store_is_skipped_after_an_invalidation_of_its_group():
+    cache = ResponseCache(max_size=2)
+    generation = cache.generation()
+    cache.invalidate('other')
+    cache.store('a', 1, 'ListAll', 'onev', generation=generation)
+    assert cache.lookup('a')[1]
+    generation = cache.generation()
+    cache.invalidate('onev')
+    cache.store('b', 2, 'ListAll', 'onev', generation=generation)
+    assert cache.lookup('b') == (None, False)
+    # the groups dropped from the bounded invalidation record count as invalidated
+    generation = cache.generation()
+    for group in ('cob', 'plc', 'x'):
+        cache.invalidate(group)
+    cache.store('c', 3, 'ListAll', 'cob', generation=generation)
+    assert cache.lookup('c') == (None, False)
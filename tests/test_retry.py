@@ -0,0 +1,107 @@
+"""retries, circuit breakers and their rate limiter tokens"""
+import asyncio
+
+import pytest
+
+from rate_limit import RateLimitExceeded, TokenBucket
+from retry import (
+    async_call_with_retry,
+    call_with_retry,
+    CircuitBreaker,
+    CircuitOpenError,
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    RetryPolicy,
+)
+
+
+class Clock():
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def failing(error):
+    def request():
+        raise error
+    return request
+
+
+def half_open_breaker(clock):
+    breaker = CircuitBreaker('onev', window=2, min_calls=2, reset_timeout=10, clock=clock)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            call_with_retry(failing(ConnectionError()), (), {}, None, breaker, True)
+    assert breaker.state == OPEN
+    clock.now += 10
+    return breaker
+
+
+def test_retries_idempotent_requests_only():
+    calls = []
+
+    def request():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError()
+        return 'ok'
+
+    policy = RetryPolicy(max_attempts=3, sleep=lambda delay: None)
+    assert call_with_retry(request, (), {}, policy, None, True) == 'ok'
+    calls.clear()
+    with pytest.raises(ConnectionError):
+        call_with_retry(request, (), {}, policy, None, False)
+    assert len(calls) == 1
+
+
+def test_breaker_opens_then_closes_after_a_trial():
+    clock = Clock()
+    breaker = half_open_breaker(clock)
+    assert call_with_retry(lambda: 'ok', (), {}, None, breaker, True) == 'ok'
+    assert breaker.state == CLOSED
+
+
+def test_rate_limited_trial_is_given_back():
+    clock = Clock()
+    breaker = half_open_breaker(clock)
+    limiter = TokenBucket('onev', rate=1, burst=1, max_wait=0, clock=clock, sleep=lambda delay: None)
+    limiter.acquire()
+    with pytest.raises(RateLimitExceeded):
+        call_with_retry(lambda: 'ok', (), {}, None, breaker, True, limiter)
+    assert breaker.state == HALF_OPEN and breaker.trials == 0
+    clock.now += 1
+    assert call_with_retry(lambda: 'ok', (), {}, None, breaker, True, limiter) == 'ok'
+    assert breaker.state == CLOSED
+
+
+def test_async_cancelled_token_wait_gives_the_trial_back():
+    clock = Clock()
+    breaker = half_open_breaker(clock)
+
+    async def request():
+        return 'ok'
+
+    async def main():
+        limiter = TokenBucket('onev', rate=0.1, burst=1)
+        limiter.acquire()
+        call = asyncio.ensure_future(async_call_with_retry(request, (), {}, None, breaker, True, limiter))
+        await asyncio.sleep(0.01)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        assert breaker.trials == 0
+        assert await async_call_with_retry(request, (), {}, None, breaker, True) == 'ok'
+
+    asyncio.run(main())
+    assert breaker.state == CLOSED
+
+
+def test_open_breaker_fails_fast():
+    clock = Clock()
+    breaker = half_open_breaker(clock)
+    clock.now -= 5
+    with pytest.raises(CircuitOpenError):
+        call_with_retry(lambda: 'ok', (), {}, None, breaker, True)
@@ -0,0 +1,79 @@
+"""RpcBatch and AsyncRpcBatch multicalls"""
+import asyncio
+from concurrent.futures import CancelledError
+
+import pytest
+
+from _do_async_operation import AsyncOnevsh
+from _do_operation import AUTHORIZATION_CODE, Onevsh
+from rpc_schema import RpcArgumentError
+
+NODES = {'object_type': 'IpAddress', 'filter_attrs': {'ip_address_id': 2}}
+
+
+def test_positional_and_keyword_data():
+    client = Onevsh('onev_url', 'cob_url', 'plc_url', AUTHORIZATION_CODE)
+    with client.batch() as batch:
+        positional = batch.ListAll(NODES)
+        keyword = batch.ListAll(data=NODES)
+    assert positional.result() == keyword.result() == client.ListAll(NODES)
+    assert batch.request_count == 1
+
+
+def test_queues_are_split_by_api_and_size():
+    client = Onevsh('onev_url', 'cob_url', 'plc_url', AUTHORIZATION_CODE)
+    with client.batch(max_batch_size=2) as batch:
+        for _ in range(3):
+            batch.ListAll(NODES)
+        batch.GetPersons({})
+    assert batch.request_count == 3
+    assert len(batch.results()) == 4
+
+
+def test_invalid_calls_raise_when_queued():
+    client = Onevsh('onev_url', 'cob_url', 'plc_url', AUTHORIZATION_CODE)
+    batch = client.batch()
+    with pytest.raises(RpcArgumentError, match='object_type'):
+        batch.ListAll({'filter_attrs': {}})
+    with pytest.raises(TypeError, match='batch\\(auth=...\\)'):
+        batch.ListAll(NODES, auth=AUTHORIZATION_CODE)
+    with pytest.raises(TypeError):
+        batch.ListAll(NODES, NODES)
+    with pytest.raises(AttributeError):
+        batch.NoSuchMethod
+
+
+def test_batch_auth():
+    client = Onevsh('onev_url', 'cob_url', 'plc_url', AUTHORIZATION_CODE)
+    seen = []
+    multicall = client._do_rpc_multicall
+    client._do_rpc_multicall = lambda api_name, calls, **kwargs: seen.append(kwargs) or multicall(api_name, calls, **kwargs)
+    with client.batch() as batch:
+        batch.ListAll(NODES)
+    with client.batch(auth=AUTHORIZATION_CODE) as batch:
+        batch.ListAll(NODES)
+    assert seen == [{}, {'auth': AUTHORIZATION_CODE}]
+
+
+def test_raising_block_cancels_the_queued_calls():
+    client = Onevsh('onev_url', 'cob_url', 'plc_url', AUTHORIZATION_CODE)
+    with pytest.raises(KeyError):
+        with client.batch() as batch:
+            future = batch.ListAll(NODES)
+            raise KeyError('stop')
+    with pytest.raises(CancelledError):
+        future.result(timeout=1)
+
+
+def test_async_batch():
+    async def main():
+        client = AsyncOnevsh('onev_url', 'cob_url', 'plc_url', AUTHORIZATION_CODE)
+        async with client.batch(max_batch_size=2) as batch:
+            futures = [batch.ListAll(NODES) for _ in range(3)]
+        assert batch.request_count == 2
+        assert [future.result() for future in futures] == [await client.ListAll(NODES)] * 3
+        with pytest.raises(TypeError):
+            with client.batch():
+                pass
+
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""RpcSchemas validation and encoding of the xmlrpc call data"""
+import datetime
+from xmlrpc.client import Binary
+
+import pytest
+
+from _do_operation import AUTHORIZATION_CODE, Onevsh, RpcClient
+from rpc_schema import marshallable, marshalling_error, RpcArgumentError
+
+schemas = RpcClient.rpc_schemas
+
+
+@pytest.mark.parametrize('data, message', [
+    (['IpAddress'], 'onev.ListAll: data must be a dict, got list'),
+    ({'object_type': 'IpAddress', 'filter_attr': {}}, "unknown argument 'filter_attr', did you mean 'filter_attrs'?"),
+    ({'object_type': 'IpAddress', 'zzz': 1}, "unknown argument 'zzz', expected object_type, filter_attrs, return_attrs"),
+    ({'filter_attrs': {}}, "missing argument 'object_type'"),
+    ({'filter_attr': {}}, "unknown argument 'filter_attr'"),
+    ({'object_type': 5}, "argument 'object_type' must be str, got int"),
+    ({'object_type': 'IpAddress', 'return_attrs': 'type'}, "argument 'return_attrs' must be list or tuple, got str"),
+    ({'object_type': 'IpAddress', 'filter_attrs': {'id': 2 ** 31}}, "filter_attrs['id'] = 2147483648 is out of the xmlrpc 32 bits int range"),
+    ({'object_type': 'IpAddress', 'filter_attrs': {1: 'a'}}, "filter_attrs has the int key 1, xmlrpc struct keys are str"),
+    ({'object_type': 'IpAddress', 'return_attrs': ['type', None]}, "return_attrs[1] is None, xmlrpc has no nil"),
+    ({'object_type': 'IpAddress', 'filter_attrs': {'ids': {1, 2}}}, "filter_attrs['ids'] of type set cannot be marshalled"),
+])
+def test_invalid_data_raises(data, message):
+    with pytest.raises(RpcArgumentError, match=message.replace('[', r'\[').replace('?', r'\?')) as error:
+        schemas.encode('ListAll', data)
+    assert error.value.method == 'onev.ListAll'
+
+
+def test_valid_data_is_encoded_in_declaration_order():
+    data = {'return_attrs': ('type',), 'filter_attrs': {'ip_address_id': 2}, 'object_type': 'IpAddress'}
+    encoded = schemas.encode('ListAll', data)
+    assert encoded == data
+    assert list(encoded) == ['object_type', 'filter_attrs', 'return_attrs']
+    assert schemas.encode('ListAll', {'object_type': 'IpAddress'}) == {'object_type': 'IpAddress'}
+
+
+def test_trusted_schemas_only_encode():
+    trusted = schemas.as_trusted()
+    assert trusted.schemas is schemas.schemas
+    assert trusted.encode('ListAll', {'filter_attrs': {1: None}, 'unknown': 1}) == {'filter_attrs': {1: None}}
+
+
+@pytest.mark.parametrize('value', [
+    'a', 1, -2 ** 31, 2 ** 31 - 1, 1.5, True, b'raw', [1, ('a', {'b': [2.0]})],
+    datetime.datetime(2024, 1, 1), Binary(b'raw'),
+])
+def test_marshallable(value):
+    assert marshallable(value)
+    assert marshalling_error(value, 'value') is None
+
+
+@pytest.mark.parametrize('value', [None, 2 ** 31, [1, None], {'a': {'b': 2 ** 40}}, {3: 'a'}, object()])
+def test_not_marshallable(value):
+    assert not marshallable(value)
+    assert marshalling_error(value, 'value') is not None
+
+
+def test_invalid_call_raises_before_any_round_trip():
+    client = Onevsh('onev_url', 'cob_url', 'plc_url', AUTHORIZATION_CODE)
+    sent = []
+    client.share_rpc_apis = False
+    client.rpc_transport = lambda name, url: type('Api', (), {'ListAll': lambda self, auth, data: sent.append(data)})()
+    with pytest.raises(RpcArgumentError):
+        client.ListAll({'object_type': 'IpAddress', 'filter_attrs': [1]})
+    with pytest.raises(RpcArgumentError, match="missing argument 'object_type'"):
+        client.ListAll()
+    assert sent == []
+    client.ListAll({'return_attrs': ['type'], 'object_type': 'IpAddress'})
+    client.ListAll(data={'object_type': 'IpAddress'})
+    assert sent == [{'object_type': 'IpAddress', 'return_attrs': ['type']}, {'object_type': 'IpAddress'}]
+    assert list(sent[0]) == ['object_type', 'return_attrs']
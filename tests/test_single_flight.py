@@ -0,0 +1,136 @@
+"""SingleFlight and AsyncSingleFlight coalescing"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from single_flight import AsyncSingleFlight, SingleFlight
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def run_callers(flight, function, count):
+    outcomes = []
+
+    def caller():
+        try:
+            outcomes.append(flight.do('key', function))
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=caller) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    threads, outcomes = run_callers(flight, fetch, 4)
+    wait_for(lambda: flight.stats()['followers'] == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert outcomes == ['result'] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {'leaders': 1, 'followers': 3, 'in_flight': 0}
+    # the key is free again once the call returned
+    assert flight.do('key', lambda: 'next') == 'next'
+
+
+def test_error_reaches_every_caller():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        raise KeyError('backend')
+
+    threads, outcomes = run_callers(flight, fetch, 3)
+    wait_for(lambda: flight.stats()['followers'] == 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(outcomes) == 3 and all(isinstance(outcome, KeyError) for outcome in outcomes)
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_async_concurrent_calls_share_one_result_or_error():
+    async def main():
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def fetch(result):
+            calls.append(result)
+            await asyncio.sleep(0.01)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        results = await asyncio.gather(*[flight.do('key', fetch, 'result') for _ in range(4)])
+        assert results == ['result'] * 4
+        errors = await asyncio.gather(*[flight.do('key', fetch, KeyError('x')) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(error, KeyError) for error in errors)
+        assert len(calls) == 2
+        assert flight.stats() == {'leaders': 2, 'followers': 5, 'in_flight': 0}
+
+    asyncio.run(main())
+
+
+def test_async_cancelled_leader_does_not_cancel_the_followers():
+    async def main():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return 'result'
+
+        leader = asyncio.ensure_future(flight.do('key', fetch))
+        follower = asyncio.ensure_future(flight.do('key', fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await follower == 'result'
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(main())
+
+
+def test_async_call_is_cancelled_when_every_caller_gave_up():
+    async def main():
+        flight = AsyncSingleFlight()
+        cancelled = asyncio.Event()
+
+        async def fetch():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.ensure_future(flight.do('key', fetch)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 5)
+        await asyncio.sleep(0)
+        assert flight.stats()['in_flight'] == 0
+
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+"""spans of the macros and backend calls, and their traceparent headers"""
+import asyncio
+
+import pytest
+
+from _do_async_operation import AsyncLibcdn
+from _do_operation import AUTHORIZATION_CODE, Contentd, Libcdn, RestRequest
+from http_transport import HttpSession
+from standin_servers import RestStandin, RestStandinHandler
+from tracing import CLIENT, ERROR, extract, inject, InMemorySpanExporter, INTERNAL, OK, TRACEPARENT, Tracer
+
+REST_SPAN = 'contentd get contentd/cdn_prefix/{cdn_prefix_id}'
+
+
+def traced_libcdn(client_class=Libcdn):
+    client = client_class('contentd', 'amc_url', 'onev_url', 'cob_url', 'plc_url')
+    client.tracer = Tracer(InMemorySpanExporter())
+    return client
+
+
+def by_name(spans):
+    return {span.name: span for span in spans}
+
+
+class HeadersRestRequest(RestRequest):
+    """RestRequest keeping the headers of every request"""
+    sent = []
+
+    @staticmethod
+    def get(auth, data, name, url, headers=None):
+        HeadersRestRequest.sent.append(headers)
+        return RestRequest.get(auth, data, name, url)
+
+
+def test_macro_span_is_parent_of_backend_spans():
+    client = traced_libcdn()
+    client.macro1()
+    spans = by_name(client.tracer.exporter.spans)
+    assert set(spans) == {'Libcdn.macro1', REST_SPAN, 'onev.ListAll'}
+    macro = spans['Libcdn.macro1']
+    assert macro.parent_id is None and macro.kind == INTERNAL
+    assert client.tracer.exporter.children(macro) == [spans[REST_SPAN], spans['onev.ListAll']]
+    for name in (REST_SPAN, 'onev.ListAll'):
+        assert spans[name].kind == CLIENT
+        assert spans[name].trace_id == macro.trace_id
+        assert spans[name].status == OK
+
+
+def test_async_macro_spans_across_tasks():
+    client = traced_libcdn(AsyncLibcdn)
+    asyncio.run(client.macro1())
+    spans = by_name(client.tracer.exporter.spans)
+    macro = spans['AsyncLibcdn.macro1']
+    assert {span.name for span in client.tracer.exporter.children(macro)} == {REST_SPAN, 'onev.ListAll'}
+
+
+def test_rest_request_carries_traceparent_of_its_span():
+    HeadersRestRequest.sent = []
+    client = traced_libcdn()
+    client.rest_transport = HeadersRestRequest
+    client.get_cdn_prefix(cdn_prefix_id=5)
+    (span,) = client.tracer.exporter.spans
+    (headers,) = HeadersRestRequest.sent
+    assert headers[TRACEPARENT] == span.traceparent
+    assert extract(headers) == (span.trace_id, span.span_id)
+
+
+def test_traceparent_header_over_http():
+    class TraceparentHandler(RestStandinHandler):
+        def parse_request(self):
+            parsed = super().parse_request()
+            if parsed:
+                self.server.traceparents.append(self.headers.get(TRACEPARENT))
+            return parsed
+
+    server = RestStandin(handler=TraceparentHandler).start()
+    server.traceparents = []
+    server.state.seed(1)
+    client = Contentd('contentd', server.url, AUTHORIZATION_CODE)
+    client.rest_transport = HttpSession()
+    client.tracer = Tracer(InMemorySpanExporter())
+    try:
+        with client.tracer.start_span('request') as root:
+            client.get_cdn_prefix(cdn_prefix_id=1)
+    finally:
+        client.rest_transport.close()
+        server.stop()
+    call = by_name(client.tracer.exporter.spans)[REST_SPAN]
+    assert call.parent_id == root.span_id
+    assert server.traceparents == [call.traceparent]
+
+
+def test_failed_call_span_records_the_exception():
+    class FailingRestRequest(RestRequest):
+        @staticmethod
+        def get(auth, data, name, url, headers=None):
+            raise ConnectionError('backend down')
+
+    client = traced_libcdn()
+    client.rest_transport = FailingRestRequest
+    with pytest.raises(ConnectionError):
+        client.macro1()
+    spans = by_name(client.tracer.exporter.spans)
+    for name in (REST_SPAN, 'Libcdn.macro1'):
+        assert spans[name].status == ERROR
+        assert spans[name].events[0]['attributes']['exception.type'] == 'ConnectionError'
+
+
+def test_no_tracer_no_header():
+    HeadersRestRequest.sent = []
+    client = Libcdn('contentd', 'amc_url', 'onev_url', 'cob_url', 'plc_url')
+    client.rest_transport = HeadersRestRequest
+    client.get_cdn_prefix(cdn_prefix_id=5)
+    assert HeadersRestRequest.sent == [None]
+    assert inject({'a': 'b'}) == {'a': 'b'}
+
+
+def test_remote_parent_from_extracted_header():
+    tracer = Tracer(InMemorySpanExporter())
+    with tracer.start_span('client') as client_span:
+        headers = inject()
+    with tracer.start_span('server', parent=extract(headers)) as server_span:
+        pass
+    assert server_span.trace_id == client_span.trace_id
+    assert server_span.parent_id == client_span.span_id
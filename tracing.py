@@ -0,0 +1,192 @@
+"""
+trace spans of the macros and of their backend calls
+use:
+    libcdn.tracer = Tracer(InMemorySpanExporter())
+    libcdn.macro1()
+    libcdn.tracer.exporter.spans   # macro1 span, parent of its get_cdn_prefix and ListAll spans
+the span model follows opentelemetry: trace and span ids, parent span id, kind,
+attributes, ns timestamps, status and exception events. The current span is a
+contextvar, so that the children of a span are found across calls, threads
+started with a copied context and asyncio tasks. The outgoing requests carry
+the current span as a w3c traceparent header
+the clients tracer is None by default: no span at all
+"""
+import contextvars
+from random import getrandbits
+import time
+
+TRACEPARENT = 'traceparent'
+# span kinds
+CLIENT = 'client'
+INTERNAL = 'internal'
+# span status
+UNSET = 'unset'
+OK = 'ok'
+ERROR = 'error'
+
+current_span = contextvars.ContextVar('current_span', default=None)
+
+
+def inject(headers=None):
+    """
+    :return: headers with the traceparent of the current span, headers as is without current span
+    """
+    span = current_span.get()
+    if span is None:
+        return headers
+    return {**headers, TRACEPARENT: span.traceparent} if headers else {TRACEPARENT: span.traceparent}
+
+
+def extract(headers):
+    """
+    :return: (trace_id, span_id) int of a traceparent header, None if missing or invalid
+    """
+    value = (headers or {}).get(TRACEPARENT)
+    if not value:
+        return None
+    try:
+        _, trace_id, span_id, _ = value.split('-')
+        return int(trace_id, 16), int(span_id, 16)
+    except ValueError:
+        return None
+
+
+class Span():
+    """
+    started by Tracer.start_span, ended once by end()
+    """
+    __slots__ = (
+        'tracer', 'name', 'kind', 'trace_id', 'span_id', 'parent_id', 'attributes',
+        'events', 'status', 'status_message', 'start_time', 'end_time', 'token',
+    )
+
+    def __init__(self, tracer, name, kind, trace_id, parent_id, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = getrandbits(64)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.events = []
+        self.status = UNSET
+        self.status_message = None
+        self.start_time = time.time_ns()
+        self.end_time = None
+        self.token = None
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id:032x}-{self.span_id:016x}-01"
+
+    @property
+    def duration(self):
+        """:return: span duration in seconds, None while not ended"""
+        return None if self.end_time is None else (self.end_time - self.start_time) / 1e9
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+    def record_exception(self, error):
+        self.events.append({
+            'name': 'exception',
+            'time': time.time_ns(),
+            'attributes': {'exception.type': type(error).__name__, 'exception.message': str(error)},
+        })
+        self.status = ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def end(self, error=None):
+        """
+        :param error: exception ending the span, recorded with an error status
+        a current span is detached, the span is then exported
+        """
+        if self.end_time is not None:
+            return
+        if error is not None:
+            self.record_exception(error)
+        elif self.status == UNSET:
+            self.status = OK
+        self.end_time = time.time_ns()
+        if self.token is not None:
+            current_span.reset(self.token)
+            self.token = None
+        self.tracer.export(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end(exc_value)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'kind': self.kind,
+            'trace_id': f"{self.trace_id:032x}",
+            'span_id': f"{self.span_id:016x}",
+            'parent_id': None if self.parent_id is None else f"{self.parent_id:016x}",
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'attributes': dict(self.attributes),
+            'events': list(self.events),
+            'status': self.status,
+            'status_message': self.status_message,
+        }
+
+    def __repr__(self):
+        return f"Span({self.name!r}, trace_id={self.trace_id:032x}, span_id={self.span_id:016x})"
+
+
+class Tracer():
+    """
+    :param exporter: object with export(span), called when a span ends
+    """
+    def __init__(self, exporter=None):
+        self.exporter = exporter
+
+    def start_span(self, name, kind=INTERNAL, attributes=None, parent=None, activate=True):
+        """
+        :param parent: parent Span, or (trace_id, span_id) of a remote parent, default the current span
+        :param activate: make the span the current span until it ends, the span
+            must then be ended in the thread or task that started it
+        :return: Span, to end(), or to use as a context manager
+        """
+        if parent is None:
+            parent = current_span.get()
+        if parent is None:
+            trace_id, parent_id = getrandbits(128), None
+        elif isinstance(parent, Span):
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            trace_id, parent_id = parent
+        span = Span(self, name, kind, trace_id, parent_id, dict(attributes or {}))
+        if activate:
+            span.token = current_span.set(span)
+        return span
+
+    def export(self, span):
+        if self.exporter is not None:
+            self.exporter.export(span)
+
+
+class InMemorySpanExporter():
+    """
+    keep the ended spans in memory, for tests and benchmarks
+    """
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        # list.append is thread safe
+        self.spans.append(span)
+
+    def trace(self, trace_id):
+        """:return: ended spans of a trace, in end order"""
+        return [span for span in self.spans if span.trace_id == trace_id]
+
+    def children(self, span):
+        return [child for child in self.spans if child.parent_id == span.span_id]
+
+    def clear(self):
+        self.spans = []